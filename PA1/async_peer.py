@@ -0,0 +1,97 @@
+# async_peer.py
+import asyncio
+
+from peer import Peer, ACCEPT_PICKLE
+from utils.codec import decode
+
+
+class PeerProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol that feeds received messages into a peer's handlers."""
+
+    def __init__(self, peer):
+        self.peer = peer
+
+    def connection_made(self, transport):
+        self.peer.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            message = decode(data, ACCEPT_PICKLE)
+        except ValueError as e:
+            self.peer.log.warning('bad_datagram', "Dropping undecodable datagram from {addr}: {error}", addr=addr, error=str(e))
+            self.peer.metrics.incr('dropped', 'undecodable')
+            return
+        self.peer.dispatch_message(message, addr)
+
+    def error_received(self, exc):
+        self.peer.log.error('socket_error', "Socket error: {error}", error=str(exc))
+
+
+class AsyncPeer(Peer):
+    """
+    A Peer driven by an asyncio event loop instead of a listener thread.
+    All AsyncPeers of a simulation share one loop, so a run with hundreds of
+    peers uses one thread. The message handlers are the ones from Peer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.transport = None
+
+    async def start(self):
+        """Register the peer's socket with the running event loop."""
+        self.log.info('start', "Peer {peer} ({role}) with item {item} listening on port {port}...",
+                      peer=self.peer_id, role=self.role, item=self.item, port=self.port)
+        self.loop = asyncio.get_running_loop()
+        self.socket.setblocking(False)
+        await self.loop.create_datagram_endpoint(lambda: PeerProtocol(self), sock=self.socket)
+        self.advertise_routing_index()
+
+    def start_peer(self):
+        raise RuntimeError("AsyncPeer is started with 'await peer.start()' inside an event loop")
+
+    def schedule_timeout(self, delay, callback, *args):
+        # Timeouts run on the peers' event loop, like every handler
+        return self.loop.call_later(delay, callback, *args)
+
+    def spawn(self, target, *args):
+        self.loop.call_soon(target, *args)
+
+    def transmit(self, data, addr):
+        self.transport.sendto(data, addr)
+
+    def shutdown_peer(self):
+        """Shutdown the peer."""
+        self.log.info('shutdown', "Shutting down peer.")
+        self.running = False
+        self.cancel_pending_requests()
+        if self.transport is not None:
+            self.transport.close()
+        else:
+            self.socket.close()
+
+
+async def run_peers(peers, lookups, poll_interval=1.0):
+    """
+    Run a whole simulation on the current event loop.
+    lookups is a list of (buyer, product_name, hopcount) to start with. Returns once
+    every buyer has shut down, after closing the remaining peers.
+    """
+    for peer in peers:
+        await peer.start()
+
+    buyers = [buyer for buyer, _, _ in lookups]
+    for buyer, product_name, hopcount in lookups:
+        buyer.spawn(buyer.lookup_item, product_name, hopcount)
+
+    while any(buyer.running for buyer in buyers):
+        await asyncio.sleep(poll_interval)
+
+    print("All buyers have shut down. Shutting down sellers and exiting program.")
+    for peer in peers:
+        if peer.running:
+            peer.running = False
+            peer.transport.close()
+    # Give the transports one loop iteration to finish closing
+    await asyncio.sleep(0)
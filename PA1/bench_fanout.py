@@ -0,0 +1,149 @@
+# bench_fanout.py
+"""
+Cost of forwarding one flooded lookup, per forward.
+
+'per neighbor' is how handle_lookup forwarded before Peer.forward_lookup: a
+LookupMessage built, its search path copied and the result encoded for every
+neighbor. 'fan-out' is Peer.forward_lookup: one message, encoded once, and the
+same buffer sent to every neighbor.
+
+For each case the benchmark reports:
+- CPU time per forward (time.process_time over many forwards);
+- encodes and bytes encoded per forward;
+- bytes held per forward while the datagrams are in flight, measured with
+  tracemalloc while the sink keeps every buffer sent, as the simulator's
+  network and the asyncio send queues do until delivery.
+
+Usage: python bench_fanout.py [--neighbors 3,8,32] [--hops 4] [--forwards 20000] [--wire binary|pickle]
+"""
+import argparse
+import hashlib
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import peer as peer_module
+from peer import Peer
+from utils.codec import encode
+from utils.messages import LookupMessage
+
+
+class BenchPeer(Peer):
+    """A Peer without a socket whose datagrams go to a sink."""
+
+    def __init__(self, *args, **kwargs):
+        self.sent = []
+        self.keep = False  # Keep the sent buffers, as a network does while they are in flight
+        super().__init__(*args, **kwargs)
+
+    def open_socket(self):
+        return None
+
+    def transmit(self, data, addr):
+        if self.keep:
+            self.sent.append(data)
+
+
+def forward_per_neighbor(peer, message, hop_count, search_path):
+    """handle_lookup's forwarding before the fan-out path: a message built and encoded for each neighbor."""
+    for neighbor in peer.lookup_targets(message['product_name'], hop_count):
+        if neighbor.peer_id != message.get('last_peer_id', -1):
+            lookup_message = LookupMessage(
+                message['request_id'],
+                message['buyer_id'],
+                message['product_name'],
+                hop_count,
+                search_path.copy()
+            ).to_dict()
+            lookup_message['last_peer_id'] = peer.peer_id
+            if 'stale_seller_id' in message:
+                lookup_message['stale_seller_id'] = message['stale_seller_id']
+            peer.log.debug('forward', "Forwarding lookup for {product} to Peer {neighbor}", product=message['product_name'], neighbor=neighbor.peer_id)
+            peer.send_message((neighbor.ip_address, neighbor.port), lookup_message)
+            peer.metrics.incr('forwarded', 'lookup')
+
+
+def fan_out(peer, message, hop_count, search_path):
+    peer.forward_lookup(message, hop_count, search_path)
+
+
+STRATEGIES = (('per neighbor', forward_per_neighbor), ('fan-out', fan_out))
+
+
+def make_case(neighbors, hops):
+    """A forwarding peer with neighbors neighbors, and a lookup that has come hops hops from its buyer."""
+    peer = BenchPeer(peer_id=0, role='buyer', neighbors=[], port=5000)
+    peer.neighbors = [SimpleNamespace(peer_id=i, ip_address='127.0.0.1', port=5000 + i) for i in range(1, neighbors + 1)]
+    search_path = [(1000 + i, '127.0.0.1', 6000 + i) for i in range(hops)] + [(0, '127.0.0.1', 5000)]
+    message = {
+        'type': 'lookup',
+        'request_id': hashlib.sha256(b'bench').hexdigest(),
+        'buyer_id': 1000,
+        'product_name': 'fish',
+        'hop_count': 3,
+        'search_path': search_path,
+        'last_peer_id': 999,  # Not a neighbor: the lookup goes to all of them
+    }
+    return peer, message
+
+
+def measure(forward, neighbors, hops, forwards):
+    peer, message = make_case(neighbors, hops)
+    search_path = message['search_path']
+
+    encoded = [0, 0]  # encodes, bytes
+
+    def counting_encode(message, wire_format='binary'):
+        data = encode(message, wire_format)
+        encoded[0] += 1
+        encoded[1] += len(data)
+        return data
+
+    forward(peer, message, 2, search_path)  # Warm up
+    started = time.process_time()
+    for _ in range(forwards):
+        forward(peer, message, 2, search_path)
+    cpu = (time.process_time() - started) / forwards
+
+    peer_module.encode = counting_encode
+    try:
+        forward(peer, message, 2, search_path)
+    finally:
+        peer_module.encode = encode
+
+    rounds = min(forwards, 1000)
+    peer.keep = True
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(rounds):
+            forward(peer, message, 2, search_path)
+        held = (tracemalloc.get_traced_memory()[0] - before) / rounds
+    finally:
+        tracemalloc.stop()
+        peer.sent.clear()
+    return {'cpu_us': cpu * 1e6, 'encodes': encoded[0], 'bytes': encoded[1], 'held': held}
+
+
+def main(neighbor_counts, hops, forwards, wire_format):
+    peer_module.WIRE_FORMAT = wire_format
+    print(f"Forwarding one lookup ({wire_format}, search path of {hops + 1} peers), {forwards} forwards per case")
+    print(f"{'neighbors':>9}  {'path':<12} {'CPU us':>9} {'encodes':>8} {'bytes encoded':>14} {'bytes in flight':>16}")
+    for neighbors in neighbor_counts:
+        results = {}
+        for name, forward in STRATEGIES:
+            result = results[name] = measure(forward, neighbors, hops, forwards)
+            print(f"{neighbors:>9}  {name:<12} {result['cpu_us']:9.2f} {result['encodes']:8} {result['bytes']:14} {result['held']:16.0f}")
+        before, after = results['per neighbor'], results['fan-out']
+        speedup = before['cpu_us'] / after['cpu_us'] if after['cpu_us'] else float('inf')
+        print(f"{'':>9}  fan-out is {speedup:.1f}x faster and holds {before['held'] - after['held']:.0f} fewer bytes per forward")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-forward cost of flooding a lookup, per neighbor against fan-out")
+    parser.add_argument('--neighbors', default='3,8,32', help="comma-separated neighbor counts")
+    parser.add_argument('--hops', type=int, default=4, help="hops the lookup has already travelled (search path length)")
+    parser.add_argument('--forwards', type=int, default=20000)
+    parser.add_argument('--wire', choices=('binary', 'pickle'), default='binary')
+    args = parser.parse_args()
+    main([int(n) for n in args.neighbors.split(',')], args.hops, args.forwards, args.wire)
@@ -0,0 +1,157 @@
+# churn.py
+"""
+Peers joining and leaving a running network.
+
+Churn keeps the overlay in a utils.topology.Overlay, which repairs it around
+every join and leave so it stays connected within TOPOLOGY_MAX_DEGREE, and
+follows it with a utils.network_utils.LandmarkMetrics, which updates the
+diameter estimate from the edges that changed instead of recomputing all
+pairs. Only the peers whose neighbors changed are rewired, and every peer's hop
+budget follows the estimate (diameter - 1, as main.py sets it). Random leaves
+spare the last seller of each item, whose buyers would otherwise time out for
+the rest of the run.
+
+Events run on a scheduler with call_later(delay, callback, *args): the shared
+timer thread for live peers, the Simulator in simulation.py.
+"""
+import random
+import threading
+from collections import Counter
+
+import config
+from utils.log import Logger
+from utils.network_utils import LandmarkMetrics
+from utils.topology import Overlay
+
+CHURN_INTERVAL = config.CHURN_INTERVAL
+CHURN_JOIN_PROBABILITY = config.CHURN_JOIN_PROBABILITY
+TOPOLOGY_MAX_DEGREE = config.TOPOLOGY_MAX_DEGREE
+MIN_PEERS = 2  # Leaves stop here, so there is always a network to join
+
+
+class Churn:
+    def __init__(self, peers, adjacency, make_peer, scheduler, items, interval=CHURN_INTERVAL,
+                 join_probability=CHURN_JOIN_PROBABILITY, max_degree=TOPOLOGY_MAX_DEGREE):
+        """
+        peers are the running peers, connected as in adjacency; make_peer(peer_id, role, item)
+        creates a joining peer, which Churn connects and starts.
+        """
+        self.peers = {peer.peer_id: peer for peer in peers}
+        self.overlay = Overlay(adjacency, max_degree)
+        self.metrics = LandmarkMetrics(self.overlay.adjacency)
+        self.overlay.listeners.append(self.metrics)
+        self.make_peer = make_peer
+        self.scheduler = scheduler
+        self.items = items
+        self.interval = interval
+        self.join_probability = join_probability
+        self.next_id = max(self.peers) + 1
+        first = next(iter(self.peers.values()))
+        self.hop_count = first.hop_count
+        self.log = Logger('churn', clock=first.now)  # Virtual time in simulation.py, like the peers
+        self.joins = 0
+        self.leaves = 0
+        self.sellers_spared = 0  # Random leaves that drew the last seller of an item and picked another peer
+        self.running = False
+        self.timer = None
+        self.lock = threading.Lock()  # step() runs on the scheduler's thread
+
+    def start(self):
+        self.running = True
+        self.timer = self.scheduler.call_later(self.interval, self.step)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            if self.timer is not None:
+                self.timer.cancel()
+
+    def step(self):
+        """One join or leave, then the next one an interval later."""
+        with self.lock:
+            if not self.running:
+                return
+            if random.random() < self.join_probability or len(self.overlay) <= MIN_PEERS:
+                self.join()
+            elif self.leave() is None:
+                # Every peer is the last seller of its item: grow instead
+                self.join()
+            self.timer = self.scheduler.call_later(self.interval, self.step)
+
+    def join(self, role=None, item=None):
+        """Add a peer (of a random role, as in main.py, unless given), connect it and start it. Buyers start buying."""
+        peer_id = self.next_id
+        self.next_id += 1
+        role = role or random.choice(('buyer', 'seller'))
+        if role == 'seller' and item is None:
+            item = random.choice(self.items)
+        peer = self.make_peer(peer_id, role, item)
+        peer.max_distance = peer.hop_count = self.hop_count
+        self.peers[peer_id] = peer
+        self.rewire(self.overlay.join(peer_id))
+        peer.start_peer()
+        self.joins += 1
+        self.log.info('join', "Peer {peer} ({role}) joined, connected to peers {neighbors}",
+                      peer=peer_id, role=role, neighbors=[n.peer_id for n in peer.neighbors])
+        self.adapt_hop_budget()
+        if role == 'buyer':
+            peer.spawn(peer.lookup_item, random.choice(self.items), self.hop_count)
+        return peer
+
+    def leave(self, peer_id=None):
+        """
+        Shut down a peer (a random one unless given) and repair the overlay around it.
+        Returns the peer, or None if no peer may leave at random.
+        """
+        if peer_id is None:
+            peer_id = self.pick_leaver()
+            if peer_id is None:
+                return None
+        peer = self.peers.pop(peer_id)
+        changed = self.overlay.leave(peer_id)
+        if peer.running:
+            peer.shutdown_peer()
+        self.rewire(changed)
+        self.leaves += 1
+        self.log.info('leave', "Peer {peer} ({role}) left, rewired peers {rewired}", peer=peer_id, role=peer.role, rewired=sorted(changed))
+        self.adapt_hop_budget()
+        return peer
+
+    def pick_leaver(self):
+        """A random peer that is not the last seller of its item, or None if every peer is."""
+        peer_id = self.overlay.random_peer()
+        if not self.last_seller(self.peers[peer_id]):
+            return peer_id
+        self.sellers_spared += 1
+        # Rare: count the sellers once rather than redrawing
+        sellers = Counter(peer.item for peer in self.peers.values() if peer.role == 'seller')
+        candidates = [i for i, peer in self.peers.items() if peer.role != 'seller' or sellers[peer.item] > 1]
+        return self.overlay.rng.choice(candidates) if candidates else None
+
+    def last_seller(self, peer):
+        """Whether peer is the only seller of its item. Sellers switch items as they sell out, so this is checked live."""
+        return peer.role == 'seller' and not any(
+            other is not peer and other.role == 'seller' and other.item == peer.item for other in self.peers.values())
+
+    def rewire(self, peer_ids):
+        for peer_id in peer_ids:
+            self.peers[peer_id].set_neighbors([self.peers[n] for n in self.overlay.adjacency[peer_id]])
+
+    def adapt_hop_budget(self):
+        """Move every peer's hop budget to diameter - 1 when the diameter estimate changes."""
+        diameter = self.metrics.diameter()
+        if diameter == float('inf'):
+            return
+        hop_count = max(1, diameter - 1)
+        if hop_count != self.hop_count:
+            self.log.info('hop_budget', "Network diameter is now about {diameter}. Hop budget {old} -> {new}",
+                          diameter=diameter, old=self.hop_count, new=hop_count)
+            self.hop_count = hop_count
+            for peer in self.peers.values():
+                peer.max_distance = peer.hop_count = hop_count
+
+    def summary(self):
+        lower, upper = self.metrics.diameter_bounds()
+        connected = "connected" if self.metrics.connected() else "disconnected"
+        return (f"Churn: {self.joins} joins, {self.leaves} leaves ({self.sellers_spared} last sellers spared), "
+                f"{len(self.overlay)} peers, {connected}, diameter {lower} (at most {upper}), hop budget {self.hop_count}")
@@ -10,6 +10,8 @@ from datetime import datetime
 
 from peer import Peer
 from utils.network_utils import graph_diameter
+from utils.topology import ring_random, attach
+from utils.histogram import LatencyHistogram, PERCENTILES
 
 
 def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight modification from the main.py code
@@ -51,16 +53,8 @@ def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight mo
                 else:
                     sellers.append(peer)
 
-            # Connect peers randomly within min and max neighbors
-            for peer in peers:
-                possible_neighbors = [p for p in peers if p.peer_id != peer.peer_id and p not in peer.neighbors]
-                num_connections = random.randint(min_neighbors, max_neighbors)
-                num_connections = min(num_connections, len(possible_neighbors))
-                neighbors = random.sample(possible_neighbors, num_connections)
-                peer.neighbors.extend(neighbors)
-                for neighbor in neighbors:
-                    if peer not in neighbor.neighbors:
-                        neighbor.neighbors.append(peer)
+            # Connect peers randomly within min and max neighbors, in one connected network
+            attach(peers, ring_random(N, max_neighbors, min_degree=min_neighbors))
 
             # Start the peers to listen for messages
             for peer in peers:
@@ -78,6 +72,7 @@ def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight mo
 
             # Initialize RTT list for this trial
             individual_rtts = []
+            latency = LatencyHistogram()
 
             # Have every buyer initiate a lookup
             if buyers:
@@ -114,6 +109,8 @@ def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight mo
                 for buyer in buyers:
                     trial_rtts.append(buyer.average_rtt)
                     print(f"Buyer {buyer.peer_id} average RTT: {buyer.average_rtt:.4f} seconds")
+                latency = LatencyHistogram.merged(buyer.latency for buyer in buyers)
+                print(f"Transaction latency: {latency.summary()}")
 
                 # Reset the average RTT for the next trial
                 for buyer in buyers:
@@ -121,11 +118,15 @@ def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight mo
 
             # Compute the overall average RTT for this trial
             average_rtt_trial = sum(trial_rtts) / len(trial_rtts) if trial_rtts else 0
-            results.append({
+            result = {
                 'buyer_count': buyer_count,
                 'trial': trial,
                 'average_rtt': average_rtt_trial
-            })
+            }
+            # Tail latency of this trial's transactions, in seconds
+            for p, value in latency.percentiles().items():
+                result[f'p{p:g}'] = value / 1e9 if value is not None else None
+            results.append(result)
 
             # Wait before starting the next trial to ensure clean setup
             time.sleep(2)
@@ -140,7 +141,7 @@ def main(N, min_neighbors, max_neighbors, num_trials, buyer_counts): # Slight mo
     # After all buyer_counts and trials, save results and plot
     # Save to CSV
     with open('rtt_results.csv', 'w', newline='') as csvfile:
-        fieldnames = ['buyer_count', 'trial', 'average_rtt']
+        fieldnames = ['buyer_count', 'trial', 'average_rtt'] + [f'p{p:g}' for p in PERCENTILES]
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
         writer.writeheader()
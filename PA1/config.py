@@ -4,3 +4,77 @@ SELLER_STOCK = 5     # Each seller starts with 5 items
 MAX_TRANSACTIONS = 1000  # NUMBER OF TRANSACTIONS A BUYER CAN DO BEFORE IT SHUTSDOWN
 TIMEOUT = 0.1  #S
 
+
+WIRE_FORMAT = 'binary'  # 'binary' (utils/codec.py) or 'pickle'
+ACCEPT_PICKLE = False  # Also decode pickled datagrams (fallback format; anyone who can reach a peer's port could run code, so only on trusted networks)
+
+ROUTING_MODE = 'path'  # 'path' (lookups carry the full search_path) or 'reverse' (per-peer reverse-path tables)
+ROUTE_TABLE_SIZE = 4096  # Max request_id -> previous hop entries per peer in 'reverse' mode
+ROUTE_TTL = 2.0  # S, how long a reverse-path entry stays valid
+REPLY_MODE = 'path'  # 'path' (replies retrace the lookup hop by hop) or 'direct' (the seller replies straight to the buyer; relaying only when the buyer's address is unknown)
+REPLY_NOTIFY_PATH = False  # REPLY_MODE 'direct': also relay the reply along the path, for the relays' query-hit caches and in case the direct one is lost
+
+SEEN_FILTER = 'lru'  # Duplicate lookup suppression: 'lru' (exact, LRU with TTL) or 'bloom' (rotating Bloom filter)
+SEEN_FILTER_CAPACITY = 4096  # Request ids remembered per peer (per Bloom slice for 'bloom')
+SEEN_FILTER_TTL = 10.0  # S, how long a request id is remembered
+BLOOM_ERROR_RATE = 0.001  # Target false-positive rate per Bloom slice
+
+SELLER_CACHE = True  # Buyers remember which seller sold them a product and buy from it directly next time
+SELLER_CACHE_TTL = 5.0  # S, how long a remembered seller is trusted
+
+QUERY_HIT_CACHE = True  # Intermediate peers answer lookups from replies they relayed recently
+QUERY_HIT_CACHE_SIZE = 64  # Max product -> seller entries per peer
+QUERY_HIT_TTL = 0.5  # S, keep short: sellers switch products when they sell out
+
+LOOKUP_FORWARDING = 'flood'  # 'flood' (every neighbor) or 'routing_index' (only neighbors whose routing index has the product)
+ROUTING_INDEX_DEPTH = 3  # Hop levels summarized per neighbor link in the attenuated Bloom filter
+ROUTING_INDEX_BITS = 64  # Bits per level
+ROUTING_INDEX_HASHES = 3  # Hash functions per level
+
+LOOKUP_STRATEGY = 'flood'  # 'flood' (max_distance hops at once), 'expanding_ring' (grow the hop count on each timeout) or 'random_walk'
+RING_START_TTL = 1  # Hops covered by the first ring of an expanding-ring search
+RING_MAX_TTL = None  # Hops covered by the widest ring; None: max_distance + 1, as far as a flood lookup goes
+
+# LOOKUP_STRATEGY = 'random_walk': the buyer sends RANDOM_WALKERS lookups that each
+# move to one random neighbor per hop instead of flooding
+RANDOM_WALKERS = 4  # Walkers per lookup
+WALK_MAX_HOPS = 32  # Hops a walker may take
+WALK_CHECK_INTERVAL = 4  # A walker asks the buyer whether to go on every this many hops
+
+WORKER_POOL_SIZE = 8  # Threads shared by all peers of a process for follow-up lookups and buys
+WORKER_QUEUE_SIZE = 1024  # Follow-up jobs queued before new ones are rejected (and retried after TIMEOUT)
+
+# Runtime 'mux': every peer of a process shares MUX_SOCKETS UDP sockets instead of binding its own port
+MUX_PORT = 4000  # First real port; peers keep their 5000 + id addresses, which are only virtual
+MUX_SOCKETS = 1  # Sockets (and receive threads) the peers are spread over
+MUX_RCVBUF = 4 * 1024 * 1024  # Kernel receive buffer per socket, shared by all the peers on it
+
+TOPOLOGY = 'ring_random'  # 'ring_random', 'random_regular', 'small_world', 'scale_free' or 'complete' (utils/topology.py)
+TOPOLOGY_MAX_DEGREE = 3  # Neighbors per peer at most; None for no bound, which 'complete' needs beyond 4 peers
+TOPOLOGY_SEED = None  # Seed for the topology alone; None: drawn from the random module
+TOPOLOGY_FILE = None  # Path: reuse the topology saved there, or save the new one there, so runs share one graph
+
+CHURN_INTERVAL = None  # Seconds between peers joining or leaving a running network (main.py, simulation.py --churn); None: the overlay stays fixed
+CHURN_JOIN_PROBABILITY = 0.5  # Chance that a churn event is a join rather than a leave
+
+STATS_PORT = None  # Serve live per-peer metrics over HTTP on this local port (0: any free port); None: off
+STATS_FILE = None  # Append a metrics snapshot (JSON lines) to this file every STATS_INTERVAL seconds and at exit; None: off
+STATS_INTERVAL = 5.0  # Seconds between snapshots written to STATS_FILE
+
+LOG_LEVEL = 'info'  # 'debug' (every hop of every message), 'info', 'warning', 'error' or 'off'
+LOG_FORMAT = 'text'  # 'text', 'jsonl' or 'binary' (needs LOG_FILE; read back with utils.log.read_records)
+LOG_FILE = None  # Write the log to this file instead of stdout
+LOG_QUEUE_SIZE = 65536  # Records waiting for the log writer at most; past that new ones are dropped and counted (metrics gauge log_records_dropped)
+
+HANDLER_TIMING = False  # Time every message handler into the peer's metrics (count, total and max by message type)
+LOCK_TIMING = False  # Also record how long handlers wait for the peer's locks (metrics 'locks'); costs a little on every acquire
+PROFILER = None  # 'cprofile' or 'sample': profile every peer's handlers for a window and write one file per peer; None: off
+PROFILE_START = 1.0  # Seconds after the peers start that the window opens
+PROFILE_WINDOW = 5.0  # Seconds the window stays open
+PROFILE_DIR = 'profiles'  # Where peer_<id>.prof (cprofile) or peer_<id>.folded (sample, collapsed stacks) go
+PROFILE_SAMPLE_INTERVAL = 0.001  # Seconds between stack samples
+
+TRACE = False  # Trace transactions end to end: every hop records a span (utils/tracing.py); merge with python -m utils.trace_report
+TRACE_DIR = 'traces'  # Where each peer writes its spans, to trace_<peer id>.jsonl
+TRACE_SAMPLE = 1.0  # Fraction of transactions traced
+TRACE_QUEUE_SIZE = 65536  # Spans waiting for the trace writer at most; past that new ones are dropped and counted (trace_spans_dropped)
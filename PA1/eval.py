@@ -1,15 +1,38 @@
 # main.py
 
+import asyncio
 import random
 import sys
 import threading
 import time
 
-from peer import Peer
-from utils.network_utils import graph_diameter
-
-
-def main(N):
+import config
+from peer import Peer, LOOKUP_STRATEGY, REPLY_MODE, WORKER_POOL_SIZE, WORKER_QUEUE_SIZE
+from async_peer import AsyncPeer, run_peers
+from mux_peer import MuxPeer, open_muxes
+from utils.topology import load_or_build, attach
+from utils.network_utils import CSRGraph, distance_profile, profile_diameter
+from utils.worker_pool import shared_pool
+from utils.histogram import LatencyHistogram
+from utils.metrics import start_reporting, shared_registry
+from utils.log import shared_writer
+from utils.profiling import start_profiling
+from utils.tracing import finish_tracing
+from utils.timers import shared_scheduler
+
+
+def cache_summary(name, caches):
+    """One line on how often a kind of cache answered, summed over every peer's copy."""
+    stats = [cache.stats() for cache in caches]
+    hits = sum(s['hits'] for s in stats)
+    stale_hits = sum(s['stale_hits'] for s in stats)
+    lookups = hits + stale_hits + sum(s['misses'] for s in stats)
+    if not lookups:
+        return f"{name}: not consulted"
+    return f"{name}: {hits} hits in {lookups} lookups ({hits / lookups:.1%} hit rate), {stale_hits} found only expired entries"
+
+
+def main(N, runtime='threaded', lookup_strategy=LOOKUP_STRATEGY, reply_mode=REPLY_MODE):
     num_peers = N  # Number of peers in the network
     peers = []
     ports = [5000 + i for i in range(num_peers)]  # Assign unique ports for all the peers
@@ -19,6 +42,9 @@ def main(N):
     buyers = []
     sellers = []
 
+    # Runtime 'mux': all peers share a few sockets, demultiplexed by peer id
+    muxes = open_muxes() if runtime == 'mux' else []
+
     # Create peers with random roles and items, ensuring at least one buyer and one seller
     for i in range(num_peers):
         if i == num_peers - 2 and len(buyers) == 0:
@@ -33,79 +59,88 @@ def main(N):
         item = None
         if role == "seller":
             item = random.choice(items)
-        peer = Peer(peer_id=i, role=role, neighbors=[], item=item, port=ports[i])
+        if runtime == 'mux':
+            peer = MuxPeer(muxes[i % len(muxes)], peer_id=i, role=role, neighbors=[], item=item, port=ports[i])
+        else:
+            peer_class = AsyncPeer if runtime == 'asyncio' else Peer
+            peer = peer_class(peer_id=i, role=role, neighbors=[], item=item, port=ports[i])
         peers.append(peer)
         if role == 'buyer':
             buyers.append(peer)
         else:
             sellers.append(peer)
 
-    # Connect peers randomly with the motive of making a connected network
-    for i in range(num_peers):
-        next_peer = (i + 1) % num_peers
-        if peers[next_peer] not in peers[i].neighbors:
-            peers[i].neighbors.append(peers[next_peer])
-            peers[next_peer].neighbors.append(peers[i])
-
-    # Add random neighbors to ensure no more than 3 neighbors per peer
-    max_neighbors = min(3, num_peers - 1)
-    for peer in peers:
-        retries = 0
-        while len(peer.neighbors) < max_neighbors and retries < 10:
-            neighbor = random.choice(peers)
-            if neighbor.peer_id != peer.peer_id and neighbor not in peer.neighbors and len(
-                    neighbor.neighbors) < max_neighbors:
-                peer.neighbors.append(neighbor)
-                neighbor.neighbors.append(peer)
-            else:
-                retries += 1
+    # Connect peers in a connected network of at most TOPOLOGY_MAX_DEGREE neighbors per peer
+    adjacency = load_or_build(config.TOPOLOGY, num_peers, config.TOPOLOGY_MAX_DEGREE, config.TOPOLOGY_SEED, config.TOPOLOGY_FILE)
+    attach(peers, adjacency)
 
     # Display the network structure
     print("Network structure initialized:")
     for peer in peers:
         peer.display_network()
 
-    # Start the peers to listen for messages
-    for peer in peers:
-        peer.start_peer()
-
-    # Calculate network diameter
-    diameter = graph_diameter(peers)
+    # Calculate network diameter, with every peer's eccentricity and the hop distances between peers
+    profile = distance_profile(CSRGraph.from_peers(peers))
+    diameter = profile_diameter(profile)
     print(f"Network diameter is {diameter}")
+    eccentricities = sorted(profile.eccentricity.values())
+    print(f"Peer eccentricity: min {eccentricities[0]}, median {eccentricities[len(eccentricities) // 2]}, max {eccentricities[-1]}")
+    print("Peer pairs by hop distance: " + ", ".join(f"{d}: {pairs}" for d, pairs in enumerate(profile.histogram) if d > 0))
 
     # Set the hopcount to be lower than the diameter
     hopcount = max(1, diameter - 1)
     for peer in peers:
         peer.max_distance = hopcount
         peer.hop_count = hopcount
+        peer.lookup_strategy = lookup_strategy
+        peer.reply_mode = reply_mode
+        # Direct replies are also relayed along the path, so replies that pass through relays are timed both ways
+        peer.reply_notify_path = reply_mode == 'direct'
+
+    # Profile the handlers for a window, if PROFILER is set
+    profiler = start_profiling(peers, config.PROFILER, config.PROFILE_DIR, config.PROFILE_START,
+                               config.PROFILE_WINDOW, config.PROFILE_SAMPLE_INTERVAL, shared_scheduler())
 
     # Have every buyer initiate a lookup
     if buyers:
-        threads = []  # List to hold thread references
-        for buyer in buyers:
-            item = random.choice(items)
-            print(f"Buyer {buyer.peer_id} is initiating a lookup for {item} with hopcount {hopcount}")
-
-            # Start the thread and pass the buyer's ID to the target function to avoid overwriting
-            thread = threading.Thread(target=buyer.lookup_item, args=(item, hopcount))
-            threads.append(thread)  # Store the thread reference
-            thread.start()  # Start the thread
-
-        # Join all threads to ensure they initiate their lookups
-        for thread in threads:
-            thread.join()
-
-        # Wait until all buyers have completed their transactions
-        while True:
-            alive_buyers = [buyer for buyer in buyers if buyer.running]
-            if not alive_buyers:
-                print("All buyers have shut down. Shutting down sellers and exiting program.")
-                # Shut down all seller peers
-                for seller in sellers:
-                    seller.running = False
-                    seller.socket.close()
-                break
-            time.sleep(1)  # Sleep before checking again
+        if runtime == 'asyncio':
+            # Every peer runs on one event loop; run_peers returns when all buyers are done
+            lookups = [(buyer, random.choice(items), hopcount) for buyer in buyers]
+            for buyer, item, _ in lookups:
+                print(f"Buyer {buyer.peer_id} is initiating a lookup for {item} with hopcount {hopcount}")
+            asyncio.run(run_peers(peers, lookups))
+        else:
+            # Start the peers to listen for messages
+            for mux in muxes:
+                mux.start()
+            for peer in peers:
+                peer.start_peer()
+
+            threads = []  # List to hold thread references
+            for buyer in buyers:
+                item = random.choice(items)
+                print(f"Buyer {buyer.peer_id} is initiating a lookup for {item} with hopcount {hopcount}")
+
+                # Start the thread and pass the buyer's ID to the target function to avoid overwriting
+                thread = threading.Thread(target=buyer.lookup_item, args=(item, hopcount))
+                threads.append(thread)  # Store the thread reference
+                thread.start()  # Start the thread
+
+            # Join all threads to ensure they initiate their lookups
+            for thread in threads:
+                thread.join()
+
+            # Wait until all buyers have completed their transactions
+            while True:
+                alive_buyers = [buyer for buyer in buyers if buyer.running]
+                if not alive_buyers:
+                    print("All buyers have shut down. Shutting down sellers and exiting program.")
+                    # Shut down all seller peers
+                    for seller in sellers:
+                        seller.running = False
+                        seller.socket.close()
+                    break
+                time.sleep(1)  # Sleep before checking again
 
         # Collect the average RTTs for each buyer after all transactions are complete
         rtt = []  # Initialize the RTT list
@@ -115,23 +150,103 @@ def main(N):
                 'average_rtt': buyer.average_rtt
             })
 
+        # Let the peers' last log records out before the report
+        shared_writer().flush()
+
         # Print the RTT data
         print("\nRTT for each buyer:")
         for data in rtt:
             print(f"Buyer {data['buyer_id']} average RTT: {data['average_rtt']:.4f} seconds")
 
+        # Per-transaction latency, every buyer's histogram merged
+        latency = LatencyHistogram.merged(buyer.latency for buyer in buyers)
+        print(f"\nTransaction latency over {len(buyers)} buyers: {latency.summary()}")
+
+        # Search cost: every search message sent by any peer, per lookup a buyer got an answer to
+        search_types = ('lookup', 'reply', 'walk_check', 'walk_status')
+        search_messages = sum(peer.messages_sent[t] for peer in peers for t in search_types)
+        successful_lookups = sum(buyer.lookups_succeeded for buyer in buyers)
+        per_lookup = search_messages / successful_lookups if successful_lookups else float('nan')
+        print(f"\nLookup strategy '{lookup_strategy}': {search_messages} search messages for "
+              f"{successful_lookups} successful lookups ({per_lookup:.1f} per successful lookup)")
+
+        # Duplicate suppression: what the seen filters caught, and what they got wrong or forgot
+        seen = [peer.seen_requests.stats() for peer in peers]
+        print(f"Seen filter '{seen[0]['kind']}': {sum(s['queries'] for s in seen)} lookups checked, "
+              f"{sum(s['duplicates'] for s in seen)} duplicates dropped, "
+              f"{sum(s['false_positives'] for s in seen):.1f} false positives (estimated), "
+              f"{sum(s['evictions'] for s in seen)} ids evicted")
+        print(cache_summary("Query-hit cache", (peer.query_hit_cache for peer in peers)))
+        print(cache_summary("Seller cache", (buyer.seller_cache for buyer in buyers)))
+
+        # Lookup to reply, relayed hop by hop against straight from the peer that answered
+        reply_latency = {kind: LatencyHistogram.merged(buyer.reply_latency[kind] for buyer in buyers)
+                         for kind in ('relayed', 'direct')}
+        print(f"\nReply mode '{reply_mode}':")
+        for kind, histogram in reply_latency.items():
+            if histogram.count:
+                print(f"  {kind} reply latency, all replies: {histogram.summary()}")
+        # Only replies that came both ways are compared: a reply from the buyer's neighbor has no
+        # path copy, and counting it as direct alone would credit direct replies with its one hop
+        paired = {kind: LatencyHistogram.merged(buyer.paired_reply_latency[kind] for buyer in buyers)
+                  for kind in ('relayed', 'direct')}
+        relayed, direct = paired['relayed'], paired['direct']
+        if relayed.count:
+            relayed_p50, direct_p50 = relayed.value_at_percentile(50), direct.value_at_percentile(50)
+            print(f"  Over the {relayed.count} replies that came both ways, direct replies cut reply latency by "
+                  f"{1 - direct.mean() / relayed.mean():.1%} on average and by {1 - direct_p50 / relayed_p50:.1%} at p50 "
+                  f"({direct_p50 / 1e6:.3f} ms against {relayed_p50 / 1e6:.3f} ms)")
+            print("  The path copies load the network while the direct ones are timed; "
+                  "compare with the relayed latency of a 'path' run for the unloaded baseline")
+
+        # Where handler time goes, by message type, and how long handlers waited for locks
+        totals = shared_registry().snapshot(peers=False)
+        if totals['handlers']:
+            print("\nHandler time by message type:")
+            for message_type, handler in sorted(totals['handlers'].items(), key=lambda item: -item[1]['total_ms']):
+                print(f"  {message_type}: {handler['calls']} calls, {handler['total_ms']:.1f} ms total, "
+                      f"{handler['total_ms'] * 1e3 / handler['calls']:.1f} us mean, {handler['max_us']:.0f} us max")
+        for name, lock in sorted(totals['locks'].items()):
+            print(f"Lock {name}: {lock['acquisitions']} acquisitions, {lock['contended']} contended, "
+                  f"{lock['wait_ms']:.2f} ms waited, {lock['max_wait_us']:.0f} us longest wait")
+
+        for mux in muxes:
+            stats = mux.stats()
+            print(f"Mux socket {mux.address[1]}: {stats['peers']} peers left, {stats['received']} datagrams received, {stats['dropped']} dropped, {stats['unroutable']} unroutable sends")
+
+        if runtime in ('threaded', 'mux'):
+            pool = shared_pool(WORKER_POOL_SIZE, WORKER_QUEUE_SIZE).stats()
+            print(f"Follow-up worker pool: {pool['workers']} workers, {pool['completed']} jobs, "
+                  f"max queue depth {pool['max_queue_depth']}/{pool['queue_size']}, {pool['rejected']} rejected")
+
     # Wait for all peer threads to finish
     for peer in peers:
-        if peer.thread.is_alive():
+        if peer.thread is not None and peer.thread.is_alive():
             peer.thread.join()
 
+    for mux in muxes:
+        mux.close()
+    if profiler is not None:
+        profiler.close()
+    finish_tracing()
+
     for peer in peers:
         peer.display_network()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <number_of_peers>")
+    runtimes = ('threaded', 'asyncio', 'mux')
+    strategies = ('flood', 'expanding_ring', 'random_walk')
+    reply_modes = ('path', 'direct')
+    options = sys.argv[2:]
+    if len(sys.argv) < 2 or len(options) > 3 or any(o not in runtimes + strategies + reply_modes for o in options):
+        print(f"Usage: python eval.py <number_of_peers> [{'|'.join(runtimes)}] [{'|'.join(strategies)}] [{'|'.join(reply_modes)}]")
         sys.exit(1)
     N = int(sys.argv[1])
-    main(N)
+    runtime = next((o for o in options if o in runtimes), 'threaded')
+    lookup_strategy = next((o for o in options if o in strategies), LOOKUP_STRATEGY)
+    reply_mode = next((o for o in options if o in reply_modes), REPLY_MODE)
+    # Live metrics, if STATS_PORT or STATS_FILE is set
+    metrics = start_reporting(config.STATS_PORT, config.STATS_FILE, config.STATS_INTERVAL)
+    main(N, runtime, lookup_strategy, reply_mode)
+    metrics.close(config.STATS_FILE)
@@ -1,24 +1,44 @@
 # main.py
 
+import asyncio
 import random
 import sys
 import threading
 import time
 
+import config
 from peer import Peer
+from async_peer import AsyncPeer, run_peers
+from mux_peer import MuxPeer, open_muxes
+from churn import Churn
+from utils.topology import load_or_build, attach
 from utils.network_utils import graph_diameter
+from utils.timers import shared_scheduler
+from utils.metrics import start_reporting
+from utils.log import shared_writer
+from utils.profiling import start_profiling
+from utils.tracing import finish_tracing
 
 
-def main(N):
+def main(N, runtime='threaded'):
     num_peers = N  # Number of peers in the network
     peers = []
-    ports = [5000 + i for i in range(num_peers)]  # Assign unique ports for all the peers
     roles = ["buyer", "seller"]
     items = ["fish", "salt", "boar"]
 
     buyers = []
     sellers = []
 
+    # Runtime 'mux': all peers share a few sockets, demultiplexed by peer id
+    muxes = open_muxes() if runtime == 'mux' else []
+
+    def make_peer(peer_id, role, item):
+        port = 5000 + peer_id
+        if runtime == 'mux':
+            return MuxPeer(muxes[peer_id % len(muxes)], peer_id=peer_id, role=role, neighbors=[], item=item, port=port)
+        peer_class = AsyncPeer if runtime == 'asyncio' else Peer
+        return peer_class(peer_id=peer_id, role=role, neighbors=[], item=item, port=port)
+
     # Create peers with random roles and items, ensuring at least one buyer and one seller
     for i in range(num_peers):
         if i == num_peers - 2 and len(buyers) == 0:
@@ -32,41 +52,22 @@ def main(N):
         item = None
         if role == "seller":
             item = random.choice(items)
-        peer = Peer(peer_id=i, role=role, neighbors=[], item=item, port=ports[i])
+        peer = make_peer(i, role, item)
         peers.append(peer)
         if role == 'buyer':
             buyers.append(peer)
         else:
             sellers.append(peer)
 
-    # Connect peers randomly with the motive of making a connected network
-    for i in range(num_peers):
-        next_peer = (i + 1) % num_peers
-        if peers[next_peer] not in peers[i].neighbors:
-            peers[i].neighbors.append(peers[next_peer])
-            peers[next_peer].neighbors.append(peers[i])
-
-    # Add random neighbors to ensure no more than 3 neighbors per peer
-    max_neighbors = min(3, num_peers - 1)
-    for peer in peers:
-        retries = 0
-        while len(peer.neighbors) < max_neighbors and retries < 10:
-            neighbor = random.choice(peers)
-            if neighbor.peer_id != peer.peer_id and neighbor not in peer.neighbors and len(neighbor.neighbors) < max_neighbors:
-                peer.neighbors.append(neighbor)
-                neighbor.neighbors.append(peer)
-            else:
-                retries += 1
+    # Connect peers in a connected network of at most TOPOLOGY_MAX_DEGREE neighbors per peer
+    adjacency = load_or_build(config.TOPOLOGY, num_peers, config.TOPOLOGY_MAX_DEGREE, config.TOPOLOGY_SEED, config.TOPOLOGY_FILE)
+    attach(peers, adjacency)
 
     # Display the network structure
     print("Network structure initialized:")
     for peer in peers:
         peer.display_network()
 
-    # Start the peers to listen for messages
-    for peer in peers:
-        peer.start_peer()
-
     # Calculate network diameter
     diameter = graph_diameter(peers)
     print(f"Network diameter is {diameter}")
@@ -77,6 +78,33 @@ def main(N):
         peer.max_distance = hopcount
         peer.hop_count = hopcount
 
+    # Profile the handlers for a window, if PROFILER is set
+    profiler = start_profiling(peers, config.PROFILER, config.PROFILE_DIR, config.PROFILE_START,
+                               config.PROFILE_WINDOW, config.PROFILE_SAMPLE_INTERVAL, shared_scheduler())
+
+    if runtime == 'asyncio':
+        # Every peer runs on one event loop; run_peers returns when all buyers are done
+        lookups = [(buyer, random.choice(items), hopcount) for buyer in buyers]
+        for buyer, item, _ in lookups:
+            print(f"Buyer {buyer.peer_id} is initiating a lookup for {item} with hopcount {hopcount}")
+        asyncio.run(run_peers(peers, lookups))
+        if profiler is not None:
+            profiler.close()
+        finish_tracing()
+        return
+
+    # Start the peers to listen for messages
+    for mux in muxes:
+        mux.start()
+    for peer in peers:
+        peer.start_peer()
+
+    # Peers join and leave every CHURN_INTERVAL seconds while the buyers run
+    churn = None
+    if config.CHURN_INTERVAL:
+        churn = Churn(peers, adjacency, make_peer, shared_scheduler(), items)
+        churn.start()
+
     # Have every buyer initiate a lookup
     if buyers:
         for buyer in buyers:
@@ -90,7 +118,15 @@ def main(N):
     while True:
         alive_buyers = [buyer for buyer in buyers if buyer.running]
         if not alive_buyers:
+            # Let the peers' last log records out before the report
+            shared_writer().flush()
             print("All buyers have shut down. Shutting down sellers and exiting program.")
+            if churn is not None:
+                churn.stop()
+                print(churn.summary())
+                # Peers that joined are shut down too, buyers included
+                sellers = [peer for peer in churn.peers.values() if peer.running]
+                peers = peers + [peer for peer in churn.peers.values() if peer.peer_id >= num_peers]
             # Shut down all seller peers
             for seller in sellers:
                 seller.running = False
@@ -100,11 +136,21 @@ def main(N):
 
     # Wait for all peer threads to finish
     for peer in peers:
-        peer.thread.join()
+        if peer.thread is not None:
+            peer.thread.join()
+    for mux in muxes:
+        mux.close()
+    if profiler is not None:
+        profiler.close()
+    finish_tracing()
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <number_of_peers>")
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] not in ('threaded', 'asyncio', 'mux')):
+        print("Usage: python main.py <number_of_peers> [threaded|asyncio|mux]")
         sys.exit(1)
     N = int(sys.argv[1])
-    main(N)
+    runtime = sys.argv[2] if len(sys.argv) == 3 else 'threaded'
+    # Live metrics, if STATS_PORT or STATS_FILE is set
+    metrics = start_reporting(config.STATS_PORT, config.STATS_FILE, config.STATS_INTERVAL)
+    main(N, runtime)
+    metrics.close(config.STATS_FILE)
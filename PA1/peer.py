@@ -1,25 +1,74 @@
 # peer.py
-import datetime
 import threading
 import socket
-import pickle
 import random
 import time
 import hashlib
-import math
+import itertools
 
-from utils.messages import LookupMessage, ReplyMessage, BuyMessage, BuyConfirmationMessage
+from utils.messages import LookupMessage, ReplyMessage, BuyMessage, BuyConfirmationMessage, RoutingUpdateMessage, WalkCheckMessage, WalkStatusMessage
+from utils.codec import encode, decode
+from utils.ttl_cache import TTLCache
+from utils.seen_filter import make_seen_filter
+from utils.attenuated_bloom import AttenuatedBloomFilter
+from utils.timers import shared_scheduler
+from utils.worker_pool import shared_pool
+from utils.histogram import LatencyHistogram
+from utils.metrics import PeerMetrics, shared_registry
+from utils.log import DEBUG, Logger, configure as configure_log
+from utils.profiling import timed, make_lock
+from utils.tracing import NO_SPAN, Tracer, configure as configure_tracing
 import config
 
 BUY_PROBABILITY = config.BUY_PROBABILITY
 SELLER_STOCK = config.SELLER_STOCK
 MAX_TRANSACTIONS = config.MAX_TRANSACTIONS
 TIMEOUT = config.TIMEOUT
+WIRE_FORMAT = config.WIRE_FORMAT
+ACCEPT_PICKLE = config.ACCEPT_PICKLE or WIRE_FORMAT == 'pickle'  # Choosing the pickle format opts in too
+RECV_BUFFER_SIZE = 1024
+ROUTING_MODE = config.ROUTING_MODE
+ROUTE_TABLE_SIZE = config.ROUTE_TABLE_SIZE
+ROUTE_TTL = config.ROUTE_TTL
+REPLY_MODE = config.REPLY_MODE
+REPLY_NOTIFY_PATH = config.REPLY_NOTIFY_PATH
+SEEN_FILTER = config.SEEN_FILTER
+SEEN_FILTER_CAPACITY = config.SEEN_FILTER_CAPACITY
+SEEN_FILTER_TTL = config.SEEN_FILTER_TTL
+BLOOM_ERROR_RATE = config.BLOOM_ERROR_RATE
+SELLER_CACHE = config.SELLER_CACHE
+SELLER_CACHE_TTL = config.SELLER_CACHE_TTL
+QUERY_HIT_CACHE = config.QUERY_HIT_CACHE
+QUERY_HIT_CACHE_SIZE = config.QUERY_HIT_CACHE_SIZE
+QUERY_HIT_TTL = config.QUERY_HIT_TTL
+LOOKUP_FORWARDING = config.LOOKUP_FORWARDING
+ROUTING_INDEX_DEPTH = config.ROUTING_INDEX_DEPTH
+ROUTING_INDEX_BITS = config.ROUTING_INDEX_BITS
+ROUTING_INDEX_HASHES = config.ROUTING_INDEX_HASHES
+LOOKUP_STRATEGY = config.LOOKUP_STRATEGY
+RING_START_TTL = config.RING_START_TTL
+RING_MAX_TTL = config.RING_MAX_TTL
+RANDOM_WALKERS = config.RANDOM_WALKERS
+WALK_MAX_HOPS = config.WALK_MAX_HOPS
+WALK_CHECK_INTERVAL = config.WALK_CHECK_INTERVAL
+WORKER_POOL_SIZE = config.WORKER_POOL_SIZE
+WORKER_QUEUE_SIZE = config.WORKER_QUEUE_SIZE
+HANDLER_TIMING = config.HANDLER_TIMING
+LOCK_TIMING = config.LOCK_TIMING
+TRACE = config.TRACE
+TRACE_SAMPLE = config.TRACE_SAMPLE
+
+_log_writer = configure_log(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_FILE, config.LOG_QUEUE_SIZE)
+_trace_writer = configure_tracing(config.TRACE_DIR, config.TRACE_QUEUE_SIZE)
+# What the writers dropped because they fell behind, in every metrics snapshot
+shared_registry().gauge('log_records_dropped', lambda: _log_writer.dropped)
+shared_registry().gauge('trace_spans_dropped', lambda: _trace_writer.dropped)
 
 class Peer:
-    def __init__(self, peer_id, role, neighbors, port, ip_address='localhost', item=None, cache_size=math.inf, hop_count=3, max_distance=3):
-        self.cache = {}
-        self.cache_size = cache_size
+    def __init__(self, peer_id, role, neighbors, port, ip_address='localhost', item=None, cache_size=None, hop_count=3, max_distance=3):
+        # Request ids already handled, so flooded duplicates are dropped
+        self.cache_size = cache_size if cache_size is not None else SEEN_FILTER_CAPACITY
+        self.seen_requests = make_seen_filter(SEEN_FILTER, self.cache_size, SEEN_FILTER_TTL, BLOOM_ERROR_RATE, clock=self.now)
         self.peer_id = peer_id
         self.role = role  # 'buyer' or 'seller'
         self.neighbors = neighbors
@@ -27,176 +76,557 @@ class Peer:
         self.port = port
         self.item = item
         self.stock = SELLER_STOCK if role == 'seller' else 0
-        self.lock = threading.Lock()  # For thread safety
-        self.pending_requests_lock = threading.Lock()  # Lock for pending_requests
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.bind((self.ip_address, port))
+        # Counters, handler times and gauges, readable live through utils/metrics.py
+        self.metrics = PeerMetrics(peer_id)
+        # With LOCK_TIMING, waits on these locks are recorded in the metrics
+        self.lock = make_lock(self.metrics, 'lock', LOCK_TIMING)  # For thread safety
+        self.pending_requests_lock = make_lock(self.metrics, 'pending_requests_lock', LOCK_TIMING)  # Lock for pending_requests
+        self.socket = self.open_socket()
         self.running = True
+        self.thread = None
         self.looked_up_items = set()
         self.hop_count = hop_count
         self.max_distance = max_distance
         self.available_items = ["fish", "salt", "boar"]
         self.items_bought = 0
+        # Leveled records, formatted and written on the log writer thread (utils/log.py)
+        self.log = Logger(peer_id, clock=self.now)
+        # With TRACE, a span for every traced message handled (utils/tracing.py)
+        self.tracer = Tracer(peer_id, clock=self.now, sample=TRACE_SAMPLE) if TRACE else None
+
+        # 'path': lookups carry the search path and replies retrace it.
+        # 'reverse': each peer remembers request_id -> previous hop instead, so
+        # lookups and replies keep a fixed size whatever the hop count.
+        self.routing_mode = ROUTING_MODE
+        self.reverse_routes = TTLCache(ROUTE_TABLE_SIZE, ROUTE_TTL, clock=self.now)
+        # 'path': replies retrace the lookup. 'direct': the peer answering a lookup
+        # sends the reply straight to the buyer, and relays it only when the lookup
+        # does not say where the buyer is, or as well with reply_notify_path.
+        self.reply_mode = REPLY_MODE
+        self.reply_notify_path = REPLY_NOTIFY_PATH
+
+        # product -> (seller_id, seller_addr) learned from replies relayed through this peer
+        self.use_query_hit_cache = QUERY_HIT_CACHE
+        self.query_hit_cache = TTLCache(QUERY_HIT_CACHE_SIZE, QUERY_HIT_TTL, clock=self.now)
+
+        # 'routing_index': neighbor_id -> attenuated Bloom filter of the products
+        # reachable through that neighbor, level i being i hops past it.
+        # Lookups only go to neighbors that can reach the product in the hops left.
+        self.lookup_forwarding = LOOKUP_FORWARDING
+        self.neighbor_indexes = {}
+        self.advertised_indexes = {}  # neighbor_id -> levels last sent to that neighbor
+        self.routing_index_lock = threading.Lock()
+
+        self.messages_sent = self.metrics.counter('sent')  # Messages sent, by type
+        self.messages_received = self.metrics.counter('received')
+        self.metrics.gauge('role', lambda: self.role)
+        self.metrics.gauge('running', lambda: self.running)
+        self.metrics.gauge('neighbors', lambda: len(self.neighbors))
+        self.metrics.gauge('pending_requests', lambda: len(self.pending_requests))
+        self.metrics.gauge('seen_filter', self.seen_requests.stats)
+        self.metrics.gauge('query_hit_cache', self.query_hit_cache.stats)
+        if role == 'seller':
+            self.metrics.gauge('item', lambda: self.item)
+            self.metrics.gauge('stock', lambda: self.stock)
+        shared_registry().register(self.metrics)
 
-        # For buyer timeout handling
+        # 'flood': lookups go out max_distance hops at once.
+        # 'expanding_ring': they start RING_START_TTL hops out and go one hop further
+        # each time one times out, up to RING_MAX_TTL.
+        # 'random_walk': RANDOM_WALKERS walkers each take one random neighbor per hop.
+        self.lookup_strategy = LOOKUP_STRATEGY
+        # request_id -> walkers parked here until their buyer says whether to go on
+        self.parked_walkers = TTLCache(ROUTE_TABLE_SIZE, TIMEOUT, clock=self.now)
+
+        # For buyer timeout handling: request_id -> (product_name, sent_at, ring_ttl, timeout timer, stage, stale_seller_id),
+        # stage being 'lookup' until a reply arrives and 'buy' until the confirmation does
         self.pending_requests = {}
+        self.request_counter = itertools.count()  # Keeps request ids unique within one clock tick
         self.timeout = TIMEOUT  # seconds
         if self.role == 'buyer':
+            self.metrics.gauge('items_bought', lambda: self.items_bought)
             self.start_time = None
             self.end_time = None
-            self.average_rtt = time.time()
+            self.average_rtt = self.now()
             self.max_transactions = MAX_TRANSACTIONS
+            # Nanoseconds from starting to look for an item to its buy confirmation, retries included
+            self.latency = LatencyHistogram()
+            self.transaction_started = None
+            self.trace_id = None  # Trace of the transaction, kept through its retries
+            self.lookups_succeeded = 0  # Lookups answered by a reply while still pending
+            # Nanoseconds from sending a lookup to each reply to it, by the way the reply came:
+            # 'relayed' along the path or 'direct' from the peer that answered
+            self.reply_latency = {'relayed': LatencyHistogram(), 'direct': LatencyHistogram()}
+            self.lookups_sent = TTLCache(64, ROUTE_TTL, clock=self.now)  # request_id -> clock_ns() when sent
+            # The same, only for replies that came both ways, each copy timed against the other
+            self.paired_reply_latency = {'relayed': LatencyHistogram(), 'direct': LatencyHistogram()}
+            self.reply_copies = TTLCache(64, ROUTE_TTL, clock=self.now)  # (request_id, replier_id) -> (kind, ns)
+            # product -> (seller_id, seller_addr) learned from replies, for direct buys
+            self.use_seller_cache = SELLER_CACHE
+            self.seller_cache = TTLCache(len(self.available_items), SELLER_CACHE_TTL, clock=self.now)
+            self.metrics.gauge('seller_cache', self.seller_cache.stats)
+
+        # message type -> handler(message, addr), rebuilt by instrument()
+        self.handlers = {}
+        self.instrument()
+
+
+
+    def open_socket(self):
+        """Create the UDP socket the peer receives on."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.ip_address, self.port))
+        return sock
 
+    def now(self):
+        """Current time, in seconds. Every timestamp a peer takes goes through here."""
+        return time.time()
 
+    def clock_ns(self):
+        """Monotonic nanoseconds, for measuring latencies."""
+        return time.perf_counter_ns()
 
     def start_peer(self):
         """Start listening for messages from other peers."""
-        print(f"Peer {self.peer_id} ({self.role}) with item {self.item} listening on port {self.port}...")
+        self.log.info('start', "Peer {peer} ({role}) with item {item} listening on port {port}...",
+                      peer=self.peer_id, role=self.role, item=self.item, port=self.port)
         t = threading.Thread(target=self.listen_for_messages)
         t.start()
         self.thread = t  # Keep a reference to the thread
+        self.advertise_routing_index()
 
     def listen_for_messages(self):
         """Continuously listen for incoming messages."""
+        # Datagrams are received into this buffer and decoded in place
+        recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        recv_view = memoryview(recv_buffer)
         while self.running:
             try:
                 self.socket.settimeout(1.0)
-                data, addr = self.socket.recvfrom(1024)
-                message = pickle.loads(data)
-                # print(f"[{self.peer_id}] Received Message: {message}")
-                if message.get('type') == 'lookup':
-                    self.handle_lookup(message, addr)
-                elif message.get('type') == 'reply':
-                    self.handle_reply(message)
-                elif message.get('type') == 'buy':
-                    self.handle_buy(message, addr)
-                elif message.get('type') == 'buy_confirmation':
-                    self.handle_buy_confirmation(message)
-                elif message.get('type') == 'no_seller':
-                    self.handle_no_seller(message)
+                nbytes, addr = self.socket.recvfrom_into(recv_buffer)
+                self.receive_datagram(recv_view[:nbytes], addr)
             except socket.timeout:
                 pass  # Timeout occurred
+            except ValueError as e:
+                self.log.warning('bad_datagram', "Dropping datagram: {error}", error=str(e))
             except OSError:
                 # Socket has been closed
                 break
-            # For buyers, check for timeouts on pending requests
-            if self.role == 'buyer':
-                self.check_pending_requests()
 
-    def check_pending_requests(self):
-        current_time = time.time()
-        to_remove = []
+    def receive_datagram(self, data, addr):
+        """Decode one datagram and hand it to its handler."""
+        if not self.running:
+            self.metrics.incr('dropped', 'peer_stopped')
+            return
+        try:
+            message = decode(data, ACCEPT_PICKLE)
+        except ValueError as e:
+            self.log.warning('bad_datagram', "Dropping datagram: {error}", error=str(e))
+            self.metrics.incr('dropped', 'undecodable')
+            return
+        self.dispatch_message(message, addr)
+
+    def dispatch_message(self, message, addr):
+        """Route a decoded message to its handler through the handler table, counting it."""
+        message_type = message.get('type')
+        self.messages_received[message_type] += 1
+        handler = self.handlers.get(message_type)
+        if handler is None:
+            self.metrics.incr('dropped', message_type)
+            return
+        handler(message, addr)
+
+    def message_handlers(self):
+        """message type -> handler(message, addr), before any instrumentation."""
+        return {
+            'lookup': self.handle_lookup,
+            'reply': lambda message, addr: self.handle_reply(message),
+            'buy': self.handle_buy,
+            'buy_confirmation': lambda message, addr: self.handle_buy_confirmation(message),
+            'no_seller': lambda message, addr: self.handle_no_seller(message),
+            'routing_update': lambda message, addr: self.handle_routing_update(message),
+            'walk_check': self.handle_walk_check,
+            'walk_status': lambda message, addr: self.handle_walk_status(message),
+        }
+
+    def instrument(self, profiler=None):
+        """
+        Rebuild the handler table: each handler traced if TRACE is on, timed into the metrics if
+        HANDLER_TIMING is, and run under profiler (a utils.profiling.HandlerProfiler) if one is given.
+        """
+        handlers = {}
+        for message_type, handler in self.message_handlers().items():
+            if self.tracer is not None:
+                handler = self.tracer.wrap(handler, message_type)
+            if HANDLER_TIMING:
+                handler = timed(handler, self.metrics, message_type)
+            if profiler is not None:
+                handler = profiler.wrap(self.peer_id, handler)
+            handlers[message_type] = handler
+        self.handlers = handlers
+
+    def trace_span(self, name):
+        """A span of the buyer's current transaction, with no parent; a no-op unless it is traced."""
+        if self.tracer is None:
+            return NO_SPAN
+        return self.tracer.span(self.trace_id, None, name)
+
+    def spawn(self, target, *args):
+        """Run follow-up work (a new lookup or retry) outside the receive loop, on the shared worker pool."""
+        if not shared_pool(WORKER_POOL_SIZE, WORKER_QUEUE_SIZE).submit(target, *args):
+            # Pool overloaded: try again after a timeout rather than dropping the buyer's next step
+            self.log.warning('pool_full', "Worker pool queue full. Deferring {job} by {delay}s", job=target.__name__, delay=self.timeout)
+            self.schedule_timeout(self.timeout, self.spawn, target, *args)
+
+    def schedule_timeout(self, delay, callback, *args):
+        """Run callback(*args) after delay seconds. Returns a handle with cancel()."""
+        return shared_scheduler().call_later(delay, callback, *args)
+
+    def add_pending_request(self, request_id, product_name, ring_ttl=None, stage='lookup', stale_seller_id=None):
+        """Track an outstanding request until it is answered or its timeout fires."""
         with self.pending_requests_lock:
-            for request_id, (product_name, timestamp) in self.pending_requests.items():
-                if current_time - timestamp > self.timeout:
-                    print(f"[{self.peer_id}] No response received for {product_name}. Timing out and selecting another item.")
-                    to_remove.append(request_id)
-                    remaining_items = [item for item in self.available_items if item != product_name]
-                    if not remaining_items:
-                        print(f"[{self.peer_id}] No other items to look up besides {product_name}. Shutting down.")
-                        self.shutdown_peer()
-                        return
-                    new_product = random.choice(remaining_items)
-                    print(f"[{self.peer_id}] Searching for a new product: {new_product}")
-                    threading.Thread(target=self.lookup_item, args=(new_product, self.max_distance)).start()
-            for request_id in to_remove:
-                del self.pending_requests[request_id]
+            timer = self.schedule_timeout(self.timeout, self.request_timed_out, request_id)
+            self.pending_requests[request_id] = (product_name, self.now(), ring_ttl, timer, stage, stale_seller_id)
+
+    def complete_pending_request(self, request_id, stage=None):
+        """
+        Stop tracking an answered request. Returns False if it was no longer pending,
+        or is at another stage than the one given.
+        """
+        with self.pending_requests_lock:
+            entry = self.pending_requests.get(request_id)
+            if entry is None or (stage is not None and entry[4] != stage):
+                return False
+            del self.pending_requests[request_id]
+        entry[3].cancel()
+        return True
+
+    def cancel_pending_requests(self):
+        with self.pending_requests_lock:
+            for entry in self.pending_requests.values():
+                entry[3].cancel()
+            self.pending_requests.clear()
+
+    def request_timed_out(self, request_id):
+        """Timer callback: nothing answered request_id within the timeout."""
+        with self.pending_requests_lock:
+            entry = self.pending_requests.pop(request_id, None)
+        if entry is None or not self.running:
+            return
+        self.metrics.incr('events', 'timeout')
+        product_name, _, ring_ttl, _, _, stale_seller_id = entry
+        self.seller_cache.pop(product_name)
+        if ring_ttl is not None and ring_ttl < self.ring_max_ttl():
+            # Expanding ring: search one hop further for the same product, still avoiding a seller that just failed
+            self.log.info('ring_expanded', "No seller of {product} within {hops} hops. Expanding the search to {next_hops} hops.",
+                          product=product_name, hops=ring_ttl, next_hops=ring_ttl + 1)
+            # Not on the timer thread, which every peer's timeouts share
+            self.spawn(self.lookup_item, product_name, self.max_distance, stale_seller_id, ring_ttl + 1)
+            return
+        self.log.info('timeout', "No response received for {product}. Timing out and selecting another item.", product=product_name)
+        remaining_items = [item for item in self.available_items if item != product_name]
+        if not remaining_items:
+            self.log.info('no_items', "No other items to look up besides {product}. Shutting down.", product=product_name)
+            self.shutdown_peer()
+            return
+        new_product = random.choice(remaining_items)
+        self.log.info('new_product', "Searching for a new product: {product}", product=new_product)
+        self.spawn(self.lookup_item, new_product, self.max_distance)
 
     def send_message(self, addr, message):
         """Send a message to a specific address."""
         try:
-            serialized_message = pickle.dumps(message)
-            self.socket.sendto(serialized_message, addr)
+            if self.tracer is not None:
+                self.tracer.stamp(message)
+            serialized_message = encode(message, WIRE_FORMAT)
+            self.transmit(serialized_message, addr)
+            self.messages_sent[message.get('type')] += 1
         except Exception as e:
-            print(f"[{self.peer_id}] Error sending message to {addr}: {e}")
+            self.log.error('send_failed', "Error sending message to {addr}: {error}", addr=addr, error=str(e))
+
+    def send_to_all(self, addrs, message):
+        """Send one message to several addresses, encoding it once."""
+        try:
+            if self.tracer is not None:
+                self.tracer.stamp(message)
+            serialized_message = encode(message, WIRE_FORMAT)
+        except Exception as e:
+            self.log.error('send_failed', "Error encoding message for {count} peers: {error}", count=len(addrs), error=str(e))
+            return
+        message_type = message.get('type')
+        for addr in addrs:
+            try:
+                self.transmit(serialized_message, addr)
+                self.messages_sent[message_type] += 1
+            except Exception as e:
+                self.log.error('send_failed', "Error sending message to {addr}: {error}", addr=addr, error=str(e))
+
+    def transmit(self, data, addr):
+        """Put an already serialized message on the wire."""
+        self.socket.sendto(data, addr)
 
     def handle_lookup(self, message, addr):
         """Handle a lookup request from a buyer or peer."""
         req_id = message['request_id']
-        if req_id not in self.cache:
-            if len(self.cache) > self.cache_size:
-                # Evict the first item
-                first_key = next(iter(self.cache))
-                del self.cache[first_key]
-
-            self.cache[req_id] = message
+        # Walkers may revisit a peer, so only flooded lookups are deduplicated
+        if message.get('walker') or not self.seen_requests.check_and_add(req_id):
             buyer_id = message['buyer_id']
             product_name = message['product_name']
             hopcount = message['hop_count']
             search_path = message['search_path']
     
+            if self.routing_mode == 'reverse' and buyer_id != self.peer_id:
+                # Remember the previous hop so a reply can retrace the lookup; not at
+                # the buyer, which a walker may pass through again, or its reply would leave
+                self.reverse_routes.setdefault(req_id, addr)
+
+            has_product = self.role == 'seller' and self.item == product_name and self.stock > 0
+            cached_seller = None
+            if not has_product and self.use_query_hit_cache:
+                cached_seller = self.query_hit_cache.get(product_name)
+                if cached_seller is not None and cached_seller[0] == message.get('stale_seller_id'):
+                    # The buyer just failed to buy from this seller: forget it and keep searching
+                    self.query_hit_cache.pop(product_name)
+                    cached_seller = None
+
             # If this peer is a seller and has the requested product, reply to the buyer
-            if self.role == 'seller' and self.item == product_name and self.stock > 0:
-                next_peer_info = search_path[-1]
-                addr = (next_peer_info[1], next_peer_info[2])
-                reply_message = ReplyMessage(
-                    self.peer_id,
-                    reply_path=search_path[:-1],
-                    seller_addr=(self.ip_address, self.port),
-                    product_name=product_name,
-                    request_id=req_id
-                ).to_dict()
-    
-                self.send_message(addr, reply_message)
-                print(f"[{self.peer_id}] Sent reply for {req_id} to peer {next_peer_info[0]} for item {product_name}")
-    
+            if has_product:
+                self.send_reply(message, addr, self.peer_id, (self.ip_address, self.port))
+                self.log.debug('reply', "Sent reply for {request_id} to peer {peer} for item {product}",
+                               request_id=req_id, peer=message.get('last_peer_id'), product=product_name)
+
+            # Answer for a seller we recently relayed a reply from, instead of flooding further
+            elif cached_seller is not None:
+                seller_id, seller_addr = cached_seller
+                self.send_reply(message, addr, seller_id, seller_addr, from_cache=True)
+                self.log.debug('cached_reply', "Sent cached reply for {request_id} to peer {peer}: seller {seller} has {product}",
+                               request_id=req_id, peer=message.get('last_peer_id'), seller=seller_id, product=product_name)
+
             # If hopcount > 0, propagate the lookup to neighbors
             elif hopcount > 0:
-                search_path.append((self.peer_id, self.ip_address, self.port))
+                if self.routing_mode == 'path':
+                    search_path.append((self.peer_id, self.ip_address, self.port))
                 hopcount_new = hopcount - 1
-                for neighbor in self.neighbors:
-                    # Avoid sending the message back to the peer it came from
-                    if neighbor.peer_id != message.get('last_peer_id', -1):
-                        lookup_message = LookupMessage(
-                            req_id,
-                            buyer_id,
-                            product_name,
-                            hopcount_new,
-                            search_path.copy()
-                        ).to_dict()
-                        lookup_message['last_peer_id'] = self.peer_id
-                        print(f"[{self.peer_id}] Forwarding lookup for {product_name} to Peer {neighbor.peer_id}")
-                        self.send_message((neighbor.ip_address, neighbor.port), lookup_message)
+                if message.get('walker'):
+                    walker_message = LookupMessage(req_id, buyer_id, product_name, hopcount_new, search_path).to_dict()
+                    # last_peer_id stays the previous hop until step_walker sends the walker on
+                    for key in ('stale_seller_id', 'walker', 'buyer_addr', 'last_peer_id'):
+                        if key in message:
+                            walker_message[key] = message[key]
+                    self.continue_walk(walker_message)
+                    return
+                self.forward_lookup(message, hopcount_new, search_path)
             elif hopcount == 0:
-                print(f"[{self.peer_id}] Hopcount 0 reached for request {req_id}. Discarding message.")
-                    # Discard the message without sending 'no_seller' back
+                self.log.debug('hop_exhausted', "Hopcount 0 reached for request {request_id}. Discarding message.", request_id=req_id)
+                # Discard the message without sending 'no_seller' back
+                self.metrics.incr('dropped', 'lookup')
+                self.metrics.incr('events', 'hop_exhausted')
+        else:
+            self.metrics.incr('dropped', 'lookup')
+            self.metrics.incr('events', 'duplicate_lookup')
+
+    def forward_lookup(self, message, hop_count, search_path):
+        """
+        Flood a lookup on with hop_count hops left. Every neighbor gets the same
+        message, so it is built and encoded once and the buffer sent to each.
+        """
+        # Avoid sending the message back to the peer it came from
+        targets = [neighbor for neighbor in self.lookup_targets(message['product_name'], hop_count)
+                   if neighbor.peer_id != message.get('last_peer_id', -1)]
+        if not targets:
+            return
+        lookup_message = LookupMessage(
+            message['request_id'],
+            message['buyer_id'],
+            message['product_name'],
+            hop_count,
+            search_path
+        ).to_dict()
+        lookup_message['last_peer_id'] = self.peer_id
+        for key in ('stale_seller_id', 'buyer_addr'):
+            if key in message:
+                lookup_message[key] = message[key]
+        if self.log.enabled(DEBUG):
+            self.log.debug('forward', "Forwarding lookup for {product} to Peers {neighbors}",
+                           product=message['product_name'], neighbors=[neighbor.peer_id for neighbor in targets])
+        self.send_to_all([(neighbor.ip_address, neighbor.port) for neighbor in targets], lookup_message)
+        self.metrics.incr('forwarded', 'lookup', len(targets))
+
+    def continue_walk(self, message):
+        """
+        Send a walker on to one random neighbor. Every WALK_CHECK_INTERVAL hops it is
+        parked instead, and the buyer is asked whether its lookup is still open; not
+        before its last hop, which is cheaper to take than a round trip to the buyer.
+        """
+        if message['hop_count'] > 0 and message['hop_count'] % WALK_CHECK_INTERVAL == 0:
+            self.parked_walkers.setdefault(message['request_id'], []).append(message)
+            check_message = WalkCheckMessage(message['request_id'], self.peer_id).to_dict()
+            self.send_message(tuple(message['buyer_addr']), check_message)
+            return
+        self.step_walker(message)
+
+    def step_walker(self, message):
+        """Forward a walker to a random neighbor, avoiding the one it came from when possible."""
+        candidates = [n for n in self.neighbors if n.peer_id != message.get('last_peer_id')] or self.neighbors
+        neighbor = random.choice(candidates)
+        message['last_peer_id'] = self.peer_id
+        self.log.debug('walk', "Walking lookup for {product} to Peer {neighbor}", product=message['product_name'], neighbor=neighbor.peer_id)
+        self.send_message((neighbor.ip_address, neighbor.port), message)
+        self.metrics.incr('forwarded', 'lookup')
+
+    def handle_walk_check(self, message, addr):
+        """A peer holding one of our walkers asks whether the lookup still needs it."""
+        with self.pending_requests_lock:
+            entry = self.pending_requests.get(message['request_id'])
+            active = entry is not None and entry[4] == 'lookup'
+        self.send_message(addr, WalkStatusMessage(message['request_id'], active).to_dict())
+
+    def handle_walk_status(self, message):
+        """Release the walkers parked for a lookup, or drop them if the buyer is done."""
+        walkers = self.parked_walkers.pop(message['request_id'], [])
+        if not message['active']:
+            self.log.debug('walkers_stopped', "Stopping {count} walker(s) for {request_id}: the lookup is finished.",
+                           count=len(walkers), request_id=message['request_id'])
+            self.metrics.incr('dropped', 'lookup', len(walkers))
+            return
+        for walker_message in walkers:
+            self.step_walker(walker_message)
+
+    def send_reply(self, message, addr, seller_id, seller_addr, from_cache=False):
+        """
+        Send a ReplyMessage for a lookup towards the buyer: back along the lookup's path,
+        or in 'direct' reply mode straight to the buyer if the lookup says where it is.
+        """
+        search_path = message['search_path']
+        if self.routing_mode == 'reverse':
+            reply_path = []
+        else:
+            next_peer_info = search_path[-1]
+            addr = (next_peer_info[1], next_peer_info[2])
+            reply_path = search_path[:-1]
+        reply_message = ReplyMessage(
+            seller_id,
+            reply_path=reply_path,
+            seller_addr=seller_addr,
+            product_name=message['product_name'],
+            request_id=message['request_id']
+        ).to_dict()
+        if from_cache:
+            reply_message['from_cache'] = True
+
+        buyer_addr = self.buyer_address(message) if self.reply_mode == 'direct' else None
+        if buyer_addr is not None:
+            # The path copy is only worth sending if it passes through relays
+            notify = self.reply_notify_path and addr != buyer_addr
+            if notify:
+                # Both copies name this peer, so the buyer can tell which two belong together
+                reply_message['replier_id'] = self.peer_id
+            direct_message = dict(reply_message, reply_path=[], direct=True)
+            self.send_message(buyer_addr, direct_message)
+            if not notify:
+                return
+            reply_message['notify'] = True
+        self.send_message(addr, reply_message)
+
+    def buyer_address(self, message):
+        """The address of the buyer that sent a lookup, or None if the lookup does not carry it."""
+        if 'buyer_addr' in message:
+            return tuple(message['buyer_addr'])
+        search_path = message['search_path']
+        if self.routing_mode == 'path' and search_path:
+            return (search_path[0][1], search_path[0][2])
+        return None
+
+    def pair_reply_copy(self, reply_message, kind, elapsed):
+        """Keep the latency of one copy of a reply sent both ways until the other copy arrives, then record both."""
+        key = (reply_message['request_id'], reply_message['replier_id'])
+        other = self.reply_copies.pop(key)
+        if other is None:
+            self.reply_copies.put(key, (kind, elapsed))
+            return
+        other_kind, other_elapsed = other
+        self.paired_reply_latency[kind].record(elapsed)
+        self.paired_reply_latency[other_kind].record(other_elapsed)
 
     def handle_reply(self, message):
         """Handle a reply recursively."""
         reply_message = message
         reply_path = reply_message["reply_path"]
 
-        if len(reply_path) != 0:
+        sent_at = self.lookups_sent.get(reply_message['request_id']) if self.role == 'buyer' else None
+        if sent_at is not None:
+            kind = 'direct' if reply_message.get('direct') else 'relayed'
+            elapsed = self.clock_ns() - sent_at
+            self.reply_latency[kind].record(elapsed)
+            if 'replier_id' in reply_message:
+                self.pair_reply_copy(reply_message, kind, elapsed)
+
+        if self.use_query_hit_cache and not reply_message.get('from_cache') and (self.routing_mode == 'reverse' or len(reply_path) != 0):
+            # We are relaying a seller's own reply: remember who sells the product.
+            # Replies answered from a cache are not cached again, so stale entries cannot spread.
+            self.query_hit_cache.put(reply_message['product_name'], (reply_message['seller_id'], reply_message['seller_addr']))
+
+        if self.routing_mode == 'reverse':
+            next_addr = self.reverse_routes.get(reply_message['request_id'])
+            if next_addr is not None:
+                self.send_message(next_addr, reply_message)
+                self.metrics.incr('forwarded', 'reply')
+                self.log.debug('relay_reply', "Sent reply to {addr} for item {product} with id {request_id}",
+                               addr=next_addr, product=reply_message['product_name'], request_id=reply_message['request_id'])
+                return
+        elif len(reply_path) != 0:
             next_peer_info = reply_path[-1]
             addr = (next_peer_info[1], next_peer_info[2])
             reply_message["reply_path"] = reply_path[:-1]
             self.send_message(addr, reply_message)
-            print(f"[{self.peer_id}] Sent reply to peer {next_peer_info[0]} for item {reply_message['product_name']} with id {reply_message['request_id']}")
+            self.metrics.incr('forwarded', 'reply')
+            self.log.debug('relay_reply', "Sent reply to peer {peer} for item {product} with id {request_id}",
+                           peer=next_peer_info[0], product=reply_message['product_name'], request_id=reply_message['request_id'])
+            return
+
+        # The reply has reached the peer that started the lookup
+        if self.role == 'buyer':
+            # Only the first reply to a lookup still pending leads to a buy; later replies
+            # (from other sellers, or after the timeout) would buy the same item twice
+            if not self.complete_pending_request(reply_message["request_id"], 'lookup'):
+                if reply_message.get('notify'):
+                    # The path copy of a reply whose direct copy got here first
+                    self.metrics.incr('events', 'path_notify')
+                    return
+                self.log.debug('late_reply', "Ignoring reply from seller {seller} for a finished lookup", seller=reply_message['seller_id'])
+                self.metrics.incr('dropped', 'reply')
+                self.metrics.incr('events', 'late_reply')
+                return
+            self.lookups_succeeded += 1
+            # As a buyer, decide to buy the item
+            self.log.debug('buy', "Deciding to buy item {product} from seller {seller}",
+                           product=reply_message['product_name'], seller=reply_message['seller_id'])
+            buy_message = BuyMessage(
+                reply_message["request_id"],
+                self.peer_id,
+                reply_message['seller_id'],
+                reply_message['product_name']
+            ).to_dict()
+            seller_addr = reply_message['seller_addr']
+            # The buy is pending until its confirmation arrives, like a direct buy
+            self.add_pending_request(reply_message["request_id"], reply_message['product_name'], stage='buy')
+            self.send_message(seller_addr, buy_message)
+            if self.use_seller_cache:
+                self.seller_cache.put(reply_message['product_name'], (reply_message['seller_id'], seller_addr))
+        elif self.routing_mode == 'reverse':
+            self.log.debug('no_route', "No route back for reply {request_id}. Discarding message.", request_id=reply_message['request_id'])
+            self.metrics.incr('dropped', 'reply')
+            self.metrics.incr('events', 'no_route')
         else:
-            if self.role == 'buyer':
-                # As a buyer, decide to buy the item
-                print(f"[{self.peer_id}] Deciding to buy item {reply_message['product_name']} from seller {reply_message['seller_id']}")
-                buy_message = BuyMessage(
-                    reply_message["request_id"],
-                    self.peer_id,
-                    reply_message['seller_id'],
-                    reply_message['product_name']
-                ).to_dict()
-                seller_addr = reply_message['seller_addr']
-                self.send_message(seller_addr, buy_message)
-                # Remove from pending requests
-                with self.pending_requests_lock:
-                    if reply_message["request_id"] in self.pending_requests:
-                        del self.pending_requests[reply_message["request_id"]]
-            else:
-                print(f"[{self.peer_id}] Received reply but not the buyer.")
+            self.log.warning('stray_reply', "Received reply but not the buyer.")
+            self.metrics.incr('dropped', 'reply')
 
     def handle_buy(self, message, addr):
         """Handle a buy request from a buyer."""
         with self.lock:
             if self.stock > 0 and self.item == message["product_name"]:
                 self.stock -= 1
-                print(f"[{self.peer_id}] Sold item to buyer {message['buyer_id']}. Remaining stock: {self.stock}")
+                self.log.info('sold', "Sold item to buyer {buyer}. Remaining stock: {stock}", buyer=message['buyer_id'], stock=self.stock)
                 buy_confirmation_reply = BuyConfirmationMessage(
                     message["request_id"],
                     message["product_name"],
@@ -205,13 +635,16 @@ class Peer:
                     status=True
                 ).to_dict()
                 self.send_message(addr, buy_confirmation_reply)
-            if self.stock == 0:
-                # Seller picks another item at random
-                previous_item = self.item
-                self.item = random.choice(self.available_items)
-                self.stock = SELLER_STOCK  # Reset stock to SELLER_STOCK
-                print(f"[{self.peer_id}] Sold out of {previous_item}. Now selling {self.item}")
+                if self.stock == 0:
+                    # Seller picks another item at random
+                    previous_item = self.item
+                    self.item = random.choice(self.available_items)
+                    self.stock = SELLER_STOCK  # Reset stock to SELLER_STOCK
+                    self.log.info('restock', "Sold out of {previous}. Now selling {item}", previous=previous_item, item=self.item)
+                    if self.item != previous_item:
+                        self.advertise_routing_index()
             else:
+                self.metrics.incr('events', 'sale_refused')
                 buy_confirmation_reply = BuyConfirmationMessage(
                     message["request_id"],
                     message["product_name"],
@@ -227,45 +660,63 @@ class Peer:
 
         # Check if the confirmation is for the current buyer
         if confirmation_message.buyer_id == self.peer_id:
+            # Only a buy still pending counts: once its timeout fired, the buyer has
+            # already moved on, and acting on it would start a second chain of buys
+            if not self.complete_pending_request(confirmation_message.request_id, 'buy'):
+                self.log.debug('late_confirmation', "Ignoring confirmation from seller {seller} for a finished buy", seller=confirmation_message.seller_id)
+                self.metrics.incr('dropped', 'buy_confirmation')
+                self.metrics.incr('events', 'late_confirmation')
+                return
             if confirmation_message.status:
                 # Purchase was successful
                 self.items_bought += 1
-                timestamp = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S.%f")[:-3]
-                print(f"{timestamp} [{self.peer_id}] bought product {confirmation_message.product_name} from seller {confirmation_message.seller_id}")
+                if self.transaction_started is not None:
+                    self.latency.record(self.clock_ns() - self.transaction_started)
+                    self.transaction_started = None
+                    self.trace_id = None
+                if self.tracer is not None:
+                    self.tracer.annotate(done=True)  # The end of the transaction's critical path
+                self.log.info('bought', "bought product {product} from seller {seller}",
+                              product=confirmation_message.product_name, seller=confirmation_message.seller_id)
 
                 if self.items_bought == self.max_transactions:
-                    self.end_time = time.time()
+                    self.end_time = self.now()
                     # average_rtt =  (self.end_time - self.start_time)/self.max_transactions
                     average_rtt = (self.end_time - self.start_time)/self.max_transactions
-                    print(f"[{self.peer_id}] Max transactions reached with average rtt {average_rtt:.4f}.\nShutting down peer.")
+                    self.log.info('done', "Max transactions reached with average rtt {rtt:.4f}. Shutting down peer.", rtt=average_rtt)
                     self.average_rtt = average_rtt
                     self.shutdown_peer()
                 elif random.random() < BUY_PROBABILITY:
-                    print(f"[{self.peer_id}] Buyer decided to continue looking for another item.")
+                    self.log.debug('continue', "Buyer decided to continue looking for another item.")
                     remaining_items = [item for item in self.available_items if item != confirmation_message.product_name]
                     new_product = random.choice(remaining_items)
-                    threading.Thread(target=self.lookup_item, args=(new_product, self.max_distance)).start()
+                    self.spawn(self.lookup_item, new_product, self.max_distance)
                 else:
-                    print(f"[{self.peer_id}] Buyer is satisfied and stops buying.")
+                    self.log.info('satisfied', "Buyer is satisfied and stops buying.")
                     self.shutdown_peer()
             else:
                 # Purchase failed
-                print(f"[{self.peer_id}] Purchase of {confirmation_message.product_name} from seller {confirmation_message.seller_id} failed.")
-                print(f"[{self.peer_id}] Buyer will search for another seller for {confirmation_message.product_name}.")
-                threading.Thread(target=self.lookup_item, args=(confirmation_message.product_name, self.max_distance)).start()
-            # Remove from pending requests
-            with self.pending_requests_lock:
-                if confirmation_message.request_id in self.pending_requests:
-                    del self.pending_requests[confirmation_message.request_id]
+                self.metrics.incr('events', 'buy_failed')
+                self.log.info('buy_failed', "Purchase of {product} from seller {seller} failed. Buyer will search for another seller.",
+                              product=confirmation_message.product_name, seller=confirmation_message.seller_id)
+                # The seller sold out or switched products, so stop buying from it directly
+                self.seller_cache.pop(confirmation_message.product_name)
+                self.spawn(self.lookup_item, confirmation_message.product_name, self.max_distance, confirmation_message.seller_id)
         else:
-            print(f"[{self.peer_id}] Received buy confirmation not intended for this peer.")
+            self.log.warning('stray_confirmation', "Received buy confirmation not intended for this peer.")
+            self.metrics.incr('dropped', 'buy_confirmation')
 
-    def lookup_item(self, product_name=None, hopcount=3):
-        """Buyers can send lookup messages to their neighbors."""
+    def lookup_item(self, product_name=None, hopcount=3, stale_seller_id=None, ring_ttl=None):
+        """
+        Buyers can send lookup messages to their neighbors.
+        stale_seller_id names a seller a buy just failed with, so peers do not answer with it from their caches.
+        ring_ttl is the number of hops this ring of an expanding-ring search covers
+        (RING_START_TTL when a search starts); flood lookups ignore it.
+        """
         if product_name is None:
             remaining_items = [item for item in self.available_items if item not in self.looked_up_items]
             if not remaining_items: # Incase the buyer can not find any sellers for any products [In this case would not happen]
-                print(f"[{self.peer_id}] No more items to look up. Shutting down.")
+                self.log.info('no_items', "No more items to look up. Shutting down.")
                 self.shutdown_peer()
                 return
             product_name = random.choice(remaining_items)
@@ -273,43 +724,155 @@ class Peer:
         else:
             self.looked_up_items.add(product_name)
 
-        id_string = str(self.peer_id) + product_name + str(time.time())
+        id_string = str(self.peer_id) + product_name + str(self.now()) + str(next(self.request_counter))
         if self.role == 'buyer':
             request_id = hashlib.sha256(id_string.encode('utf-8')).hexdigest()
-            lookup_message = {
-                'request_id': request_id,
-                'type': 'lookup',
-                'buyer_id': self.peer_id,
-                'product_name': product_name,
-                'hop_count': hopcount,
-                'search_path': [(self.peer_id, self.ip_address, self.port)],
-                'last_peer_id': self.peer_id
-            }
-
-            timestamp = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S.%f")[:-3]
-            print(f"{timestamp} [{self.peer_id}] Initiating lookup for {product_name}")
-            # print(f"[{self.peer_id} Lookup Message: {look}]")
             if self.start_time is None:
-                self.start_time = time.time()
+                self.start_time = self.now()
+            if self.transaction_started is None:
+                self.transaction_started = self.clock_ns()
+                if self.tracer is not None:
+                    self.trace_id = self.tracer.new_trace()
+
+            # The lookup or direct buy starts this attempt's chain of hops
+            with self.trace_span('start'):
+                cached_seller = self.seller_cache.get(product_name) if self.use_seller_cache else None
+                if cached_seller is not None:
+                    # Fast path: buy straight from the seller we bought this product from recently
+                    seller_id, seller_addr = cached_seller
+                    buy_message = BuyMessage(request_id, self.peer_id, seller_id, product_name).to_dict()
+                    self.log.debug('direct_buy', "Buying {product} directly from cached seller {seller}", product=product_name, seller=seller_id)
+                    self.add_pending_request(request_id, product_name, stage='buy')
+                    self.send_message(seller_addr, buy_message)
+                    return
+
+                if self.lookup_strategy == 'expanding_ring':
+                    if ring_ttl is None:
+                        ring_ttl = RING_START_TTL
+                    # A lookup with hop_count h travels h + 1 hops
+                    hopcount = ring_ttl - 1
+                else:
+                    ring_ttl = None
+                if self.lookup_strategy == 'random_walk':
+                    hopcount = WALK_MAX_HOPS
+
+                lookup_message = {
+                    'request_id': request_id,
+                    'type': 'lookup',
+                    'buyer_id': self.peer_id,
+                    'product_name': product_name,
+                    'hop_count': hopcount,
+                    'search_path': [(self.peer_id, self.ip_address, self.port)] if self.routing_mode == 'path' else [],
+                    'last_peer_id': self.peer_id
+                }
+                if stale_seller_id is not None:
+                    lookup_message['stale_seller_id'] = stale_seller_id
+                if self.lookup_strategy == 'random_walk':
+                    lookup_message['walker'] = True
+                if self.lookup_strategy == 'random_walk' or (self.reply_mode == 'direct' and self.routing_mode == 'reverse'):
+                    # Walkers and direct replies need the buyer's address, which only a search path carries
+                    lookup_message['buyer_addr'] = (self.ip_address, self.port)
+                # Never handle our own lookup when the flood comes back around
+                self.seen_requests.add(request_id)
+
+                self.log.debug('lookup', "Initiating lookup for {product} with hopcount {hopcount}", product=product_name, hopcount=hopcount)
+                if self.lookup_strategy == 'random_walk':
+                    # Walkers start on distinct neighbors; only with fewer neighbors than walkers do some share one
+                    targets = random.sample(self.neighbors, min(RANDOM_WALKERS, len(self.neighbors)))
+                    if self.neighbors:
+                        targets += [random.choice(self.neighbors) for _ in range(RANDOM_WALKERS - len(targets))]
+                else:
+                    targets = self.lookup_targets(product_name, hopcount)
+                # Add to pending requests before sending, so a fast reply finds it;
+                # the timeout fires if nothing answers in time
+                self.add_pending_request(request_id, product_name, ring_ttl, stale_seller_id=stale_seller_id)
+                self.lookups_sent.put(request_id, self.clock_ns())
+                self.send_to_all([(neighbor.ip_address, neighbor.port) for neighbor in targets], lookup_message)
+
+    def ring_max_ttl(self):
+        """Widest ring of an expanding-ring search; by default as far as a flood lookup goes."""
+        return RING_MAX_TTL if RING_MAX_TTL is not None else self.max_distance + 1
+
+    def lookup_targets(self, product_name, hops_left):
+        """
+        Neighbors to send a lookup for product_name to, when it may travel hops_left
+        more hops past them. With routing indexes these are the neighbors whose index
+        has the product within reach; if none has and the lookup reaches past what the
+        indexes cover, it falls back to flooding.
+        """
+        if self.lookup_forwarding != 'routing_index':
+            return self.neighbors
+        with self.routing_index_lock:
+            targets = []
+            for neighbor in self.neighbors:
+                index = self.neighbor_indexes.get(neighbor.peer_id)
+                distance = index.distance(product_name) if index is not None else None
+                if distance is not None and distance <= hops_left:
+                    targets.append(neighbor)
+        if not targets and hops_left >= ROUTING_INDEX_DEPTH:
+            return self.neighbors
+        return targets
+
+    def build_routing_index(self, neighbor_id):
+        """Index to advertise to neighbor_id: our own item, then what our other neighbors can reach."""
+        index = AttenuatedBloomFilter(ROUTING_INDEX_DEPTH, ROUTING_INDEX_BITS, ROUTING_INDEX_HASHES)
+        if self.role == 'seller' and self.item is not None:
+            index.add(self.item)
+        for other_id, other_index in self.neighbor_indexes.items():
+            if other_id != neighbor_id:
+                index.merge_shifted(other_index)
+        return index
+
+    def advertise_routing_index(self):
+        """Send each neighbor our routing index, if it changed since we last sent it."""
+        if self.lookup_forwarding != 'routing_index':
+            return
+        updates = []
+        with self.routing_index_lock:
             for neighbor in self.neighbors:
-                print(f"[{self.peer_id}] Looking for {product_name} with neighbor {neighbor.peer_id}")
-                self.send_message((neighbor.ip_address, neighbor.port), lookup_message)
-            # Add to pending requests with a timestamp
-            with self.pending_requests_lock:
-                self.pending_requests[request_id] = (product_name, time.time())
+                levels = self.build_routing_index(neighbor.peer_id).to_wire()
+                if self.advertised_indexes.get(neighbor.peer_id) != levels:
+                    self.advertised_indexes[neighbor.peer_id] = levels
+                    updates.append((neighbor, levels))
+        for neighbor, levels in updates:
+            update_message = RoutingUpdateMessage(self.peer_id, levels).to_dict()
+            self.send_message((neighbor.ip_address, neighbor.port), update_message)
+
+    def handle_routing_update(self, message):
+        """Store a neighbor's routing index and pass the change on to our other neighbors."""
+        index = AttenuatedBloomFilter.from_wire(message['levels'], ROUTING_INDEX_HASHES)
+        with self.routing_index_lock:
+            if self.neighbor_indexes.get(message['sender_id']) == index:
+                return
+            self.neighbor_indexes[message['sender_id']] = index
+        self.advertise_routing_index()
+
+    def set_neighbors(self, neighbors):
+        """Replace the neighbor list as the overlay changes, forgetting the routing indexes of departed neighbors."""
+        kept = {neighbor.peer_id for neighbor in neighbors}
+        self.neighbors = neighbors
+        with self.routing_index_lock:
+            for peer_id in list(self.neighbor_indexes):
+                if peer_id not in kept:
+                    del self.neighbor_indexes[peer_id]
+            for peer_id in list(self.advertised_indexes):
+                if peer_id not in kept:
+                    del self.advertised_indexes[peer_id]
+        self.advertise_routing_index()
 
     def display_network(self):
-        """Print network structure for this peer."""
+        """Log network structure for this peer."""
         neighbor_ids = [neighbor.peer_id for neighbor in self.neighbors]
-        print(f"Peer {self.peer_id} ({self.role}) connected to peers {neighbor_ids}")
+        self.log.info('network', "Peer {peer} ({role}) connected to peers {neighbors}", peer=self.peer_id, role=self.role, neighbors=neighbor_ids)
 
     def shutdown_peer(self):
         """Shutdown the peer."""
-        print(f"[{self.peer_id}] Shutting down peer.")
+        self.log.info('shutdown', "Shutting down peer.")
         self.running = False
+        self.cancel_pending_requests()
         self.socket.close()
         # The thread will exit when the method returns
 
     def handle_no_seller(self, message):
         """Handle the 'no_seller' message, which should not occur since we discard messages at hopcount zero."""
-        print(f"[{self.peer_id}] Received unexpected 'no_seller' message.")
+        self.log.warning('no_seller', "Received unexpected 'no_seller' message.")
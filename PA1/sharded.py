@@ -0,0 +1,244 @@
+# sharded.py
+"""
+Run one simulation across several worker processes.
+
+The coordinator picks roles, items and the topology, then hands each worker a
+shard of the peers. Peers address their neighbors through a peer directory
+(peer_id -> ip, port), so a neighbor may live in any process. Workers report
+when their buyers are done; once every shard has, the coordinator stops them
+all and merges the per-worker RTT and message counts.
+
+Usage: python sharded.py <number_of_peers> <number_of_workers> [threaded|asyncio] [flood|expanding_ring|random_walk]
+"""
+import asyncio
+import multiprocessing
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import config
+from utils.histogram import LatencyHistogram
+from utils.network_utils import adjacency_diameter
+from utils.peer_directory import build_directory, neighbor_refs, partition
+from utils.topology import load_or_build
+
+ITEMS = ["fish", "salt", "boar"]
+STARTUP_TIMEOUT = 60  # Seconds every worker has to bind its sockets before the run is abandoned
+POLL_INTERVAL = 1.0  # Seconds between the coordinator's checks that no worker has died
+
+
+def assign_roles(num_peers):
+    """peer_id -> (role, item), with at least one buyer and one seller, as in main.py."""
+    specs = {}
+    buyers = sellers = 0
+    for i in range(num_peers):
+        if i == num_peers - 2 and buyers == 0:
+            role = 'buyer'
+        elif i == num_peers - 1 and sellers == 0:
+            role = 'seller'
+        else:
+            role = random.choice(["buyer", "seller"])
+        buyers += role == 'buyer'
+        sellers += role == 'seller'
+        specs[i] = (role, random.choice(ITEMS) if role == 'seller' else None)
+    return specs
+
+
+def run_shard(shard, peer_specs, directory, hopcount, runtime, lookup_strategy, barrier, stop_event, results):
+    """
+    Worker process body. peer_specs is a list of (peer_id, role, item, neighbor_ids).
+    Puts ('buyers_done', shard) and then ('result', shard, stats) on results.
+    """
+    from peer import Peer
+    from async_peer import AsyncPeer
+
+    peer_class = AsyncPeer if runtime == 'asyncio' else Peer
+    peers = []
+    try:
+        for peer_id, role, item, neighbor_ids in peer_specs:
+            ip_address, port = directory[peer_id]
+            peer = peer_class(peer_id=peer_id, role=role, neighbors=neighbor_refs(directory, neighbor_ids),
+                              port=port, ip_address=ip_address, item=item)
+            peer.max_distance = hopcount
+            peer.hop_count = hopcount
+            peer.lookup_strategy = lookup_strategy
+            peers.append(peer)
+        # Every socket of every shard is bound before anyone sends
+        barrier.wait(STARTUP_TIMEOUT)
+    except BaseException:
+        # e.g. a port already in use: release the other shards from the barrier, then exit with the error
+        barrier.abort()
+        raise
+    buyers = [peer for peer in peers if peer.role == 'buyer']
+
+    if runtime == 'asyncio':
+        asyncio.run(_run_shard_async(shard, peers, buyers, hopcount, stop_event, results))
+    else:
+        for peer in peers:
+            peer.start_peer()
+        for buyer in buyers:
+            threading.Thread(target=buyer.lookup_item, args=(random.choice(ITEMS), hopcount)).start()
+        while any(buyer.running for buyer in buyers):
+            time.sleep(0.2)
+        results.put(('buyers_done', shard))
+        # Sellers keep serving the other shards' buyers until the coordinator says stop
+        stop_event.wait()
+        for peer in peers:
+            if peer.running:
+                peer.running = False
+                peer.socket.close()
+        for peer in peers:
+            peer.thread.join()
+
+    results.put(('result', shard, shard_stats(peers, buyers)))
+
+
+async def _run_shard_async(shard, peers, buyers, hopcount, stop_event, results):
+    for peer in peers:
+        await peer.start()
+    for buyer in buyers:
+        buyer.spawn(buyer.lookup_item, random.choice(ITEMS), hopcount)
+    while any(buyer.running for buyer in buyers):
+        await asyncio.sleep(0.2)
+    results.put(('buyers_done', shard))
+    while not stop_event.is_set():
+        await asyncio.sleep(0.2)
+    for peer in peers:
+        if peer.running:
+            peer.running = False
+            peer.transport.close()
+    await asyncio.sleep(0)
+
+
+def shard_stats(peers, buyers):
+    """What a worker sends back: per-buyer results and the shard's message counts."""
+    messages_sent = Counter()
+    for peer in peers:
+        messages_sent.update(peer.messages_sent)
+    return {
+        'buyers': [{
+            'buyer_id': buyer.peer_id,
+            # average_rtt is only measured once a buyer reaches max_transactions
+            'average_rtt': buyer.average_rtt if buyer.end_time is not None else None,
+            'items_bought': buyer.items_bought,
+            'lookups_succeeded': buyer.lookups_succeeded,
+            'latency': buyer.latency.to_dict(),
+        } for buyer in buyers],
+        'messages_sent': dict(messages_sent),
+    }
+
+
+def check_workers(processes):
+    """Raise RuntimeError if a worker process has died."""
+    for shard, process in enumerate(processes):
+        if process.exitcode not in (None, 0):
+            raise RuntimeError(f"Worker for shard {shard} exited with code {process.exitcode}")
+
+
+def stop_workers(processes, barrier, stop_event):
+    """Stop every worker still running, whatever state it is in, and wait for them all."""
+    stop_event.set()
+    barrier.abort()
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+
+def main(N, workers, runtime='threaded', lookup_strategy=None):
+    from peer import LOOKUP_STRATEGY
+    lookup_strategy = lookup_strategy or LOOKUP_STRATEGY
+
+    specs = assign_roles(N)
+    adjacency = load_or_build(config.TOPOLOGY, N, config.TOPOLOGY_MAX_DEGREE, config.TOPOLOGY_SEED, config.TOPOLOGY_FILE)
+    for peer_id in range(N):
+        role, item = specs[peer_id]
+        print(f"Peer {peer_id} ({role}) connected to peers {adjacency[peer_id]}")
+
+    diameter = adjacency_diameter(adjacency)
+    print(f"Network diameter is {diameter}")
+    hopcount = max(1, diameter - 1)
+
+    directory = build_directory(range(N))
+    shards = partition(list(range(N)), workers)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    stop_event = context.Event()
+    barrier = context.Barrier(len(shards))
+    processes = []
+    for shard, peer_ids in enumerate(shards):
+        peer_specs = [(peer_id, *specs[peer_id], adjacency[peer_id]) for peer_id in peer_ids]
+        process = context.Process(target=run_shard, args=(
+            shard, peer_specs, directory, hopcount, runtime, lookup_strategy, barrier, stop_event, results))
+        process.start()
+        processes.append(process)
+    print(f"Started {len(shards)} worker processes ({runtime}) for {N} peers")
+
+    # Wait for every shard's buyers, then stop all shards and merge their results
+    shard_results = {}
+    done = 0
+    try:
+        while len(shard_results) < len(shards):
+            try:
+                message = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+            if message is None:
+                check_workers(processes)
+                continue
+            if message[0] == 'buyers_done':
+                done += 1
+                if done == len(shards):
+                    print("All buyers have shut down. Shutting down the workers.")
+                    stop_event.set()
+            else:
+                shard_results[message[1]] = message[2]
+    except BaseException:
+        # Do not leave the other workers running, and holding their ports, for the next run
+        stop_workers(processes, barrier, stop_event)
+        raise
+    for process in processes:
+        process.join()
+
+    buyers = sorted((b for stats in shard_results.values() for b in stats['buyers']), key=lambda b: b['buyer_id'])
+    messages_sent = Counter()
+    for stats in shard_results.values():
+        messages_sent.update(stats['messages_sent'])
+
+    print("\nRTT for each buyer:")
+    for data in buyers:
+        if data['average_rtt'] is None:
+            print(f"Buyer {data['buyer_id']} stopped after {data['items_bought']} items, before max transactions")
+        else:
+            print(f"Buyer {data['buyer_id']} average RTT: {data['average_rtt']:.4f} seconds")
+    measured = [b['average_rtt'] for b in buyers if b['average_rtt'] is not None]
+    if measured:
+        print(f"Mean RTT over {len(measured)} buyers in {len(shards)} workers: {sum(measured) / len(measured):.4f} seconds")
+    latency = LatencyHistogram.merged(LatencyHistogram.from_dict(b['latency']) for b in buyers)
+    print(f"Transaction latency: {latency.summary()}")
+
+    search_messages = sum(messages_sent[t] for t in ('lookup', 'reply', 'walk_check', 'walk_status'))
+    successful_lookups = sum(b['lookups_succeeded'] for b in buyers)
+    per_lookup = search_messages / successful_lookups if successful_lookups else float('nan')
+    print(f"Lookup strategy '{lookup_strategy}': {search_messages} search messages for "
+          f"{successful_lookups} successful lookups ({per_lookup:.1f} per successful lookup)")
+    return buyers
+
+
+if __name__ == '__main__':
+    runtimes = ('threaded', 'asyncio')
+    strategies = ('flood', 'expanding_ring', 'random_walk')
+    options = sys.argv[3:]
+    if len(sys.argv) < 3 or len(options) > 2 or any(o not in runtimes + strategies for o in options):
+        print(f"Usage: python sharded.py <number_of_peers> <number_of_workers> [{'|'.join(runtimes)}] [{'|'.join(strategies)}]")
+        sys.exit(1)
+    N = int(sys.argv[1])
+    workers = int(sys.argv[2])
+    runtime = next((o for o in options if o in runtimes), 'threaded')
+    lookup_strategy = next((o for o in options if o in strategies), None)
+    main(N, workers, runtime, lookup_strategy)
@@ -0,0 +1,173 @@
+# simulation.py
+"""
+Run the marketplace on the discrete-event engine in utils/des.py.
+
+SimPeer keeps every Peer handler and replaces only the runtime underneath:
+datagrams go through the simulator's in-memory network, timeouts and follow-up
+work are simulator events, and every timestamp reads the virtual clock. A run
+is single-threaded and seeded, so the same seed gives the same run.
+
+Usage: python simulation.py <number_of_peers> [--seed S] [--latency SPEC] [--loss P]
+                            [--until T] [--hopcount H] [--strategy S] [--quiet] [--churn INTERVAL]
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from peer import Peer, LOOKUP_STRATEGY
+import config
+from churn import Churn
+from sharded import assign_roles, ITEMS
+from utils.des import Simulator, parse_latency
+from utils.histogram import LatencyHistogram
+from utils.log import WARNING, configure as configure_log, shared_writer
+from utils.network_utils import adjacency_diameter
+from utils.topology import load_or_build
+from utils.tracing import finish_tracing
+
+
+class SimPeer(Peer):
+    """A Peer whose socket, clock and timers belong to a Simulator."""
+
+    def __init__(self, simulator, *args, **kwargs):
+        self.simulator = simulator
+        self.on_shutdown = None  # Called with the peer once it shuts down
+        super().__init__(*args, **kwargs)
+
+    def open_socket(self):
+        self.simulator.network.register((self.ip_address, self.port), self)
+        return None
+
+    def now(self):
+        return self.simulator.now
+
+    def clock_ns(self):
+        return int(self.simulator.now * 1e9)
+
+    def start_peer(self):
+        self.advertise_routing_index()
+
+    def spawn(self, target, *args):
+        self.simulator.call_soon(target, *args)
+
+    def schedule_timeout(self, delay, callback, *args):
+        return self.simulator.call_later(delay, callback, *args)
+
+    def transmit(self, data, addr):
+        self.simulator.network.send((self.ip_address, self.port), addr, data)
+
+    def shutdown_peer(self):
+        """Shutdown the peer."""
+        self.log.info('shutdown', "Shutting down peer.")
+        self.running = False
+        self.cancel_pending_requests()
+        self.simulator.network.unregister((self.ip_address, self.port))
+        if self.on_shutdown is not None:
+            self.on_shutdown(self)
+
+
+def run_simulation(simulator, peers, lookups, until=None, churn=None):
+    """
+    Start every peer and the (buyer, product_name, hopcount) lookups at virtual
+    time 0, then run until every buyer has shut down or the clock reaches until.
+    A Churn, if given, adds and removes peers meanwhile; buyers that join do not
+    hold the run open. Returns the number of events run.
+    """
+    buyers_alive = {buyer.peer_id for buyer, _, _ in lookups}
+    for buyer, _, _ in lookups:
+        buyer.on_shutdown = lambda peer: buyers_alive.discard(peer.peer_id)
+    for peer in peers:
+        peer.start_peer()
+    for buyer, product_name, hopcount in lookups:
+        buyer.spawn(buyer.lookup_item, product_name, hopcount)
+    if churn is not None:
+        churn.start()
+    return simulator.run(until=until, stop=lambda: not buyers_alive)
+
+
+def main(N, seed=0, latency='constant:0.001', loss_rate=0.0, until=None, hopcount=None, lookup_strategy=LOOKUP_STRATEGY, quiet=False,
+         churn_interval=None):
+    # Peer decisions use the random module; seeding it makes roles, topology and handlers reproducible
+    random.seed(seed)
+    simulator = Simulator(seed=seed, latency=parse_latency(latency), loss_rate=loss_rate)
+
+    specs = assign_roles(N)
+    adjacency = load_or_build(config.TOPOLOGY, N, config.TOPOLOGY_MAX_DEGREE, config.TOPOLOGY_SEED, config.TOPOLOGY_FILE)
+    if hopcount is None:
+        diameter = adjacency_diameter(adjacency)
+        print(f"Network diameter is {diameter}")
+        hopcount = max(1, diameter - 1)
+
+    peers = []
+    for peer_id in range(N):
+        role, item = specs[peer_id]
+        peers.append(SimPeer(simulator, peer_id=peer_id, role=role, neighbors=[], item=item, port=5000 + peer_id))
+    for peer in peers:
+        peer.neighbors = [peers[i] for i in adjacency[peer.peer_id]]
+        peer.max_distance = hopcount
+        peer.hop_count = hopcount
+        peer.lookup_strategy = lookup_strategy
+    buyers = [peer for peer in peers if peer.role == 'buyer']
+    lookups = [(buyer, random.choice(ITEMS), hopcount) for buyer in buyers]
+
+    churn = None
+    if churn_interval:
+        def make_peer(peer_id, role, item):
+            peer = SimPeer(simulator, peer_id=peer_id, role=role, neighbors=[], item=item, port=5000 + peer_id)
+            peer.lookup_strategy = lookup_strategy
+            return peer
+        churn = Churn(peers, adjacency, make_peer, simulator, ITEMS, churn_interval)
+
+    print(f"Simulating {N} peers ({len(buyers)} buyers), seed {seed}, latency {latency}, hopcount {hopcount}")
+    wall_start = time.perf_counter()
+    if quiet:
+        # Warnings and errors still show
+        configure_log(WARNING)
+    events = run_simulation(simulator, peers, lookups, until, churn)
+    wall_time = time.perf_counter() - wall_start
+    shared_writer().flush()
+
+    print(f"\nSimulated {simulator.now:.3f}s of virtual time in {wall_time:.3f}s "
+          f"({events} events, {events / wall_time if wall_time else 0:.0f} events/sec)")
+    network = simulator.network.stats()
+    print(f"Network: {network['sent']} datagrams sent, {network['delivered']} delivered, {network['dropped']} dropped")
+    if churn is not None:
+        print(churn.summary())
+
+    finished = [buyer for buyer in buyers if buyer.end_time is not None]
+    if finished:
+        mean_rtt = sum(buyer.average_rtt for buyer in finished) / len(finished)
+        print(f"Mean RTT over {len(finished)}/{len(buyers)} buyers that reached max transactions: {mean_rtt:.4f} virtual seconds")
+    latency = LatencyHistogram.merged(buyer.latency for buyer in buyers)
+    print(f"Transaction latency (virtual time): {latency.summary()}")
+    messages_sent = Counter()
+    if churn is not None:
+        # Peers that joined during the run and are still in it
+        peers = peers + [peer for peer in churn.peers.values() if peer.peer_id >= N]
+    for peer in peers:
+        messages_sent.update(peer.messages_sent)
+    search_messages = sum(messages_sent[t] for t in ('lookup', 'reply', 'walk_check', 'walk_status'))
+    successful_lookups = sum(buyer.lookups_succeeded for buyer in buyers)
+    per_lookup = search_messages / successful_lookups if successful_lookups else float('nan')
+    print(f"Lookup strategy '{lookup_strategy}': {search_messages} search messages for "
+          f"{successful_lookups} successful lookups ({per_lookup:.1f} per successful lookup)")
+    finish_tracing()
+    return simulator, peers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Discrete-event simulation of the marketplace")
+    parser.add_argument('peers', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', default='constant:0.001',
+                        help="constant:D, uniform:LOW,HIGH, lognormal:MEDIAN[,SIGMA] or link:LOW,HIGH[,JITTER] (seconds)")
+    parser.add_argument('--loss', type=float, default=0.0, help="Probability that a datagram is dropped")
+    parser.add_argument('--until', type=float, default=None, help="Stop after this many virtual seconds")
+    parser.add_argument('--hopcount', type=int, default=None, help="Default: network diameter - 1")
+    parser.add_argument('--strategy', default=LOOKUP_STRATEGY, choices=('flood', 'expanding_ring', 'random_walk'))
+    parser.add_argument('--quiet', action='store_true', help="Hide the peers' per-message output")
+    parser.add_argument('--churn', type=float, default=config.CHURN_INTERVAL, metavar='INTERVAL',
+                        help="Virtual seconds between peers joining or leaving (default CHURN_INTERVAL)")
+    args = parser.parse_args()
+    main(args.peers, args.seed, args.latency, args.loss, args.until, args.hopcount, args.strategy, args.quiet, args.churn)
@@ -0,0 +1,72 @@
+# peer_doubles.py
+"""
+Test doubles for driving a Peer's handlers directly: no socket, no timer thread
+and no worker pool. Import with `from tests.peer_doubles import ...` after the
+usual sys.path header.
+"""
+from types import SimpleNamespace
+
+from peer import Peer
+from utils.codec import decode
+
+
+class ManualTimer:
+    """A timeout that only runs its callback when the test calls fire()."""
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.callback(*self.args)
+
+
+class SinkPeer(Peer):
+    """
+    A Peer without a socket. Every message it sends is decoded into sent as
+    (addr, message), every timeout it schedules is a ManualTimer in timers, and
+    every follow-up handed to spawn() is recorded in spawned as (name, args)
+    instead of being run; run_spawned() runs them. Pass clock=<seconds> to read
+    time from self.clock, which the test can then move by hand.
+    """
+
+    def __init__(self, *args, clock=None, **kwargs):
+        self.sent = []
+        self.timers = []
+        self.spawned = []
+        self.follow_ups = []  # (target, args) not run yet
+        self.clock = clock
+        super().__init__(*args, **kwargs)
+
+    def open_socket(self):
+        return None
+
+    def now(self):
+        return super().now() if self.clock is None else self.clock
+
+    def transmit(self, data, addr):
+        self.sent.append((addr, decode(data)))
+
+    def schedule_timeout(self, delay, callback, *args):
+        timer = ManualTimer(callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def spawn(self, target, *args):
+        self.spawned.append((target.__name__, args))
+        self.follow_ups.append((target, args))
+
+    def run_spawned(self):
+        """Run the follow-ups spawned so far, as the worker pool would."""
+        follow_ups, self.follow_ups = self.follow_ups, []
+        for target, args in follow_ups:
+            target(*args)
+
+
+def neighbors(*peer_ids):
+    """Neighbor records for peers on localhost, peer i at port 5000 + i."""
+    return [SimpleNamespace(peer_id=i, ip_address='localhost', port=5000 + i) for i in peer_ids]
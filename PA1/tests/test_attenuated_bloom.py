@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.attenuated_bloom import AttenuatedBloomFilter  # Absolute import
+
+
+class TestAttenuatedBloomFilter(unittest.TestCase):
+    def test_distance(self):
+        index = AttenuatedBloomFilter(depth=3)
+        self.assertIsNone(index.distance('fish'))
+        index.add('fish', level=2)
+        self.assertEqual(index.distance('fish'), 2)
+        index.add('fish')
+        self.assertEqual(index.distance('fish'), 0)
+
+    def test_merge_shifted_drops_last_level(self):
+        neighbor = AttenuatedBloomFilter(depth=3)
+        neighbor.add('fish', level=0)
+        neighbor.add('salt', level=2)
+        index = AttenuatedBloomFilter(depth=3)
+        index.merge_shifted(neighbor)
+        self.assertEqual(index.distance('fish'), 1)
+        self.assertIsNone(index.distance('salt'))
+
+    def test_wire_roundtrip(self):
+        index = AttenuatedBloomFilter(depth=3, num_bits=64)
+        index.add('boar', level=1)
+        levels = index.to_wire()
+        self.assertEqual([len(level) for level in levels], [8, 8, 8])
+        self.assertEqual(AttenuatedBloomFilter.from_wire(levels), index)
+
+
+if __name__ == '__main__':
+    unittest.main()
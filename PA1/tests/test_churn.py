@@ -0,0 +1,159 @@
+import unittest
+import sys
+import os
+import contextlib
+import io
+import random
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from churn import Churn  # Absolute import
+from simulation import SimPeer
+from utils.des import Simulator
+from utils.network_utils import IncrementalBFS, LandmarkMetrics, adjacency_diameter
+from utils.topology import Overlay, build
+
+
+def bfs(adjacency, source):
+    return IncrementalBFS(adjacency, source).distance
+
+
+class TestIncrementalBFS(unittest.TestCase):
+    def test_matches_fresh_bfs_under_random_edits(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            n = 25
+            adjacency = {i: [] for i in range(n)}
+            tree = IncrementalBFS(adjacency, 0)
+            for _ in range(80):
+                u, v = rng.sample(range(n), 2)
+                if v in adjacency[u]:
+                    adjacency[u].remove(v)
+                    adjacency[v].remove(u)
+                    tree.edge_removed(u, v)
+                else:
+                    adjacency[u].append(v)
+                    adjacency[v].append(u)
+                    tree.edge_added(u, v)
+                fresh = IncrementalBFS(adjacency, 0)
+                self.assertEqual(tree.distance, fresh.distance)
+                self.assertEqual(tree.eccentricity(), fresh.eccentricity())
+
+    def test_disconnect_and_reconnect(self):
+        path = {0: [1], 1: [0, 2], 2: [1, 3], 3: [2]}
+        tree = IncrementalBFS(path, 0)
+        self.assertEqual(tree.eccentricity(), 3)
+        path[1].remove(2)
+        path[2].remove(1)
+        tree.edge_removed(1, 2)
+        self.assertEqual(tree.distance, {0: 0, 1: 1})
+        path[0].append(3)
+        path[3].append(0)
+        tree.edge_added(0, 3)
+        self.assertEqual(tree.distance, {0: 0, 1: 1, 3: 1, 2: 2})
+
+
+class TestOverlay(unittest.TestCase):
+    def check(self, overlay, max_degree):
+        adjacency = overlay.adjacency
+        for peer, neighbors in adjacency.items():
+            self.assertLessEqual(len(neighbors), max_degree)
+            self.assertNotIn(peer, neighbors)
+            self.assertEqual(len(neighbors), len(set(neighbors)))
+            for neighbor in neighbors:
+                self.assertIn(peer, adjacency[neighbor])
+        self.assertNotEqual(adjacency_diameter(adjacency), float('inf'))
+
+    def test_churn_keeps_overlay_connected_and_metrics_exact(self):
+        for kind in ('ring_random', 'random_regular', 'small_world', 'scale_free'):
+            with self.subTest(kind=kind):
+                rng = random.Random(kind)
+                overlay = Overlay(build(kind, 50, 3, rng=1), 3, rng=2)
+                metrics = LandmarkMetrics(overlay.adjacency)
+                overlay.listeners.append(metrics)
+                next_id = 50
+                for _ in range(300):
+                    if rng.random() < 0.5 or len(overlay) <= 3:
+                        changed = overlay.join(next_id)
+                        self.assertIn(next_id, changed)
+                        next_id += 1
+                    else:
+                        peer = overlay.random_peer()
+                        self.assertNotIn(peer, overlay.leave(peer))
+                    self.check(overlay, 3)
+                    self.assertTrue(metrics.connected())
+                    for tree in metrics.trees:
+                        self.assertEqual(tree.distance, bfs(overlay.adjacency, tree.source))
+                    lower, upper = metrics.diameter_bounds()
+                    self.assertLessEqual(lower, adjacency_diameter(overlay.adjacency))
+                    self.assertLessEqual(adjacency_diameter(overlay.adjacency), upper)
+
+    def test_join_splices_into_full_overlay(self):
+        # A 3-regular graph has no room left: the new peer takes the place of an edge
+        cube = {0: [1, 2, 4], 1: [0, 3, 5], 2: [0, 3, 6], 3: [1, 2, 7],
+                4: [0, 5, 6], 5: [1, 4, 7], 6: [2, 4, 7], 7: [3, 5, 6]}
+        overlay = Overlay(cube, 3, rng=0)
+        changed = overlay.join(8)
+        self.assertEqual(len(overlay.adjacency[8]), 2)
+        self.assertEqual(len(changed), 3)
+        self.check(overlay, 3)
+
+    def test_leave_reconnects_cut_pieces(self):
+        star = {0: [1, 2, 3], 1: [0], 2: [0], 3: [0]}
+        overlay = Overlay(star, 3, rng=0)
+        self.assertEqual(overlay.leave(0), {1, 2, 3})
+        self.check(overlay, 3)
+
+
+class TestChurn(unittest.TestCase):
+    def test_peers_follow_the_overlay(self):
+        random.seed(3)
+        simulator = Simulator(seed=3)
+        adjacency = build('ring_random', 20, 3, rng=3)
+
+        def make_peer(peer_id, role, item):
+            return SimPeer(simulator, peer_id=peer_id, role=role, neighbors=[], item=item, port=5000 + peer_id)
+
+        peers = [make_peer(i, 'seller', 'fish') for i in range(20)]
+        for peer in peers:
+            peer.neighbors = [peers[j] for j in adjacency[peer.peer_id]]
+            peer.hop_count = peer.max_distance = 3
+        churn = Churn(peers, adjacency, make_peer, simulator, ['fish'], interval=0.1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(30):
+                churn.join('seller')
+                churn.leave()
+        self.assertEqual((churn.joins, churn.leaves), (30, 30))
+        for peer_id, peer in churn.peers.items():
+            self.assertEqual([n.peer_id for n in peer.neighbors], churn.overlay.adjacency[peer_id])
+            self.assertEqual(peer.hop_count, churn.hop_count)
+        diameter = adjacency_diameter(churn.overlay.adjacency)
+        self.assertIn(churn.hop_count, (max(1, diameter - 1), max(1, diameter - 2)))
+
+    def test_last_seller_of_an_item_stays(self):
+        random.seed(4)
+        simulator = Simulator(seed=4)
+        adjacency = build('ring_random', 10, 3, rng=4)
+
+        def make_peer(peer_id, role, item):
+            return SimPeer(simulator, peer_id=peer_id, role=role, neighbors=[], item=item, port=5000 + peer_id)
+
+        # One salt seller among fish sellers
+        peers = [make_peer(i, 'seller', 'salt' if i == 0 else 'fish') for i in range(10)]
+        for peer in peers:
+            peer.neighbors = [peers[j] for j in adjacency[peer.peer_id]]
+        churn = Churn(peers, adjacency, make_peer, simulator, ['fish', 'salt'], interval=0.1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            left = [churn.leave().peer_id for _ in range(8)]
+            # Down to the last seller of each item: nobody may leave
+            self.assertIsNone(churn.leave())
+        self.assertNotIn(0, left)
+        self.assertEqual(sorted(peer.item for peer in churn.peers.values()), ['fish', 'salt'])
+        self.assertGreater(churn.sellers_spared, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
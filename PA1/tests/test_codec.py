@@ -0,0 +1,67 @@
+import unittest
+import hashlib
+import pickle
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.codec import encode, decode  # Absolute import
+from utils.messages import ReplyMessage, BuyMessage, BuyConfirmationMessage, RoutingUpdateMessage
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.request_id = hashlib.sha256(b'0fish').hexdigest()
+
+    def roundtrip(self, message):
+        data = encode(message)
+        # Decode from a memoryview over a larger receive buffer, like listen_for_messages does
+        buffer = bytearray(1024)
+        buffer[:len(data)] = data
+        decoded = decode(memoryview(buffer)[:len(data)])
+        self.assertEqual(decoded, message)
+        self.assertLess(len(data), len(pickle.dumps(message)))
+        return decoded
+
+    def test_lookup_roundtrip(self):
+        message = {
+            'request_id': self.request_id,
+            'type': 'lookup',
+            'buyer_id': 0,
+            'product_name': 'fish',
+            'hop_count': 2,
+            'search_path': [(0, 'localhost', 5000), (1, '127.0.0.1', 5001)],
+            'last_peer_id': 1
+        }
+        decoded = self.roundtrip(message)
+        self.assertIsInstance(decoded['search_path'][0], tuple)
+
+    def test_pa1_message_classes_roundtrip(self):
+        self.roundtrip(ReplyMessage(2, [(0, 'localhost', 5000)], ('localhost', 5002), 'salt', self.request_id).to_dict())
+        self.roundtrip(BuyMessage(self.request_id, 0, 2, 'boar').to_dict())
+        self.roundtrip(BuyConfirmationMessage(self.request_id, 'boar', 0, 2, False).to_dict())
+
+    def test_routing_update_roundtrip(self):
+        self.roundtrip(RoutingUpdateMessage(3, [b'\x01' * 8, b'\x00' * 8, b'\xff' * 8]).to_dict())
+
+    def test_unknown_product_and_request_id(self):
+        self.roundtrip(BuyMessage('test_1', 0, 2, 'apple').to_dict())
+
+    def test_unknown_fields_fall_back_to_pickle(self):
+        message = {'type': 'buy', 'request_id': self.request_id, 'extra': [1, 2]}
+        self.assertEqual(decode(encode(message), accept_pickle=True), message)
+        with self.assertRaises(ValueError):
+            decode(encode(message))  # Pickle is opt-in
+
+    def test_malformed_datagram(self):
+        data = encode(BuyMessage(self.request_id, 0, 2, 'boar').to_dict())
+        with self.assertRaises(ValueError):
+            decode(data[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
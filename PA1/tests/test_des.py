@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.des import Simulator, ConstantLatency, parse_latency  # Absolute import
+
+
+class Endpoint:
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.received = []
+
+    def receive_datagram(self, data, addr):
+        self.received.append((self.simulator.now, data, addr))
+
+
+class TestSimulator(unittest.TestCase):
+    def test_runs_events_in_time_order(self):
+        simulator = Simulator()
+        fired = []
+        simulator.call_later(2, fired.append, 'b')
+        simulator.call_later(1, fired.append, 'a')
+        simulator.call_later(1, fired.append, 'a2')
+        simulator.call_soon(fired.append, 'now')
+        self.assertEqual(simulator.run(), 4)
+        self.assertEqual(fired, ['now', 'a', 'a2', 'b'])
+        self.assertEqual(simulator.now, 2)
+
+    def test_cancel_and_until(self):
+        simulator = Simulator()
+        fired = []
+        simulator.call_later(1, fired.append, 'cancelled').cancel()
+        simulator.call_later(3, fired.append, 'late')
+        simulator.run(until=2)
+        self.assertEqual(fired, [])
+        self.assertEqual(simulator.now, 2)
+        simulator.run()
+        self.assertEqual(fired, ['late'])
+
+    def test_events_scheduled_by_events(self):
+        simulator = Simulator()
+        fired = []
+
+        def tick(n):
+            fired.append((simulator.now, n))
+            if n < 3:
+                simulator.call_later(0.5, tick, n + 1)
+
+        simulator.call_soon(tick, 0)
+        simulator.run(stop=lambda: len(fired) == 3)
+        self.assertEqual(fired, [(0.0, 0), (0.5, 1), (1.0, 2)])
+
+
+class TestSimNetwork(unittest.TestCase):
+    def test_delivers_after_latency(self):
+        simulator = Simulator(latency=ConstantLatency(0.25))
+        a, b = Endpoint(simulator), Endpoint(simulator)
+        simulator.network.register(('localhost', 1), a)
+        simulator.network.register(('localhost', 2), b)
+        simulator.network.send(('localhost', 1), ('localhost', 2), b'hello')
+        simulator.run()
+        self.assertEqual(b.received, [(0.25, b'hello', ('localhost', 1))])
+        self.assertEqual(a.received, [])
+
+    def test_unregistered_destination_drops(self):
+        simulator = Simulator()
+        simulator.network.send(('localhost', 1), ('localhost', 2), b'lost')
+        simulator.run()
+        self.assertEqual(simulator.network.stats()['dropped'], 1)
+
+    def test_same_seed_same_losses_and_delays(self):
+        def run(seed):
+            simulator = Simulator(seed=seed, latency=parse_latency('link:0.001,0.01,0.002'), loss_rate=0.3)
+            endpoint = Endpoint(simulator)
+            simulator.network.register(('localhost', 2), endpoint)
+            for i in range(50):
+                simulator.network.send(('localhost', 1 + i % 3), ('localhost', 2), bytes([i]))
+            simulator.run()
+            return endpoint.received
+
+        self.assertEqual(run(7), run(7))
+        self.assertNotEqual(run(7), run(8))
+        self.assertLess(len(run(7)), 50)
+
+    def test_parse_latency_rejects_unknown_model(self):
+        with self.assertRaises(ValueError):
+            parse_latency('gaussian:1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+BUYER = (1, 'localhost', 5001)
+RELAY = (2, 'localhost', 5002)
+
+
+def lookup(search_path, **fields):
+    message = {'type': 'lookup', 'request_id': 'a' * 64, 'buyer_id': BUYER[0], 'product_name': 'fish',
+               'hop_count': 2, 'search_path': list(search_path), 'last_peer_id': search_path[-1][0] if search_path else 2}
+    message.update(fields)
+    return message
+
+
+class TestDirectReply(unittest.TestCase):
+    def seller(self, reply_mode, notify=False, routing_mode='path'):
+        seller = SinkPeer(peer_id=3, role='seller', neighbors=[], port=5003, item='fish')
+        seller.stock = 5
+        seller.reply_mode = reply_mode
+        seller.reply_notify_path = notify
+        seller.routing_mode = routing_mode
+        return seller
+
+    def test_path_mode_relays(self):
+        seller = self.seller('path')
+        seller.handle_lookup(lookup([BUYER, RELAY]), ('localhost', 5002))
+        [(addr, reply)] = seller.sent
+        self.assertEqual(addr, ('localhost', 5002))
+        self.assertEqual(reply['reply_path'], [BUYER])
+        self.assertNotIn('direct', reply)
+
+    def test_direct_mode_replies_to_the_buyer(self):
+        seller = self.seller('direct')
+        seller.handle_lookup(lookup([BUYER, RELAY]), ('localhost', 5002))
+        [(addr, reply)] = seller.sent
+        self.assertEqual(addr, ('localhost', 5001))
+        self.assertEqual(reply['reply_path'], [])
+        self.assertTrue(reply['direct'])
+
+    def test_notify_path_also_relays(self):
+        seller = self.seller('direct', notify=True)
+        seller.handle_lookup(lookup([BUYER, RELAY]), ('localhost', 5002))
+        (direct_addr, direct), (path_addr, relayed) = seller.sent
+        self.assertEqual(direct_addr, ('localhost', 5001))
+        self.assertEqual(path_addr, ('localhost', 5002))
+        self.assertTrue(relayed['notify'])
+        self.assertNotIn('direct', relayed)
+        self.assertEqual((direct['replier_id'], relayed['replier_id']), (3, 3))
+
+        # Next to the buyer the path copy would only duplicate the direct reply
+        seller.sent.clear()
+        seller.handle_lookup(lookup([BUYER], request_id='b' * 64), ('localhost', 5001))
+        [(_, direct)] = seller.sent
+        self.assertNotIn('replier_id', direct)
+
+    def test_reverse_routing_falls_back_to_relaying_without_buyer_addr(self):
+        seller = self.seller('direct', routing_mode='reverse')
+        seller.handle_lookup(lookup([]), ('localhost', 5002))
+        seller.handle_lookup(lookup([], request_id='b' * 64, buyer_addr=('localhost', 5001)), ('localhost', 5002))
+        self.assertEqual([addr for addr, _ in seller.sent], [('localhost', 5002), ('localhost', 5001)])
+
+    def test_buyer_times_both_copies_and_buys_once(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(RELAY[0]), port=5001)
+        buyer.reply_mode = 'direct'
+        buyer.lookup_item('fish', 2)
+        request_id = buyer.sent[0][1]['request_id']
+        reply = {'type': 'reply', 'request_id': request_id, 'seller_id': 3, 'product_name': 'fish',
+                 'seller_addr': ('localhost', 5003), 'reply_path': [], 'replier_id': 3}
+        buyer.handle_reply(dict(reply, direct=True))
+        buyer.handle_reply(dict(reply, notify=True))
+        buyer.cancel_pending_requests()
+        self.assertEqual([message['type'] for _, message in buyer.sent], ['lookup', 'buy'])
+        self.assertEqual(buyer.reply_latency['direct'].count, 1)
+        self.assertEqual(buyer.reply_latency['relayed'].count, 1)
+        self.assertEqual(buyer.paired_reply_latency['direct'].count, 1)
+        self.assertEqual(buyer.paired_reply_latency['relayed'].count, 1)
+        events = buyer.metrics.counter('events')
+        self.assertEqual((events['path_notify'], events['late_reply']), (1, 0))
+
+    def test_only_replies_that_came_both_ways_are_paired(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(RELAY[0]), port=5001, clock=1000.0)
+        buyer.reply_mode = 'direct'
+        buyer.lookup_item('fish', 2)
+        request_id = buyer.sent[0][1]['request_id']
+        reply = {'type': 'reply', 'request_id': request_id, 'product_name': 'fish', 'reply_path': []}
+        # A neighbor that sells fish answers directly only; a farther seller answers both ways
+        buyer.handle_reply(dict(reply, seller_id=2, seller_addr=('localhost', 5002), direct=True))
+        buyer.handle_reply(dict(reply, seller_id=3, seller_addr=('localhost', 5003), direct=True, replier_id=3))
+        self.assertEqual(buyer.paired_reply_latency['direct'].count, 0)
+        buyer.handle_reply(dict(reply, seller_id=3, seller_addr=('localhost', 5003), notify=True, replier_id=3))
+        self.assertEqual(buyer.reply_latency['direct'].count, 2)
+        self.assertEqual(buyer.paired_reply_latency['direct'].count, 1)
+        self.assertEqual(buyer.paired_reply_latency['relayed'].count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+import peer as peer_module
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+
+class TestExpandingRing(unittest.TestCase):
+    def setUp(self):
+        self.buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2), port=5001, max_distance=2)
+        self.buyer.lookup_strategy = 'expanding_ring'
+
+    def last_lookup(self):
+        addr, message = self.buyer.sent[-1]
+        self.assertEqual(message['type'], 'lookup')
+        return message
+
+    def time_out(self):
+        """Fire the latest timeout, then run the lookup it hands to a worker."""
+        self.buyer.timers[-1].fire()
+        self.assertEqual(self.buyer.spawned[-1][0], 'lookup_item')
+        self.buyer.run_spawned()
+
+    def pending_ring(self):
+        [(product_name, _, ring_ttl, _, stage, _)] = self.buyer.pending_requests.values()
+        return product_name, ring_ttl
+
+    def test_each_timeout_widens_the_ring(self):
+        self.buyer.lookup_item('fish', 2)
+        ring_ttl = peer_module.RING_START_TTL
+        self.assertEqual(self.last_lookup()['hop_count'], ring_ttl - 1)
+        self.assertEqual(self.pending_ring(), ('fish', ring_ttl))
+
+        while ring_ttl < self.buyer.ring_max_ttl():
+            self.time_out()
+            # One hop further for the same product: a lookup with hop_count h travels h + 1 hops
+            self.assertEqual(self.pending_ring(), ('fish', ring_ttl + 1))
+            self.assertEqual(self.last_lookup()['hop_count'], ring_ttl)
+            self.assertEqual(self.last_lookup()['product_name'], 'fish')
+            ring_ttl += 1
+        self.assertEqual(len(self.buyer.sent), self.buyer.ring_max_ttl() - peer_module.RING_START_TTL + 1)
+
+        # The widest ring timed out too: search for another product from the first ring
+        self.time_out()
+        product_name, ring_ttl = self.pending_ring()
+        self.assertNotEqual(product_name, 'fish')
+        self.assertEqual(ring_ttl, peer_module.RING_START_TTL)
+        self.assertEqual(self.last_lookup()['hop_count'], peer_module.RING_START_TTL - 1)
+        self.buyer.cancel_pending_requests()
+
+    def test_wider_rings_still_avoid_the_stale_seller(self):
+        # A retry after a failed buy from seller 3
+        self.buyer.lookup_item('fish', 2, 3)
+        self.time_out()
+        self.assertEqual(self.pending_ring(), ('fish', peer_module.RING_START_TTL + 1))
+        self.assertEqual(self.last_lookup()['stale_seller_id'], 3)
+        self.buyer.cancel_pending_requests()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+import math
+import random
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.histogram import LatencyHistogram  # Absolute import
+
+
+def exact_percentile(values, percentile):
+    values = sorted(values)
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 101):
+            histogram.record(value)
+        self.assertEqual(histogram.value_at_percentile(50), 50)
+        self.assertEqual(histogram.value_at_percentile(99), 99)
+        self.assertEqual(histogram.value_at_percentile(100), 100)
+        self.assertEqual((histogram.min, histogram.max, histogram.mean()), (1, 100, 50.5))
+
+    def test_percentiles_within_precision(self):
+        rng = random.Random(0)
+        values = [int(rng.lognormvariate(14, 1.5)) for _ in range(20000)]
+        histogram = LatencyHistogram(significant_figures=2)
+        for value in values:
+            histogram.record(value)
+        for percentile in (50, 90, 99, 99.9):
+            exact = exact_percentile(values, percentile)
+            self.assertAlmostEqual(histogram.value_at_percentile(percentile) / exact, 1, delta=0.01)
+
+    def test_merge_equals_recording_everything(self):
+        rng = random.Random(1)
+        parts = [[rng.randrange(10 ** 9) for _ in range(500)] for _ in range(4)]
+        whole = LatencyHistogram()
+        histograms = []
+        for part in parts:
+            histogram = LatencyHistogram()
+            for value in part:
+                histogram.record(value)
+                whole.record(value)
+            histograms.append(histogram)
+        merged = LatencyHistogram.merged(histograms)
+        self.assertEqual(merged.counts, whole.counts)
+        self.assertEqual((merged.count, merged.total, merged.min, merged.max), (whole.count, whole.total, whole.min, whole.max))
+        with self.assertRaises(ValueError):
+            merged.merge(LatencyHistogram(significant_figures=3))
+
+    def test_dict_roundtrip(self):
+        histogram = LatencyHistogram()
+        for value in (5, 5000, 5000000):
+            histogram.record(value)
+        copy = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(copy.percentiles(), histogram.percentiles())
+        self.assertEqual(copy.count, 3)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.value_at_percentile(50))
+        self.assertEqual(histogram.summary(), "no samples")
+        self.assertEqual(LatencyHistogram.merged([histogram]).count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
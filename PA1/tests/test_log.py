@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import threading
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.log import Logger, LogWriter, DEBUG, INFO, WARNING, read_records  # Absolute import
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'peer.log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_disabled_levels_queue_nothing(self):
+        writer = LogWriter(WARNING, 'text', self.path)
+        log = Logger(3, writer)
+        log.debug('forward', "Forwarding lookup for {product}", product='fish')
+        log.info('sold', "Sold item")
+        self.assertIsNone(writer.thread)  # Nothing was ever put
+        self.assertFalse(log.enabled(INFO))
+        self.assertTrue(log.enabled(WARNING))
+
+    def test_text(self):
+        writer = LogWriter(INFO, 'text', self.path)
+        log = Logger(3, writer, clock=lambda: 0.0)
+        log.debug('forward', "Forwarding lookup for {product}", product='fish')
+        log.info('sold', "Sold item to buyer {buyer}. Remaining stock: {stock}", buyer=1, stock=4)
+        log.warning('bad', "Template with a {missing} field")
+        self.assertTrue(writer.flush())
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith("info    [3] Sold item to buyer 1. Remaining stock: 4"))
+        # A bad template still logs the record
+        self.assertIn("Template with a {missing} field", lines[1])
+
+    def test_jsonl(self):
+        writer = LogWriter(DEBUG, 'jsonl', self.path)
+        log = Logger('churn', writer, clock=lambda: 1.5)
+        log.debug('join', "Peer {peer} joined", peer=7)
+        writer.flush()
+        with open(self.path) as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record, {'time': 1.5, 'level': 'debug', 'source': 'churn', 'event': 'join',
+                                  'message': "Peer 7 joined", 'fields': {'peer': 7}})
+
+    def test_binary_round_trip(self):
+        writer = LogWriter(DEBUG, 'binary', self.path)
+        log = Logger(2, writer, clock=lambda: 2.0)
+        for i in range(3):
+            log.info('bought', "bought product {product}", product=('fish', 'salt', 'boar')[i])
+        writer.flush()
+        records = list(read_records(self.path))
+        self.assertEqual([r['message'] for r in records], ["bought product fish", "bought product salt", "bought product boar"])
+        self.assertEqual(records[0]['fields'], {'product': 'fish'})
+        self.assertEqual(records[0]['level'], 'info')
+
+    def test_full_queue_drops_and_counts(self):
+        writer = LogWriter(INFO, 'text', self.path, queue_size=2)
+        writer.thread = threading.current_thread()  # Stands in for a writer that has fallen behind
+        log = Logger(3, writer, clock=lambda: 0.0)
+        for i in range(5):
+            log.info('sold', "Sold item {i}", i=i)
+        self.assertEqual(writer.dropped, 3)
+        writer.thread = None
+        writer.start()
+        self.assertTrue(writer.flush())
+        with open(self.path) as f:
+            self.assertEqual([line[-11:] for line in f.read().splitlines()], ["Sold item 0", "Sold item 1"])
+
+    def test_configure(self):
+        writer = LogWriter()
+        writer.configure('error')
+        self.assertFalse(Logger(1, writer).enabled(WARNING))
+        with self.assertRaises(ValueError):
+            writer.configure('loud')
+        with self.assertRaises(ValueError):
+            writer.configure(output='binary')  # Binary logs need a path
+
+
+if __name__ == '__main__':
+    unittest.main()
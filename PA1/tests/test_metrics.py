@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import urllib.request
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.metrics import PeerMetrics, MetricsRegistry  # Absolute import
+
+
+def make_metrics(peer_id, lookups):
+    metrics = PeerMetrics(peer_id)
+    received = metrics.counter('received')
+    for _ in range(lookups):
+        received['lookup'] += 1
+    metrics.incr('events', 'timeout')
+    metrics.observe_handler('lookup', 2000)
+    metrics.observe_handler('lookup', 6000)
+    metrics.gauge('stock', lambda: 5)
+    metrics.gauge('broken', lambda: 1 / 0)
+    return metrics
+
+
+class TestPeerMetrics(unittest.TestCase):
+    def test_snapshot(self):
+        snapshot = make_metrics(7, 3).snapshot()
+        self.assertEqual(snapshot['peer_id'], 7)
+        self.assertEqual(snapshot['counters'], {'received': {'lookup': 3}, 'events': {'timeout': 1}})
+        self.assertEqual(snapshot['handlers']['lookup'], {'calls': 2, 'total_ms': 0.008, 'mean_us': 4.0, 'max_us': 6.0})
+        # A failing gauge does not spoil the snapshot
+        self.assertEqual(snapshot['gauges'], {'stock': 5, 'broken': None})
+        json.dumps(snapshot)
+
+    def test_counter_is_shared(self):
+        metrics = PeerMetrics(1)
+        self.assertIs(metrics.counter('sent'), metrics.counter('sent'))
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.register(make_metrics(1, 2))
+        self.registry.register(make_metrics(2, 5))
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_totals(self):
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['peer_count'], 2)
+        self.assertEqual(snapshot['totals']['received'], {'lookup': 7})
+        self.assertEqual(snapshot['handlers']['lookup']['calls'], 4)
+        self.assertEqual(len(snapshot['peers']), 2)
+        self.assertNotIn('peers', self.registry.snapshot(peers=False))
+
+    def test_http(self):
+        server = self.registry.serve_http(0)
+        base = f"http://{server.server_address[0]}:{server.server_address[1]}"
+        with urllib.request.urlopen(base + '/') as response:
+            self.assertEqual(json.load(response)['totals']['events'], {'timeout': 2})
+        with urllib.request.urlopen(base + '/peers/2') as response:
+            self.assertEqual(json.load(response)['counters']['received'], {'lookup': 5})
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + '/peers/9')
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stats.jsonl')
+            self.registry.dump(path)
+            self.registry.close(path)
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[-1]['totals']['received'], {'lookup': 7})
+
+
+if __name__ == '__main__':
+    unittest.main()
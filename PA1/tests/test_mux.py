@@ -0,0 +1,80 @@
+import unittest
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.mux import HEADER, MuxSocket, MuxRouter  # Absolute import
+
+
+class Inbox:
+    def __init__(self, expected):
+        self.received = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, data, addr):
+        self.received.append((bytes(data), addr))
+        if len(self.received) == self.expected:
+            self.done.set()
+
+
+class TestMuxSocket(unittest.TestCase):
+    def setUp(self):
+        router = MuxRouter()
+        self.muxes = [MuxSocket('localhost', 0, router), MuxSocket('localhost', 0, router)]
+        for mux in self.muxes:
+            mux.start()
+
+    def tearDown(self):
+        for mux in self.muxes:
+            mux.close()
+
+    def test_demultiplexes_by_peer_id(self):
+        first, second = self.muxes
+        inbox_a, inbox_b, inbox_c = Inbox(1), Inbox(2), Inbox(1)
+        a = first.open(1, ('localhost', 5001), inbox_a)
+        b = first.open(2, ('localhost', 5002), inbox_b)
+        c = second.open(3, ('localhost', 5003), inbox_c)
+
+        a.sendto(b'a to b', ('localhost', 5002))
+        c.sendto(b'c to b', ('localhost', 5002))
+        b.sendto(b'b to c', ('localhost', 5003))
+        b.sendto(b'b to a', ('localhost', 5001))
+
+        for inbox in (inbox_a, inbox_b, inbox_c):
+            self.assertTrue(inbox.done.wait(2))
+        self.assertEqual(sorted(inbox_b.received), [(b'a to b', ('localhost', 5001)), (b'c to b', ('localhost', 5003))])
+        self.assertEqual(inbox_c.received, [(b'b to c', ('localhost', 5002))])
+        self.assertEqual(inbox_a.received, [(b'b to a', ('localhost', 5002))])
+
+    def test_closed_endpoint_is_unreachable(self):
+        first, _ = self.muxes
+        a = first.open(1, ('localhost', 5001), Inbox(1))
+        b = first.open(2, ('localhost', 5002), Inbox(1))
+        b.close()
+        # Counted, not raised: replies to a finished peer are routine
+        a.sendto(b'gone', ('localhost', 5002))
+        self.assertEqual(first.stats()['unroutable'], 1)
+        self.assertEqual(first.stats()['sent'], 0)
+        self.assertEqual(first.stats()['peers'], 1)
+
+    def test_unknown_sender_is_dropped(self):
+        first, second = self.muxes
+        inbox = Inbox(1)
+        first.open(1, ('localhost', 5001), inbox)
+        c = second.open(3, ('localhost', 5003), Inbox(1))
+        # Peer 9 has no route, so a reply to it could not be addressed
+        second.socket.sendto(HEADER.pack(1, 9) + b'stranger', first.address)
+        c.sendto(b'known', ('localhost', 5001))
+        self.assertTrue(inbox.done.wait(2))
+        self.assertEqual(inbox.received, [(b'known', ('localhost', 5003))])
+        self.assertEqual(first.stats()['dropped'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
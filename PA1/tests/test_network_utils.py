@@ -0,0 +1,62 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils import network_utils  # Absolute import
+from utils.network_utils import CSRGraph, distance_profile, double_sweep_diameter, profile_diameter
+
+
+def ring(n):
+    return {i: [(i - 1) % n, (i + 1) % n] for i in range(n)}
+
+
+class TestDistanceProfile(unittest.TestCase):
+    def test_ring(self):
+        profile = distance_profile(CSRGraph.from_adjacency(ring(6)))
+        self.assertEqual(profile.eccentricity, {i: 3 for i in range(6)})
+        # Every peer: itself, 2 peers 1 and 2 hops away, 1 peer 3 hops away
+        self.assertEqual(profile.histogram, [6, 12, 12, 6])
+        self.assertEqual(profile.unreachable_pairs, 0)
+        self.assertEqual(profile_diameter(profile), 3)
+
+    def test_path_with_small_batches(self):
+        path = {10: [11], 11: [10, 12], 12: [11, 13], 13: [12]}
+        original = network_utils.BFS_BATCH_SOURCES
+        network_utils.BFS_BATCH_SOURCES = 3
+        try:
+            profile = distance_profile(CSRGraph.from_adjacency(path))
+        finally:
+            network_utils.BFS_BATCH_SOURCES = original
+        self.assertEqual(profile.eccentricity, {10: 3, 11: 2, 12: 2, 13: 3})
+        self.assertEqual(profile.histogram, [4, 6, 4, 2])
+
+    def test_disconnected(self):
+        graph = CSRGraph.from_adjacency({0: [1], 1: [0], 2: []})
+        profile = distance_profile(graph)
+        self.assertEqual(profile.eccentricity, {0: float('inf'), 1: float('inf'), 2: float('inf')})
+        self.assertEqual(profile.unreachable_pairs, 4)
+        self.assertEqual(profile_diameter(profile), float('inf'))
+        self.assertEqual(double_sweep_diameter(graph), float('inf'))
+
+
+class TestDoubleSweep(unittest.TestCase):
+    def test_exact_on_a_tree(self):
+        # Longest path 3-1-0-2-5-6, found from any start
+        tree = {0: [1, 2], 1: [0, 3, 4], 2: [0, 5], 3: [1], 4: [1], 5: [2, 6], 6: [5]}
+        graph = CSRGraph.from_adjacency(tree)
+        for start in range(len(graph)):
+            self.assertEqual(double_sweep_diameter(graph, start), 5)
+
+    def test_lower_bound(self):
+        graph = CSRGraph.from_adjacency(ring(7))
+        self.assertEqual(double_sweep_diameter(graph), 3)
+        self.assertEqual(graph.distances(0), [0, 1, 2, 3, 3, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
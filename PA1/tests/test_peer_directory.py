@@ -0,0 +1,33 @@
+import unittest
+import pickle
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.peer_directory import PeerRef, build_directory, neighbor_refs, partition  # Absolute import
+from utils.network_utils import adjacency_diameter
+
+
+class TestPeerDirectory(unittest.TestCase):
+    def test_neighbor_refs(self):
+        directory = build_directory(range(3), base_port=6000)
+        refs = neighbor_refs(directory, [2, 0])
+        self.assertEqual(refs, [PeerRef(2, 'localhost', 6002), PeerRef(0, 'localhost', 6000)])
+        self.assertEqual(refs[0].port, 6002)
+        self.assertEqual(pickle.loads(pickle.dumps(refs)), refs)
+
+    def test_partition(self):
+        self.assertEqual(partition(list(range(5)), 2), [[0, 2, 4], [1, 3]])
+
+    def test_adjacency_diameter(self):
+        ring = {i: [(i - 1) % 6, (i + 1) % 6] for i in range(6)}
+        self.assertEqual(adjacency_diameter(ring), 3)
+        self.assertEqual(adjacency_diameter({0: [1], 1: [0], 2: []}), float('inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
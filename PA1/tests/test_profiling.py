@@ -0,0 +1,103 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import time
+import pstats
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.metrics import PeerMetrics  # Absolute import
+from utils.profiling import timed, TimedLock, HandlerProfiler
+
+
+class FakePeer:
+    """The part of a Peer a HandlerProfiler uses: a handler table rebuilt by instrument()."""
+
+    def __init__(self, peer_id):
+        self.peer_id = peer_id
+        self.handled = 0
+        self.instrument()
+
+    def handle_work(self, message, addr):
+        self.handled += 1
+        total = 0
+        while total < message['spin']:
+            total += 1
+
+    def instrument(self, profiler=None):
+        handler = self.handle_work
+        if profiler is not None:
+            handler = profiler.wrap(self.peer_id, handler)
+        self.handlers = {'work': handler}
+
+
+class TestTiming(unittest.TestCase):
+    def test_timed(self):
+        metrics = PeerMetrics(1)
+        handler = timed(lambda message, addr: time.sleep(0.002), metrics, 'lookup')
+        handler({}, None)
+        handler({}, None)
+        calls, total, worst = metrics.handler_ns['lookup']
+        self.assertEqual(calls, 2)
+        self.assertGreaterEqual(total, 4_000_000)
+        self.assertLessEqual(worst, total)
+
+    def test_timed_lock(self):
+        metrics = PeerMetrics(1)
+        lock = TimedLock(metrics, 'lock')
+        with lock:
+            pass
+        lock.acquire()
+        waiter = threading.Thread(target=lambda: lock.__enter__() and lock.release())
+        waiter.start()
+        time.sleep(0.02)
+        lock.release()
+        waiter.join()
+        self.assertFalse(lock.locked())
+        snapshot = metrics.snapshot()['locks']['lock']
+        self.assertEqual(snapshot['acquisitions'], 3)
+        self.assertEqual(snapshot['contended'], 1)
+        self.assertGreater(snapshot['max_wait_us'], 10000)
+
+
+class TestHandlerProfiler(unittest.TestCase):
+    def run_window(self, mode):
+        peers = [FakePeer(0), FakePeer(1)]
+        directory = tempfile.mkdtemp()
+        profiler = HandlerProfiler(peers, mode, directory, sample_interval=0.0005)
+        profiler.start()
+        deadline = time.time() + 0.2
+        while time.time() < deadline:
+            for peer in peers:
+                peer.handlers['work']({'spin': 20000}, None)
+        profiler.stop()
+        # Out of the window the handlers are the plain ones again
+        self.assertEqual(peers[0].handlers['work'], peers[0].handle_work)
+        return profiler.dump()
+
+    def test_cprofile(self):
+        paths = self.run_window('cprofile')
+        self.assertEqual([os.path.basename(path) for path in paths], ['peer_0.prof', 'peer_1.prof'])
+        stats = pstats.Stats(paths[0])
+        self.assertTrue(any(function[2] == 'handle_work' for function in stats.stats))
+
+    def test_sample(self):
+        paths = self.run_window('sample')
+        self.assertTrue(paths)
+        with open(paths[0]) as f:
+            stack, samples = f.readline().rsplit(' ', 1)
+        self.assertTrue(stack.startswith('handle_work'))
+        self.assertGreater(int(samples), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            HandlerProfiler([], 'perf')
+
+
+if __name__ == '__main__':
+    unittest.main()
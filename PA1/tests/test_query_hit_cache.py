@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+BUYER = (1, 'localhost', 5001)
+RELAY = (2, 'localhost', 5002)
+SELLER_ADDR = ('localhost', 5004)
+
+
+def reply(**fields):
+    message = {'type': 'reply', 'request_id': 'a' * 64, 'seller_id': 4, 'product_name': 'fish',
+               'seller_addr': SELLER_ADDR, 'reply_path': [BUYER]}
+    message.update(fields)
+    return message
+
+
+def lookup(request_id, **fields):
+    message = {'type': 'lookup', 'request_id': request_id, 'buyer_id': 5, 'product_name': 'fish',
+               'hop_count': 2, 'search_path': [(5, 'localhost', 5005)], 'last_peer_id': 5}
+    message.update(fields)
+    return message
+
+
+class TestQueryHitCache(unittest.TestCase):
+    def setUp(self):
+        # A relay between buyer 1 and seller 4, with buyer 5 as another neighbor
+        self.relay = SinkPeer(peer_id=2, role='seller', neighbors=neighbors(1, 4, 5), port=5002, item='salt')
+
+    def test_relayed_reply_answers_the_next_lookup(self):
+        self.relay.handle_reply(reply())
+        self.assertEqual(self.relay.query_hit_cache.get('fish'), (4, SELLER_ADDR))
+        self.relay.sent.clear()
+
+        self.relay.handle_lookup(lookup('b' * 64), ('localhost', 5005))
+        # Answered from the cache, not flooded on
+        [(addr, answer)] = self.relay.sent
+        self.assertEqual((addr, answer['type'], answer['seller_id']), (('localhost', 5005), 'reply', 4))
+        self.assertEqual(tuple(answer['seller_addr']), SELLER_ADDR)
+        self.assertTrue(answer['from_cache'])
+        stats = self.relay.metrics.snapshot()['gauges']['query_hit_cache']
+        self.assertEqual((stats['hits'], stats['size']), (2, 1))  # The check above, then the lookup
+
+    def test_cached_answers_are_not_cached_again(self):
+        self.relay.handle_reply(reply(from_cache=True))
+        self.assertIsNone(self.relay.query_hit_cache.get('fish'))
+        # Still relayed to the buyer
+        self.assertEqual([addr for addr, _ in self.relay.sent], [('localhost', 5001)])
+
+    def test_stale_seller_is_evicted(self):
+        self.relay.handle_reply(reply())
+        self.relay.sent.clear()
+        self.relay.handle_lookup(lookup('b' * 64, stale_seller_id=4), ('localhost', 5005))
+        self.assertIsNone(self.relay.query_hit_cache.get('fish'))
+        # Searched on instead of answered with the seller the buyer just failed to buy from
+        self.assertEqual(sorted(addr for addr, _ in self.relay.sent), [('localhost', 5001), ('localhost', 5004)])
+        self.assertTrue(all(message['type'] == 'lookup' and message['stale_seller_id'] == 4 for _, message in self.relay.sent))
+
+    def test_cache_off(self):
+        self.relay.use_query_hit_cache = False
+        self.relay.handle_reply(reply())
+        self.relay.sent.clear()
+        self.relay.handle_lookup(lookup('b' * 64), ('localhost', 5005))
+        self.assertTrue(all(message['type'] == 'lookup' for _, message in self.relay.sent))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+import peer as peer_module
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+BUYER_ADDR = ('localhost', 5001)
+REQUEST_ID = 'a' * 64
+
+
+def walker(hop_count, last_peer_id=2):
+    return {'type': 'lookup', 'request_id': REQUEST_ID, 'buyer_id': 1, 'product_name': 'fish',
+            'hop_count': hop_count, 'search_path': [], 'last_peer_id': last_peer_id,
+            'walker': True, 'buyer_addr': BUYER_ADDR}
+
+
+class TestRandomWalk(unittest.TestCase):
+    def relay(self, role='seller', item='salt'):
+        relay = SinkPeer(peer_id=3, role=role, neighbors=neighbors(2, 4), port=5003, item=item)
+        relay.routing_mode = 'reverse'  # Walkers keep an empty search path
+        return relay
+
+    def test_walkers_start_on_distinct_neighbors(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2, 3, 4), port=5001)
+        buyer.lookup_strategy = 'random_walk'
+        buyer.lookup_item('fish', 2)
+        addrs = [addr for addr, _ in buyer.sent]
+        self.assertEqual(len(addrs), peer_module.RANDOM_WALKERS)
+        # With more walkers than neighbors, every neighbor gets one before any gets two
+        self.assertEqual(len(set(addrs)), min(peer_module.RANDOM_WALKERS, 3))
+        self.assertTrue(all(message['walker'] and tuple(message['buyer_addr']) == BUYER_ADDR for _, message in buyer.sent))
+
+    def test_walker_parks_and_is_released(self):
+        relay = self.relay()
+        relay.handle_lookup(walker(peer_module.WALK_CHECK_INTERVAL + 1), ('localhost', 5002))
+        [(addr, check)] = relay.sent
+        self.assertEqual((addr, check['type'], check['request_id']), (BUYER_ADDR, 'walk_check', REQUEST_ID))
+        self.assertEqual(len(relay.parked_walkers.get(REQUEST_ID)), 1)
+
+        relay.sent.clear()
+        relay.handle_walk_status({'type': 'walk_status', 'request_id': REQUEST_ID, 'active': True})
+        [(addr, message)] = relay.sent
+        self.assertEqual(addr, ('localhost', 5004))  # Not back to the peer it came from
+        self.assertEqual(message['hop_count'], peer_module.WALK_CHECK_INTERVAL)
+        self.assertIsNone(relay.parked_walkers.get(REQUEST_ID))
+
+    def test_walker_dropped_when_lookup_is_finished(self):
+        relay = self.relay()
+        relay.handle_lookup(walker(peer_module.WALK_CHECK_INTERVAL + 1), ('localhost', 5002))
+        relay.sent.clear()
+        relay.handle_walk_status({'type': 'walk_status', 'request_id': REQUEST_ID, 'active': False})
+        self.assertEqual(relay.sent, [])
+        self.assertEqual(relay.metrics.counter('dropped')['lookup'], 1)
+
+    def test_last_hop_skips_the_check(self):
+        relay = self.relay()
+        relay.handle_lookup(walker(1), ('localhost', 5002))
+        [(addr, message)] = relay.sent
+        self.assertEqual((addr, message['type'], message['hop_count']), (('localhost', 5004), 'lookup', 0))
+
+    def test_buyer_answers_walk_checks(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2), port=5001)
+        buyer.lookup_strategy = 'random_walk'
+        buyer.lookup_item('fish', 2)
+        request_id = buyer.sent[0][1]['request_id']
+        buyer.sent.clear()
+        check = {'type': 'walk_check', 'request_id': request_id, 'peer_id': 3}
+        buyer.handle_walk_check(check, ('localhost', 5003))
+        buyer.complete_pending_request(request_id, 'lookup')
+        buyer.handle_walk_check(check, ('localhost', 5003))
+        self.assertEqual([(addr, message['active']) for addr, message in buyer.sent],
+                         [(('localhost', 5003), True), (('localhost', 5003), False)])
+
+    def test_seller_stops_the_walker(self):
+        seller = self.relay(item='fish')
+        seller.handle_lookup(walker(peer_module.WALK_CHECK_INTERVAL + 1), ('localhost', 5002))
+        [(addr, reply)] = seller.sent
+        self.assertEqual((addr, reply['type'], reply['seller_id']), (('localhost', 5002), 'reply', 3))
+        self.assertIsNone(seller.parked_walkers.get(REQUEST_ID))
+
+
+if __name__ == '__main__':
+    unittest.main()
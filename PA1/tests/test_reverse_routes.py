@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+import peer as peer_module
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+REQUEST_ID = 'a' * 64
+BUYER_ADDR = ('localhost', 5001)
+
+
+class TestReverseRoutes(unittest.TestCase):
+    def setUp(self):
+        # Relay 2 between buyer 1 and seller 3
+        self.relay = SinkPeer(peer_id=2, role='seller', neighbors=neighbors(1, 3), port=5002, item='salt', clock=1000.0)
+        self.relay.routing_mode = 'reverse'
+        lookup = {'type': 'lookup', 'request_id': REQUEST_ID, 'buyer_id': 1, 'product_name': 'fish',
+                  'hop_count': 2, 'search_path': [], 'last_peer_id': 1}
+        self.relay.handle_lookup(lookup, BUYER_ADDR)
+        forwarded = [message for _, message in self.relay.sent]
+        self.assertEqual([message['search_path'] for message in forwarded], [[]])  # Fixed-size lookups
+        self.relay.sent.clear()
+        self.reply = {'type': 'reply', 'request_id': REQUEST_ID, 'seller_id': 3, 'product_name': 'fish',
+                      'seller_addr': ('localhost', 5003), 'reply_path': []}
+
+    def test_reply_follows_the_recorded_hop(self):
+        self.assertEqual(self.relay.reverse_routes.get(REQUEST_ID), BUYER_ADDR)
+        self.relay.handle_reply(dict(self.reply))
+        [(addr, message)] = self.relay.sent
+        self.assertEqual((addr, message['type']), (BUYER_ADDR, 'reply'))
+        self.assertEqual(self.relay.metrics.counter('forwarded')['reply'], 1)
+
+    def test_reply_dropped_once_the_route_expired(self):
+        self.relay.clock += peer_module.ROUTE_TTL + 0.1
+        self.relay.handle_reply(dict(self.reply))
+        self.assertEqual(self.relay.sent, [])
+        self.assertEqual(self.relay.metrics.counter('events')['no_route'], 1)
+        self.assertEqual(self.relay.metrics.counter('dropped')['reply'], 1)
+
+    def test_buyer_ignores_its_own_lookup(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2, 3), port=5001)
+        buyer.routing_mode = 'reverse'
+        buyer.lookup_item('fish', 2)
+        lookup = buyer.sent[0][1]
+        buyer.sent.clear()
+        # The flood comes back around through a neighbor
+        buyer.handle_lookup(dict(lookup, last_peer_id=3), ('localhost', 5003))
+        self.assertEqual(buyer.sent, [])
+        self.assertIsNone(buyer.reverse_routes.get(lookup['request_id']))
+        self.assertEqual(buyer.metrics.counter('events')['duplicate_lookup'], 1)
+        # The seen filter's own counts reach the peer's metrics
+        self.assertEqual(buyer.metrics.snapshot()['gauges']['seen_filter']['duplicates'], 1)
+        buyer.cancel_pending_requests()
+
+    def test_walker_passing_the_buyer_again(self):
+        buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2, 3), port=5001)
+        buyer.routing_mode = 'reverse'
+        buyer.lookup_strategy = 'random_walk'
+        buyer.lookup_item('fish', 2)
+        walker = dict(buyer.sent[0][1], last_peer_id=3)
+        buyer.sent.clear()
+        # Walkers are not deduplicated, so this one walks on through the buyer
+        buyer.handle_lookup(walker, ('localhost', 5003))
+        self.assertEqual([message['type'] for _, message in buyer.sent], ['lookup'])
+        self.assertIsNone(buyer.reverse_routes.get(walker['request_id']))
+
+        buyer.sent.clear()
+        buyer.handle_reply(dict(self.reply, request_id=walker['request_id']))
+        # Bought, rather than relayed back to the peer the walker came from
+        [(addr, message)] = buyer.sent
+        self.assertEqual((addr, message['type']), (('localhost', 5003), 'buy'))
+        buyer.cancel_pending_requests()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.seen_filter import LRUSeenFilter, RotatingBloomFilter  # Absolute import
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUSeenFilter(unittest.TestCase):
+    def test_duplicates_and_eviction(self):
+        clock = FakeClock()
+        seen = LRUSeenFilter(capacity=2, ttl=5, clock=clock)
+        self.assertFalse(seen.check_and_add('a'))
+        self.assertTrue(seen.check_and_add('a'))
+        seen.check_and_add('b')
+        seen.check_and_add('c')  # Evicts 'a'
+        self.assertFalse(seen.check_and_add('a'))
+        stats = seen.stats()
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['size'], 2)
+        self.assertGreaterEqual(stats['evictions'], 2)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        seen = LRUSeenFilter(capacity=10, ttl=5, clock=clock)
+        seen.add('a')
+        clock.now = 4.9
+        self.assertTrue(seen.check_and_add('a'))
+        clock.now = 5.1
+        self.assertFalse(seen.check_and_add('a'))
+
+
+class TestRotatingBloomFilter(unittest.TestCase):
+    def test_no_false_negatives_within_window(self):
+        clock = FakeClock()
+        seen = RotatingBloomFilter(capacity=1000, error_rate=0.01, window=10, clock=clock)
+        for i in range(500):
+            seen.add(f'req{i}')
+        for i in range(500):
+            self.assertTrue(seen.check_and_add(f'req{i}'))
+
+    def test_rotation_forgets_old_ids(self):
+        clock = FakeClock()
+        seen = RotatingBloomFilter(capacity=100, error_rate=0.01, window=10, clock=clock)
+        seen.add('old')
+        clock.now = 10
+        self.assertTrue(seen.check_and_add('old'))  # Still in the previous slice
+        clock.now = 20
+        self.assertFalse(seen.check_and_add('old'))
+        self.assertEqual(seen.stats()['rotations'], 2)
+
+    def test_memory_is_constant(self):
+        seen = RotatingBloomFilter(capacity=100, error_rate=0.01, window=1000)
+        size = sum(len(s) for s in seen.slices)
+        for i in range(10000):
+            seen.check_and_add(i)
+        self.assertEqual(sum(len(s) for s in seen.slices), size)
+        self.assertLess(seen.stats()['false_positive_rate'], 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
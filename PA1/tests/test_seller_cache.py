@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+SELLER_ADDR = ('localhost', 5003)
+
+
+class TestSellerCache(unittest.TestCase):
+    def setUp(self):
+        self.buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2), port=5001)
+
+    def tearDown(self):
+        self.buyer.cancel_pending_requests()
+
+    def buy_through_lookup(self):
+        """Look fish up and answer with a reply from seller 3, as it arrives back at the buyer."""
+        self.buyer.lookup_item('fish', 2)
+        request_id = self.buyer.sent[-1][1]['request_id']
+        self.buyer.handle_reply({'type': 'reply', 'request_id': request_id, 'seller_id': 3, 'product_name': 'fish',
+                                 'seller_addr': SELLER_ADDR, 'reply_path': []})
+        return request_id
+
+    def confirm(self, request_id, status):
+        self.buyer.handle_buy_confirmation({'type': 'buy_confirmation', 'request_id': request_id, 'product_name': 'fish',
+                                            'buyer_id': 1, 'seller_id': 3, 'status': status})
+
+    def test_cached_seller_is_bought_from_directly(self):
+        self.confirm(self.buy_through_lookup(), True)
+        self.assertEqual(self.buyer.seller_cache.get('fish'), (3, SELLER_ADDR))
+
+        self.buyer.sent.clear()
+        self.buyer.lookup_item('fish', 2)
+        [(addr, buy)] = self.buyer.sent
+        self.assertEqual((addr, buy['type'], buy['seller_id']), (SELLER_ADDR, 'buy', 3))
+        [entry] = self.buyer.pending_requests.values()
+        self.assertEqual(entry[4], 'buy')
+
+    def test_failed_buy_forgets_the_seller(self):
+        request_id = self.buy_through_lookup()
+        self.confirm(request_id, False)
+        self.assertIsNone(self.buyer.seller_cache.get('fish'))
+        # The next search asks peers not to answer with the seller that just failed
+        self.assertEqual(self.buyer.spawned, [('lookup_item', ('fish', self.buyer.max_distance, 3))])
+
+    def test_timeout_forgets_the_seller(self):
+        self.buyer.seller_cache.put('fish', (3, SELLER_ADDR))
+        self.buyer.lookup_item('fish', 2)
+        self.assertEqual(self.buyer.sent[-1][1]['type'], 'buy')
+        self.buyer.timers[-1].fire()
+        self.assertIsNone(self.buyer.seller_cache.get('fish'))
+
+    def test_cache_off_always_looks_up(self):
+        self.buyer.use_seller_cache = False
+        self.buyer.seller_cache.put('fish', (3, SELLER_ADDR))
+        self.buyer.lookup_item('fish', 2)
+        self.assertEqual(self.buyer.sent[-1][1]['type'], 'lookup')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from tests.peer_doubles import SinkPeer, neighbors  # Absolute import
+
+SELLER_ADDR = ('localhost', 5003)
+
+
+class TestBuyTimeout(unittest.TestCase):
+    def setUp(self):
+        self.buyer = SinkPeer(peer_id=1, role='buyer', neighbors=neighbors(2), port=5001)
+        # A cached seller, so the lookup goes straight to a buy
+        self.buyer.seller_cache.put('fish', (3, SELLER_ADDR))
+        self.buyer.lookup_item('fish', 2)
+        [(addr, self.buy)] = self.buyer.sent
+        self.assertEqual((addr, self.buy['type']), (SELLER_ADDR, 'buy'))
+
+    def confirmation(self, status=True):
+        return {'type': 'buy_confirmation', 'request_id': self.buy['request_id'], 'product_name': 'fish',
+                'buyer_id': 1, 'seller_id': 3, 'status': status}
+
+    def tearDown(self):
+        self.buyer.cancel_pending_requests()
+
+    def test_pending_confirmation_counts(self):
+        self.buyer.handle_buy_confirmation(self.confirmation())
+        self.assertEqual(self.buyer.items_bought, 1)
+        self.assertEqual([name for name, _ in self.buyer.spawned], ['lookup_item'])
+        self.assertTrue(self.buyer.timers[0].cancelled)
+        self.assertIsNone(self.buyer.transaction_started)
+
+    def test_confirmation_after_timeout_is_ignored(self):
+        self.buyer.timers[0].fire()
+        # The timeout already started the next search, on a worker rather than the timer thread
+        self.assertEqual([name for name, _ in self.buyer.spawned], ['lookup_item'])
+        self.buyer.run_spawned()
+        self.buyer.spawned.clear()
+        self.assertEqual(len(self.buyer.sent), 2)
+        started = self.buyer.transaction_started
+        self.assertIsNotNone(started)
+
+        self.buyer.handle_buy_confirmation(self.confirmation())
+        self.buyer.handle_buy_confirmation(self.confirmation(status=False))
+        self.assertEqual(self.buyer.items_bought, 0)
+        self.assertEqual(self.buyer.spawned, [])
+        self.assertEqual(self.buyer.transaction_started, started)
+        self.assertEqual(self.buyer.latency.count, 0)
+        self.assertEqual(self.buyer.metrics.counter('events')['late_confirmation'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
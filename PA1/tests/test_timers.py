@@ -0,0 +1,80 @@
+import unittest
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.timers import TimerScheduler  # Absolute import
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerScheduler(unittest.TestCase):
+    def test_runs_due_timers_in_deadline_order(self):
+        clock = FakeClock()
+        timers = TimerScheduler(clock=clock)
+        fired = []
+        timers.call_later(2, fired.append, 'b')
+        timers.call_later(1, fired.append, 'a')
+        timers.call_later(1, fired.append, 'a2')
+        self.assertEqual(timers.run_due(), 0)
+        clock.now = 1.5
+        self.assertEqual(timers.run_due(), 2)
+        self.assertEqual(fired, ['a', 'a2'])
+        clock.now = 2
+        timers.run_due()
+        self.assertEqual(fired, ['a', 'a2', 'b'])
+
+    def test_cancel(self):
+        clock = FakeClock()
+        timers = TimerScheduler(clock=clock)
+        fired = []
+        handles = [timers.call_later(1, fired.append, i) for i in range(10)]
+        for handle in handles[:8]:
+            handle.cancel()
+        handles[0].cancel()  # Cancelling twice is harmless
+        self.assertEqual(len(timers), 2)
+        self.assertLess(len(timers.heap), 10)  # Mostly-cancelled heaps are compacted
+        clock.now = 1
+        timers.run_due()
+        self.assertEqual(fired, [8, 9])
+        self.assertEqual(timers.stats()['cancelled'], 8)
+
+    def test_cancel_after_firing(self):
+        # A reply and its timeout racing: the timer ran, then the reply cancels it
+        clock = FakeClock()
+        timers = TimerScheduler(clock=clock)
+        fired = []
+        handle = timers.call_later(1, fired.append, 'timeout')
+        timers.call_later(2, fired.append, 'later')
+        clock.now = 1
+        timers.run_due()
+        handle.cancel()
+        self.assertEqual(len(timers), 1)
+        self.assertEqual(timers.stats()['cancelled'], 0)
+        clock.now = 2
+        timers.run_due()
+        self.assertEqual(fired, ['timeout', 'later'])
+        self.assertEqual(len(timers), 0)
+
+    def test_timer_thread(self):
+        timers = TimerScheduler()
+        timers.start()
+        done = threading.Event()
+        timers.call_later(0.01, done.set)
+        self.assertTrue(done.wait(2))
+        timers.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
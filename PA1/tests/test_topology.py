@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import random
+import tempfile
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils import topology  # Absolute import
+from utils.network_utils import adjacency_diameter
+
+
+def max_degree_for(kind):
+    # A complete graph only fits an unbounded degree
+    return None if kind == 'complete' else 3
+
+
+class TestTopology(unittest.TestCase):
+    def check(self, adjacency, n, max_degree):
+        self.assertEqual(sorted(adjacency), list(range(n)))
+        for peer, neighbors in adjacency.items():
+            self.assertNotIn(peer, neighbors)
+            self.assertEqual(len(neighbors), len(set(neighbors)))
+            if max_degree is not None:
+                self.assertLessEqual(len(neighbors), max_degree)
+            for neighbor in neighbors:
+                self.assertIn(peer, adjacency[neighbor])
+        self.assertNotEqual(adjacency_diameter(adjacency), float('inf'))
+
+    def test_kinds_are_connected_and_bounded(self):
+        for kind in topology.KINDS:
+            for n in (1, 2, 3, 10, 200):
+                with self.subTest(kind=kind, n=n):
+                    max_degree = max_degree_for(kind)
+                    self.check(topology.build(kind, n, max_degree, rng=n), n, max_degree)
+
+    def test_same_seed_same_topology(self):
+        for kind in topology.KINDS:
+            max_degree = max_degree_for(kind)
+            self.assertEqual(topology.build(kind, 300, max_degree, rng=7), topology.build(kind, 300, max_degree, rng=7))
+
+    def test_module_random(self):
+        # rng=None draws from the random module, so seeding it reproduces the topology
+        for kind in topology.KINDS:
+            random.seed(5)
+            first = topology.build(kind, 100, max_degree_for(kind))
+            random.seed(5)
+            self.assertEqual(topology.build(kind, 100, max_degree_for(kind)), first)
+
+    def test_complete_respects_max_degree(self):
+        self.check(topology.build('complete', 4, 3), 4, 3)
+        with self.assertRaises(ValueError):
+            topology.build('complete', 5, 3)
+
+    def test_random_regular_degree(self):
+        adjacency = topology.random_regular(1000, 3, rng=1)
+        full = sum(1 for neighbors in adjacency.values() if len(neighbors) == 3)
+        self.assertGreater(full, 990)
+
+    def test_ring_random_min_degree(self):
+        adjacency = topology.ring_random(500, max_degree=4, rng=2, min_degree=2)
+        self.check(adjacency, 500, 4)
+        self.assertTrue(all(len(neighbors) >= 2 for neighbors in adjacency.values()))
+
+    def test_ensure_connected_splits_full_components(self):
+        # Two full triangles, no room left for a link between them
+        graph = topology._Graph(6, 2)
+        for i, j in ((0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3)):
+            graph.link(i, j)
+        self.check(topology.ensure_connected(graph, rng=0), 6, 2)
+
+    def test_unconnectable_degree(self):
+        with self.assertRaises(ValueError):
+            topology.ring_random(4, max_degree=1, rng=0)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            topology.build('star', 10)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'topology.json')
+            built = topology.load_or_build('small_world', 50, 3, seed=3, path=path)
+            self.assertTrue(os.path.exists(path))
+            # A different seed is ignored once the file exists
+            self.assertEqual(topology.load_or_build('small_world', 50, 3, seed=4, path=path), built)
+            with self.assertRaises(ValueError):
+                topology.load_or_build('small_world', 60, 3, path=path)
+
+
+if __name__ == '__main__':
+    unittest.main()
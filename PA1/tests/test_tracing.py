@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.tracing import Tracer, TraceWriter, read_spans  # Absolute import
+from utils.trace_report import critical_path, transactions, report
+from utils.codec import encode, decode
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.writer = TraceWriter(self.tmp.name)
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_untraced_messages_are_left_alone(self):
+        tracer = Tracer(1, self.writer, self.clock)
+        handled = []
+        handler = tracer.wrap(lambda message, addr: handled.append(tracer.current()), 'lookup')
+        handler({'type': 'lookup'}, None)
+        message = {'type': 'lookup'}
+        tracer.stamp(message)
+        self.assertEqual(handled, [None])
+        self.assertNotIn('trace_id', message)
+        self.assertIsNone(self.writer.thread)  # Nothing was ever recorded
+
+    def test_hops_chain_through_messages(self):
+        buyer = Tracer(1, self.writer, self.clock)
+        seller = Tracer(2, self.writer, self.clock)
+        trace_id = buyer.new_trace()
+        buy = {'type': 'buy'}
+        with buyer.span(trace_id, None, 'start'):
+            buyer.stamp(buy)
+            self.clock.now = 0.001
+        confirmation = {'type': 'buy_confirmation'}
+
+        def handle_buy(message, addr):
+            self.clock.now = 0.003
+            seller.stamp(confirmation)
+            seller.stamp({'type': 'routing_update'})  # Not a traced type: no context
+        seller.wrap(handle_buy, 'buy')(buy, None)
+        self.clock.now = 0.005
+        buyer.wrap(lambda message, addr: buyer.annotate(done=True), 'buy_confirmation')(confirmation, None)
+        self.assertTrue(self.writer.flush())
+
+        spans = read_spans(self.tmp.name)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['trace_1.jsonl', 'trace_2.jsonl'])
+        path = critical_path(spans)
+        self.assertEqual([span['name'] for span in path], ['start', 'buy', 'buy_confirmation'])
+        self.assertEqual([span['peer'] for span in path], [1, 2, 1])
+        self.assertEqual(path[1]['parent'], path[0]['span'])
+        self.assertEqual(path[2]['parent'], path[1]['span'])
+        self.assertTrue(all(span['trace'] == trace_id for span in spans))
+        self.assertEqual(path[1]['sent'], 0.003)
+
+    def test_legs_add_up_to_the_transaction(self):
+        spans = [
+            # A first attempt that timed out, then the lookup that worked
+            {'trace': 7, 'span': 1, 'parent': None, 'peer': 1, 'name': 'start', 'start': 0.0, 'sent': 0.001, 'end': 0.001},
+            {'trace': 7, 'span': 2, 'parent': None, 'peer': 1, 'name': 'start', 'start': 0.100, 'sent': 0.101, 'end': 0.102},
+            {'trace': 7, 'span': 3, 'parent': 2, 'peer': 2, 'name': 'lookup', 'start': 0.103, 'sent': 0.104, 'end': 0.104},
+            {'trace': 7, 'span': 4, 'parent': 3, 'peer': 1, 'name': 'reply', 'start': 0.106, 'sent': 0.107, 'end': 0.107},
+            {'trace': 7, 'span': 5, 'parent': 4, 'peer': 2, 'name': 'buy', 'start': 0.108, 'sent': 0.109, 'end': 0.109},
+            {'trace': 7, 'span': 6, 'parent': 5, 'peer': 1, 'name': 'buy_confirmation', 'start': 0.110, 'end': 0.111,
+             'fields': {'done': True}},
+            # Never confirmed
+            {'trace': 8, 'span': 9, 'parent': None, 'peer': 3, 'name': 'start', 'start': 0.0, 'end': 0.001},
+        ]
+        by_trace = {transaction['trace']: transaction for transaction in transactions(spans)}
+        self.assertIsNone(by_trace[8]['path'])
+        transaction = by_trace[7]
+        self.assertAlmostEqual(transaction['total'], 0.111)
+        self.assertAlmostEqual(transaction['retries'], 0.100)
+        legs = transaction['legs']
+        self.assertEqual([name for name, _, _ in legs], ['start', 'lookup', 'reply', 'buy', 'buy_confirmation'])
+        self.assertAlmostEqual(legs[0][1], 0.001)  # Up to the send, not the span's end
+        self.assertAlmostEqual(legs[1][1], 0.003)
+        self.assertAlmostEqual(transaction['retries'] + sum(leg for _, leg, _ in legs), transaction['total'])
+        lines = report(spans, slowest=1)
+        self.assertEqual(lines[0], "2 traces (1 complete), 7 spans from 3 peers")
+        self.assertTrue(any(line.startswith("Trace 0000000000000007: 111.000 ms") for line in lines))
+
+    def test_full_queue_drops_and_counts(self):
+        writer = TraceWriter(self.tmp.name, queue_size=1)
+        writer.thread = threading.current_thread()  # Stands in for a writer that has fallen behind
+        tracer = Tracer(1, writer, self.clock)
+        for _ in range(3):
+            with tracer.span(7, None, 'start'):
+                pass
+        self.assertEqual(writer.dropped, 2)
+        writer.thread = None
+        writer.start()
+        self.assertTrue(writer.flush())
+        self.assertEqual(len(read_spans(self.tmp.name)), 1)
+
+    def test_sampling(self):
+        self.assertIsNone(Tracer(1, self.writer, self.clock, sample=0.0).new_trace())
+        self.assertIsNotNone(Tracer(1, self.writer, self.clock, sample=1.0).new_trace())
+
+    def test_trace_fields_stay_binary(self):
+        message = {'type': 'reply', 'request_id': 'a' * 64, 'seller_id': 2, 'product_name': 'fish',
+                   'seller_addr': ('127.0.0.1', 5002), 'reply_path': [], 'trace_id': 2 ** 63 - 1, 'span_id': 2 << 32 | 5}
+        data = encode(message)
+        self.assertEqual(decode(data, accept_pickle=False), message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from utils.worker_pool import WorkerPool  # Absolute import
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_runs_jobs(self):
+        pool = WorkerPool(workers=2, queue_size=10)
+        pool.start()
+        results = []
+        for i in range(5):
+            self.assertTrue(pool.submit(results.append, i))
+        pool.shutdown()
+        self.assertEqual(sorted(results), [0, 1, 2, 3, 4])
+        self.assertEqual(pool.stats()['completed'], 5)
+
+    def test_rejects_when_full(self):
+        pool = WorkerPool(workers=1, queue_size=2)
+        pool.start()
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        pool.submit(block)
+        started.wait(2)  # The worker is busy, so further jobs stay queued
+        self.assertTrue(pool.submit(lambda: None))
+        self.assertTrue(pool.submit(lambda: None))
+        self.assertFalse(pool.submit(lambda: None))
+        stats = pool.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['queue_depth'], 2)
+        release.set()
+        pool.shutdown()
+
+    def test_failing_job_is_counted(self):
+        pool = WorkerPool(workers=1, queue_size=2)
+        pool.start()
+        pool.submit(lambda: 1 / 0)
+        pool.shutdown()
+        self.assertEqual(pool.stats()['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# attenuated_bloom.py
+"""
+Attenuated Bloom filters for routing indexes.
+
+A filter has `depth` levels. For the filter a peer keeps about one neighbor link,
+level i summarizes the products that can be bought i hops past that neighbor
+(level 0 is the neighbor itself). Each level is a small Bloom filter stored as an
+int bitmask, so merging levels is a single OR.
+"""
+import hashlib
+
+
+class AttenuatedBloomFilter:
+    def __init__(self, depth, num_bits=64, num_hashes=3, levels=None):
+        self.depth = depth
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.levels = list(levels) if levels is not None else [0] * depth
+
+    def _mask(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], 'little')
+        h2 = int.from_bytes(digest[4:], 'little') | 1
+        mask = 0
+        for i in range(self.num_hashes):
+            mask |= 1 << ((h1 + i * h2) % self.num_bits)
+        return mask
+
+    def add(self, item, level=0):
+        self.levels[level] |= self._mask(item)
+
+    def distance(self, item):
+        """Smallest level that (probably) contains item, or None if no level does."""
+        mask = self._mask(item)
+        for level, bits in enumerate(self.levels):
+            if bits & mask == mask:
+                return level
+        return None
+
+    def merge_shifted(self, other):
+        """OR other's levels into ours one level deeper; other's last level falls off."""
+        for level in range(1, self.depth):
+            self.levels[level] |= other.levels[level - 1]
+
+    def to_wire(self):
+        """Levels as a list of bytes, for a routing_update message."""
+        size = (self.num_bits + 7) // 8
+        return [bits.to_bytes(size, 'big') for bits in self.levels]
+
+    @classmethod
+    def from_wire(cls, levels, num_hashes=3):
+        num_bits = len(levels[0]) * 8 if levels else 64
+        return cls(len(levels), num_bits, num_hashes, [int.from_bytes(bytes(level), 'big') for level in levels])
+
+    def __eq__(self, other):
+        return isinstance(other, AttenuatedBloomFilter) and self.levels == other.levels
@@ -0,0 +1,280 @@
+# codec.py
+"""
+Compact binary wire format for the marketplace messages.
+
+A datagram is a fixed header followed by the fields that are present, in schema order:
+
+    magic (1 byte) | type tag (1 byte) | presence bitmap (2 bytes) | fields...
+
+Field names never go on the wire, product names and sha256 request ids are
+packed into one byte and 32 bytes, and decoding works directly on a memoryview
+of the receive buffer. Anything that does not start with MAGIC is treated as a
+pickled dict, which is kept as a fallback format. Decoding pickle runs whatever
+the datagram contains, so decode() only accepts it when asked to.
+"""
+import pickle
+import socket
+import struct
+
+MAGIC = 0xB7
+
+# Product names known to every peer; anything else is sent as a string
+PRODUCTS = ("fish", "salt", "boar")
+_PRODUCT_INDEX = {name: i for i, name in enumerate(PRODUCTS)}
+_PRODUCT_STR = 0xFF
+
+_HEADER = struct.Struct('!BBH')
+_U8 = struct.Struct('!B')
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_I32 = struct.Struct('!i')
+_U64 = struct.Struct('!Q')
+_BOOL = struct.Struct('!?')
+_IPV4 = struct.Struct('!B4sI')  # tag, packed address, port
+
+
+# Field encoders append bytes to out, decoders return (value, new_offset)
+
+def _put_int(out, value):
+    out.append(_I32.pack(value))
+
+def _get_int(buf, offset):
+    return _I32.unpack_from(buf, offset)[0], offset + 4
+
+def _put_u64(out, value):
+    out.append(_U64.pack(value))
+
+def _get_u64(buf, offset):
+    return _U64.unpack_from(buf, offset)[0], offset + 8
+
+def _put_bool(out, value):
+    out.append(_BOOL.pack(value))
+
+def _get_bool(buf, offset):
+    return _BOOL.unpack_from(buf, offset)[0], offset + 1
+
+def _put_str(out, value):
+    data = value.encode('utf-8')
+    out.append(_U16.pack(len(data)))
+    out.append(data)
+
+def _get_str(buf, offset):
+    length = _U16.unpack_from(buf, offset)[0]
+    offset += 2
+    return str(buf[offset:offset + length], 'utf-8'), offset + length
+
+def _put_request_id(out, value):
+    # sha256 hex digests (what lookup_item/buy_item generate) go out as 32 raw bytes
+    if isinstance(value, str) and len(value) == 64:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and raw.hex() == value:
+            out.append(b'\x00')
+            out.append(raw)
+            return
+    out.append(b'\x01')
+    _put_str(out, str(value))
+
+def _get_request_id(buf, offset):
+    if buf[offset] == 0:
+        return buf[offset + 1:offset + 33].hex(), offset + 33
+    return _get_str(buf, offset + 1)
+
+def _put_product(out, value):
+    index = _PRODUCT_INDEX.get(value)
+    if index is not None:
+        out.append(_U8.pack(index))
+    else:
+        out.append(_U8.pack(_PRODUCT_STR))
+        _put_str(out, value)
+
+def _get_product(buf, offset):
+    index = buf[offset]
+    if index == _PRODUCT_STR:
+        return _get_str(buf, offset + 1)
+    return PRODUCTS[index], offset + 1
+
+def _put_addr(out, value):
+    ip, port = value
+    try:
+        packed = socket.inet_pton(socket.AF_INET, ip)
+    except (OSError, TypeError):
+        packed = None
+    if packed is not None and socket.inet_ntop(socket.AF_INET, packed) == ip:
+        out.append(_IPV4.pack(0, packed, port))
+    else:
+        out.append(b'\x01')
+        _put_str(out, ip)
+        out.append(_U32.pack(port))
+
+def _get_addr(buf, offset):
+    if buf[offset] == 0:
+        _, packed, port = _IPV4.unpack_from(buf, offset)
+        return (socket.inet_ntop(socket.AF_INET, packed), port), offset + _IPV4.size
+    ip, offset = _get_str(buf, offset + 1)
+    return (ip, _U32.unpack_from(buf, offset)[0]), offset + 4
+
+def _put_path(out, value):
+    # A list of (peer_id, ip, port) hops
+    out.append(_U16.pack(len(value)))
+    for peer_id, ip, port in value:
+        _put_int(out, peer_id)
+        _put_addr(out, (ip, port))
+
+def _get_path(buf, offset):
+    count = _U16.unpack_from(buf, offset)[0]
+    offset += 2
+    path = []
+    for _ in range(count):
+        peer_id, offset = _get_int(buf, offset)
+        (ip, port), offset = _get_addr(buf, offset)
+        path.append((peer_id, ip, port))
+    return path, offset
+
+def _put_bytes_list(out, value):
+    out.append(_U16.pack(len(value)))
+    for item in value:
+        out.append(_U16.pack(len(item)))
+        out.append(bytes(item))
+
+def _get_bytes_list(buf, offset):
+    count = _U16.unpack_from(buf, offset)[0]
+    offset += 2
+    items = []
+    for _ in range(count):
+        length = _U16.unpack_from(buf, offset)[0]
+        offset += 2
+        items.append(bytes(buf[offset:offset + length]))
+        offset += length
+    return items, offset
+
+
+_KINDS = {
+    'int': (_put_int, _get_int),
+    'u64': (_put_u64, _get_u64),
+    'bool': (_put_bool, _get_bool),
+    'str': (_put_str, _get_str),
+    'request_id': (_put_request_id, _get_request_id),
+    'product': (_put_product, _get_product),
+    'addr': (_put_addr, _get_addr),
+    'path': (_put_path, _get_path),
+    'bytes_list': (_put_bytes_list, _get_bytes_list),
+}
+
+# type -> (tag, [(field, kind), ...]). A schema lists every field a message of that
+# type may carry in PA1 or PA2; the presence bitmap records which ones are set.
+# The message types of a transaction also carry a trace context (utils/tracing.py).
+SCHEMAS = {
+    'lookup': (1, [
+        ('request_id', 'request_id'), ('buyer_id', 'int'), ('product_name', 'product'),
+        ('hop_count', 'int'), ('search_path', 'path'), ('last_peer_id', 'int'),
+        ('stale_seller_id', 'int'), ('walker', 'bool'), ('buyer_addr', 'addr'),
+        ('trace_id', 'u64'), ('span_id', 'u64'),
+    ]),
+    'reply': (2, [
+        ('request_id', 'request_id'), ('seller_id', 'int'), ('product_name', 'product'),
+        ('seller_addr', 'addr'), ('reply_path', 'path'), ('from_cache', 'bool'),
+        ('direct', 'bool'), ('notify', 'bool'), ('replier_id', 'int'),
+        ('trace_id', 'u64'), ('span_id', 'u64'),
+    ]),
+    'buy': (3, [
+        ('request_id', 'request_id'), ('buyer_id', 'int'), ('seller_id', 'int'),
+        ('buyer_address', 'addr'), ('product_name', 'product'), ('quantity', 'int'),
+        ('trace_id', 'u64'), ('span_id', 'u64'),
+    ]),
+    'buy_confirmation': (4, [
+        ('request_id', 'request_id'), ('product_name', 'product'), ('buyer_id', 'int'),
+        ('seller_id', 'int'), ('status', 'bool'), ('quantity', 'int'),
+        ('trace_id', 'u64'), ('span_id', 'u64'),
+    ]),
+    'no_seller': (5, [
+        ('request_id', 'request_id'),
+    ]),
+    'sell_confirmation': (6, [
+        ('request_id', 'request_id'), ('buyer_id', 'int'), ('product_name', 'product'),
+        ('status', 'bool'), ('quantity', 'int'),
+        ('trace_id', 'u64'), ('span_id', 'u64'),
+    ]),
+    'update_inventory': (7, [
+        ('seller_id', 'int'), ('address', 'addr'), ('product_name', 'product'), ('stock', 'int'),
+    ]),
+    'election': (8, [
+        ('peer_id', 'int'), ('sender_id', 'int'),
+    ]),
+    'OK': (9, [
+        ('peer_id', 'int'), ('sender_id', 'int'),
+    ]),
+    'leader': (10, [
+        ('leader_id', 'int'), ('ip_address', 'str'), ('port', 'int'),
+    ]),
+    'routing_update': (11, [
+        ('sender_id', 'int'), ('levels', 'bytes_list'),
+    ]),
+    'walk_check': (12, [
+        ('request_id', 'request_id'), ('sender_id', 'int'),
+    ]),
+    'walk_status': (13, [
+        ('request_id', 'request_id'), ('active', 'bool'),
+    ]),
+}
+
+
+def _compile(schemas):
+    by_type, by_tag = {}, {}
+    for message_type, (tag, fields) in schemas.items():
+        compiled = [(name, 1 << bit) + _KINDS[kind] for bit, (name, kind) in enumerate(fields)]
+        by_type[message_type] = (tag, compiled, frozenset(name for name, _ in fields) | {'type'})
+        by_tag[tag] = (message_type, compiled)
+    return by_type, by_tag
+
+_BY_TYPE, _BY_TAG = _compile(SCHEMAS)
+
+
+def encode(message, wire_format='binary'):
+    """
+    Serialize a message dict. Messages of an unknown type or with fields their
+    schema does not list are pickled instead, so nothing is silently dropped.
+    """
+    if wire_format == 'binary':
+        schema = _BY_TYPE.get(message.get('type'))
+        if schema is not None and schema[2].issuperset(message.keys()):
+            tag, fields, _ = schema
+            out = [b'']
+            present = 0
+            for name, bit, put, _ in fields:
+                value = message.get(name)
+                if value is not None:
+                    present |= bit
+                    put(out, value)
+            out[0] = _HEADER.pack(MAGIC, tag, present)
+            return b''.join(out)
+    return pickle.dumps(message)
+
+
+def decode(buf, accept_pickle=False):
+    """
+    Deserialize one datagram (bytes or a memoryview over a receive buffer).
+    Raises ValueError for malformed data or for pickled data when accept_pickle is False.
+    """
+    if len(buf) == 0:
+        raise ValueError("empty datagram")
+    if buf[0] != MAGIC:
+        if not accept_pickle:
+            raise ValueError("pickled datagram rejected")
+        try:
+            return pickle.loads(buf)
+        except Exception as e:
+            raise ValueError(f"undecodable datagram: {e}") from e
+    try:
+        _, tag, present = _HEADER.unpack_from(buf, 0)
+        message_type, fields = _BY_TAG[tag]
+        message = {'type': message_type}
+        offset = _HEADER.size
+        for name, bit, _, get in fields:
+            if present & bit:
+                message[name], offset = get(buf, offset)
+    except (struct.error, KeyError, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed datagram: {e}") from e
+    return message
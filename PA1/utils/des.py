@@ -0,0 +1,213 @@
+# des.py
+"""
+Discrete-event simulation engine.
+
+A Simulator owns a virtual clock and a heap of events. run() pops the earliest
+event, moves the clock to its time and runs it, so a simulated hour costs only
+as much as the handlers it triggers. Everything happens on the calling thread,
+and all randomness comes from generators seeded by the simulation seed, so a
+run with the same seed replays exactly.
+
+SimNetwork is an in-memory datagram transport. send() delivers the bytes to the
+endpoint registered at the destination address after a delay drawn from a
+latency model; a model may also drop the datagram.
+
+Latency models are callables model(src, dst, rng) -> delay in seconds, or None
+to drop the datagram.
+"""
+import heapq
+import itertools
+import math
+import random
+
+
+class SimEvent:
+    """A scheduled callback; cancel() stops it from running."""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Simulator:
+    def __init__(self, seed=0, latency=None, loss_rate=0.0):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.now = 0.0
+        self.events = []  # (when, seq, SimEvent)
+        self.sequence = itertools.count()
+        self.events_run = 0
+        self.network = SimNetwork(self, latency or ConstantLatency(0.001), loss_rate)
+
+    def clock(self):
+        """The virtual time, in seconds since the start of the simulation."""
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        event = SimEvent(max(when, self.now), callback, args)
+        heapq.heappush(self.events, (event.when, next(self.sequence), event))
+        return event
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        return self.call_at(self.now, callback, *args)
+
+    def step(self):
+        """Run the next event. Returns False when no events are left."""
+        while self.events:
+            when, _, event = heapq.heappop(self.events)
+            if event.cancelled:
+                continue
+            self.now = when
+            self.events_run += 1
+            event.callback(*event.args)
+            return True
+        return False
+
+    def run(self, until=None, stop=None, max_events=None):
+        """
+        Run events until none are left, the clock would pass `until`, stop()
+        returns True (checked after every event) or max_events have run.
+        """
+        ran = 0
+        while self.events:
+            if self.events[0][2].cancelled:
+                heapq.heappop(self.events)
+                continue
+            if until is not None and self.events[0][0] > until:
+                self.now = until
+                break
+            if max_events is not None and ran >= max_events:
+                break
+            if self.step():
+                ran += 1
+            if stop is not None and stop():
+                break
+        return ran
+
+
+class SimNetwork:
+    def __init__(self, simulator, latency, loss_rate=0.0):
+        self.simulator = simulator
+        self.latency = latency
+        self.loss_rate = loss_rate
+        self.endpoints = {}  # addr -> endpoint with receive_datagram(data, src_addr)
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    def register(self, addr, endpoint):
+        if addr in self.endpoints:
+            raise OSError(f"Address {addr} already in use")
+        self.endpoints[addr] = endpoint
+
+    def unregister(self, addr):
+        self.endpoints.pop(addr, None)
+
+    def send(self, src_addr, dst_addr, data):
+        self.sent += 1
+        self.bytes_sent += len(data)
+        rng = self.simulator.rng
+        delay = self.latency(src_addr, dst_addr, rng)
+        if delay is None or (self.loss_rate and rng.random() < self.loss_rate):
+            self.dropped += 1
+            return
+        self.simulator.call_later(delay, self._deliver, src_addr, tuple(dst_addr), bytes(data))
+
+    def _deliver(self, src_addr, dst_addr, data):
+        endpoint = self.endpoints.get(dst_addr)
+        if endpoint is None:
+            # Nobody listening (peer shut down): UDP drops it silently
+            self.dropped += 1
+            return
+        self.delivered += 1
+        endpoint.receive_datagram(data, src_addr)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent,
+        }
+
+
+class ConstantLatency:
+    """Every datagram takes `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __call__(self, src, dst, rng):
+        return self.delay
+
+
+class UniformLatency:
+    """Delay drawn uniformly from [low, high] for every datagram."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def __call__(self, src, dst, rng):
+        return rng.uniform(self.low, self.high)
+
+
+class LogNormalLatency:
+    """Heavy-tailed delay with the given median; sigma controls the tail."""
+
+    def __init__(self, median, sigma=0.5):
+        self.mu = math.log(median)
+        self.sigma = sigma
+
+    def __call__(self, src, dst, rng):
+        return rng.lognormvariate(self.mu, self.sigma)
+
+
+class PerLinkLatency:
+    """
+    Each (src, dst) link gets a fixed base delay drawn once from base(src, dst, rng),
+    plus per-datagram jitter drawn uniformly from [0, jitter].
+    """
+
+    def __init__(self, base, jitter=0.0):
+        self.base = base
+        self.jitter = jitter
+        self.links = {}
+
+    def __call__(self, src, dst, rng):
+        link = (tuple(src), tuple(dst))
+        delay = self.links.get(link)
+        if delay is None:
+            delay = self.links[link] = self.base(src, dst, rng)
+        return delay + (rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+def parse_latency(spec):
+    """
+    Build a latency model from a command line spec:
+    'constant:D', 'uniform:LOW,HIGH', 'lognormal:MEDIAN[,SIGMA]' or 'link:LOW,HIGH[,JITTER]'.
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    if kind == 'constant':
+        return ConstantLatency(*values)
+    if kind == 'uniform':
+        return UniformLatency(*values)
+    if kind == 'lognormal':
+        return LogNormalLatency(*values)
+    if kind == 'link':
+        low, high = values[0], values[1]
+        jitter = values[2] if len(values) > 2 else 0.0
+        return PerLinkLatency(lambda src, dst, rng: rng.uniform(low, high), jitter)
+    raise ValueError(f"Unknown latency model '{spec}'")
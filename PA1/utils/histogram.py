@@ -0,0 +1,124 @@
+# histogram.py
+"""
+HDR-style latency histograms.
+
+Values are integer nanoseconds, counted in log-linear buckets: every power of
+two is split into the same number of sub-buckets, enough that a bucket is
+narrower than 10**-significant_figures of the values in it. Memory grows with
+the number of distinct buckets used, not with the number of values, and a
+percentile is off by at most that relative error.
+
+Histograms with the same precision merge by adding counts, so each buyer keeps
+its own without locking and a run (or a worker process, through to_dict())
+adds them up at the end.
+"""
+import math
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    def __init__(self, significant_figures=2):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError(f"significant_figures must be between 1 and 5, not {significant_figures}")
+        self.significant_figures = significant_figures
+        # Values below 2 ** sub_bits are counted exactly; above that, each power
+        # of two gets 2 ** (sub_bits - 1) buckets
+        self.sub_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self.counts = {}  # bucket index -> values counted in it
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bits
+        if shift <= 0:
+            return value
+        return (shift << (self.sub_bits - 1)) + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        """Largest value counted in bucket index."""
+        if index < 1 << self.sub_bits:
+            return index
+        shift = (index >> (self.sub_bits - 1)) - 1
+        lowest = (index - (shift << (self.sub_bits - 1))) << shift
+        return lowest + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        """Count value (nanoseconds; negative values count as 0) count times."""
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add other's values to this histogram. Returns self."""
+        if other.significant_figures != self.significant_figures:
+            raise ValueError("Cannot merge histograms of different precision")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, histograms, significant_figures=2):
+        result = cls(significant_figures)
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def value_at_percentile(self, percentile):
+        """Smallest value (to within the precision) that percentile % of the values are at or below; None if empty."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def percentiles(self, percentiles=PERCENTILES):
+        return {p: self.value_at_percentile(p) for p in percentiles}
+
+    def summary(self, percentiles=PERCENTILES, unit='ms'):
+        """One line: how many values, the percentiles and the max, in unit ('s', 'ms' or 'us')."""
+        if not self.count:
+            return "no samples"
+        scale = {'s': 1e9, 'ms': 1e6, 'us': 1e3}[unit]
+        parts = [f"p{p:g} {value / scale:.3f} {unit}" for p, value in self.percentiles(percentiles).items()]
+        parts.append(f"max {self.max / scale:.3f} {unit}")
+        return f"{self.count} samples: " + ", ".join(parts)
+
+    def to_dict(self):
+        """Plain data, for passing a histogram between processes."""
+        return {
+            'significant_figures': self.significant_figures,
+            'counts': sorted(self.counts.items()),
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['significant_figures'])
+        histogram.counts = {index: count for index, count in data['counts']}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
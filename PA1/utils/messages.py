@@ -66,3 +66,30 @@ class BuyConfirmationMessage:
             d['seller_id'],
             d['status']
         )
+
+class RoutingUpdateMessage:
+    def __init__(self, sender_id, levels):
+        self.type = 'routing_update'
+        self.sender_id = sender_id
+        self.levels = levels
+
+    def to_dict(self):
+        return self.__dict__
+
+class WalkCheckMessage:
+    def __init__(self, request_id, sender_id):
+        self.type = 'walk_check'
+        self.request_id = request_id
+        self.sender_id = sender_id
+
+    def to_dict(self):
+        return self.__dict__
+
+class WalkStatusMessage:
+    def __init__(self, request_id, active):
+        self.type = 'walk_status'
+        self.request_id = request_id
+        self.active = active
+
+    def to_dict(self):
+        return self.__dict__
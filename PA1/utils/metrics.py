@@ -0,0 +1,243 @@
+# metrics.py
+"""
+Per-peer metrics, readable while a run is going.
+
+Each peer owns a PeerMetrics:
+- counters grouped in families, each a Counter by label: 'received', 'sent',
+  'forwarded' and 'dropped' by message type, 'events' by event name
+  (timeouts, failed buys, elections, ...);
+- handler time by message type;
+- time spent waiting for the peer's locks, when they are utils.profiling.TimedLocks;
+- gauges, functions read only when a snapshot is taken.
+
+Recording is a dict increment without a lock, as messages_sent always was; two
+threads bumping the same counter at the same instant can lose a count, which
+monitoring can live with. Nothing is formatted or written on the hot path.
+
+The MetricsRegistry of a process collects its peers, and gauges of the process
+as a whole (records the log and trace writers dropped). snapshot() is plain JSON
+data; serve_http() serves it on a local port (GET / for the totals, /peers for
+every peer, /peers/<id> for one) and dump_every() appends it to a JSON-lines
+file, both on their own daemon threads.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PeerMetrics:
+    __slots__ = ('peer_id', 'families', 'handler_ns', 'lock_ns', 'gauges')
+
+    def __init__(self, peer_id):
+        self.peer_id = peer_id
+        self.families = {}  # family -> Counter of label -> count
+        self.handler_ns = {}  # message type -> [calls, total ns, max ns]
+        self.lock_ns = {}  # lock name -> [acquisitions, contended acquisitions, total wait ns, max wait ns]
+        self.gauges = {}  # name -> function returning the current value
+
+    def counter(self, family):
+        """The Counter of family, created on first use. Callers may keep it and increment it directly."""
+        counter = self.families.get(family)
+        if counter is None:
+            counter = self.families[family] = Counter()
+        return counter
+
+    def incr(self, family, label, amount=1):
+        self.counter(family)[label] += amount
+
+    def observe_handler(self, message_type, elapsed_ns):
+        entry = self.handler_ns.get(message_type)
+        if entry is None:
+            self.handler_ns[message_type] = [1, elapsed_ns, elapsed_ns]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed_ns
+            if elapsed_ns > entry[2]:
+                entry[2] = elapsed_ns
+
+    def observe_lock(self, name, wait_ns, contended):
+        entry = self.lock_ns.get(name)
+        if entry is None:
+            entry = self.lock_ns[name] = [0, 0, 0, 0]
+        entry[0] += 1
+        if contended:
+            entry[1] += 1
+            entry[2] += wait_ns
+            if wait_ns > entry[3]:
+                entry[3] = wait_ns
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                # e.g. a structure changed size while it was read; the next snapshot will do
+                gauges[name] = None
+        handlers = {}
+        for message_type, (calls, total, worst) in list(self.handler_ns.items()):
+            handlers[str(message_type)] = {
+                'calls': calls,
+                'total_ms': total / 1e6,
+                'mean_us': total / calls / 1e3,
+                'max_us': worst / 1e3,
+            }
+        locks = {}
+        for name, (acquisitions, contended, total, worst) in list(self.lock_ns.items()):
+            locks[name] = {
+                'acquisitions': acquisitions,
+                'contended': contended,
+                'wait_ms': total / 1e6,
+                'max_wait_us': worst / 1e3,
+            }
+        return {
+            'peer_id': self.peer_id,
+            'counters': {family: {str(label): count for label, count in list(counter.items())}
+                         for family, counter in list(self.families.items())},
+            'handlers': handlers,
+            'locks': locks,
+            'gauges': gauges,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.peers = {}  # peer_id -> PeerMetrics; peers that shut down stay, with their final counts
+        self.gauges = {}  # name -> function returning a value of the whole process, e.g. the log's drops
+        self.server = None
+        self.dumper = None
+
+    def register(self, metrics):
+        self.peers[metrics.peer_id] = metrics
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self, peers=True):
+        """Every peer's snapshot (unless peers is False) and the counters summed over all of them."""
+        snapshots = [metrics.snapshot() for metrics in list(self.peers.values())]
+        totals = {}
+        handlers = {}
+        locks = {}
+        for snapshot in snapshots:
+            for family, counts in snapshot['counters'].items():
+                total = totals.setdefault(family, {})
+                for label, count in counts.items():
+                    total[label] = total.get(label, 0) + count
+            for message_type, handler in snapshot['handlers'].items():
+                merged = handlers.setdefault(message_type, {'calls': 0, 'total_ms': 0.0, 'max_us': 0.0})
+                merged['calls'] += handler['calls']
+                merged['total_ms'] += handler['total_ms']
+                merged['max_us'] = max(merged['max_us'], handler['max_us'])
+            for name, lock in snapshot['locks'].items():
+                merged = locks.setdefault(name, {'acquisitions': 0, 'contended': 0, 'wait_ms': 0.0, 'max_wait_us': 0.0})
+                merged['acquisitions'] += lock['acquisitions']
+                merged['contended'] += lock['contended']
+                merged['wait_ms'] += lock['wait_ms']
+                merged['max_wait_us'] = max(merged['max_wait_us'], lock['max_wait_us'])
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        result = {'time': time.time(), 'peer_count': len(snapshots), 'totals': totals, 'handlers': handlers, 'locks': locks,
+                  'gauges': gauges}
+        if peers:
+            result['peers'] = snapshots
+        return result
+
+    def peer_snapshot(self, peer_id):
+        metrics = self.peers.get(peer_id)
+        return metrics.snapshot() if metrics is not None else None
+
+    def serve_http(self, port, host='localhost'):
+        """Serve snapshots over HTTP on a daemon thread. Returns the server (port 0 picks a free one)."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = [part for part in self.path.split('?')[0].split('/') if part]
+                if not parts:
+                    body = registry.snapshot(peers=False)
+                elif parts == ['peers']:
+                    body = registry.snapshot()
+                elif len(parts) == 2 and parts[0] == 'peers' and parts[1].lstrip('-').isdigit():
+                    body = registry.peer_snapshot(int(parts[1]))
+                else:
+                    body = None
+                if body is None:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Requests are not worth a line of output each
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        return self.server
+
+    def dump(self, path, peers=True):
+        """Append one snapshot to path as a JSON line."""
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot(peers)) + '\n')
+
+    def dump_every(self, path, interval, peers=True):
+        """Append a snapshot to path every interval seconds on a daemon thread, until close()."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.dump(path, peers)
+
+        threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+        self.dumper = stop
+        return stop
+
+    def close(self, path=None):
+        """Stop serving and dumping; with path, write a last snapshot there."""
+        if self.dumper is not None:
+            self.dumper.set()
+            self.dumper = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if path:
+            self.dump(path)
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def shared_registry():
+    """The process-wide registry every peer registers its metrics with."""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = MetricsRegistry()
+        return _shared_registry
+
+
+def start_reporting(port=None, path=None, interval=5.0):
+    """Serve the shared registry on port and dump it to path every interval seconds, each if given."""
+    registry = shared_registry()
+    if port is not None:
+        server = registry.serve_http(port)
+        print(f"Metrics at http://{server.server_address[0]}:{server.server_address[1]}/ (/peers, /peers/<id>)")
+    if path:
+        registry.dump_every(path, interval)
+    return registry
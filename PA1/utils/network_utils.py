@@ -1,6 +1,23 @@
 # network_utils.py
 
-from collections import deque
+from collections import deque, namedtuple
+
+# Sources whose BFS runs together, one bit each, in distance_profile
+BFS_BATCH_SOURCES = 4096
+# Peers LandmarkMetrics keeps distances from
+LANDMARKS = 4
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+# eccentricity: peer_id -> hops to the farthest peer (inf if some peer is unreachable)
+# histogram: histogram[d] = ordered (peer, peer) pairs d hops apart; histogram[0] counts each peer itself
+# unreachable_pairs: ordered pairs with no path between them
+DistanceProfile = namedtuple('DistanceProfile', ['eccentricity', 'histogram', 'unreachable_pairs'])
+
 
 def bfs_paths(start_peer, peers):
     distances = {peer.peer_id: float('inf') for peer in peers}
@@ -14,10 +31,334 @@ def bfs_paths(start_peer, peers):
                 queue.append(neighbor)
     return distances
 
+
+class CSRGraph:
+    """
+    Compressed sparse row adjacency. Peers are numbered 0..n-1 in the order of
+    ids (index maps a peer id back to its number), and the neighbors of peer i
+    are targets[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, ids, neighbor_lists):
+        self.ids = list(ids)
+        self.index = {peer_id: i for i, peer_id in enumerate(self.ids)}
+        self.offsets = [0]
+        self.targets = []
+        for neighbor_ids in neighbor_lists:
+            self.targets.extend(self.index[neighbor_id] for neighbor_id in neighbor_ids)
+            self.offsets.append(len(self.targets))
+
+    @classmethod
+    def from_peers(cls, peers):
+        return cls([peer.peer_id for peer in peers], [[neighbor.peer_id for neighbor in peer.neighbors] for peer in peers])
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        """From {peer_id: [neighbor ids]}."""
+        return cls(adjacency.keys(), adjacency.values())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def distances(self, source):
+        """Hops from node source to every node, as a list indexed by node; -1 if unreachable."""
+        offsets, targets = self.offsets, self.targets
+        distances = [-1] * len(self.ids)
+        distances[source] = 0
+        frontier = [source]
+        level = 0
+        while frontier:
+            level += 1
+            next_frontier = []
+            for node in frontier:
+                for neighbor in targets[offsets[node]:offsets[node + 1]]:
+                    if distances[neighbor] < 0:
+                        distances[neighbor] = level
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return distances
+
+
+def _bfs_batch(graph, first, count):
+    """
+    BFS from nodes first..first+count-1 at once. Each node holds an int whose
+    bit i says whether source first+i has reached it, so one OR per edge and
+    level advances every source of the batch.
+    Returns (histogram, eccentricity by bit, bitmask of the sources that reached every node).
+    """
+    n = len(graph)
+    adjacency = [graph.neighbors(node) for node in range(n)]
+    frontier = [0] * n
+    for i in range(count):
+        frontier[first + i] = 1 << i
+    visited = frontier[:]
+    histogram = [count]
+    level_hits = []  # level_hits[d - 1]: sources that reached some node at hop d
+    while True:
+        next_frontier = [0] * n
+        hits = 0
+        pairs = 0
+        for node in range(n):
+            bits = 0
+            for neighbor in adjacency[node]:
+                bits |= frontier[neighbor]
+            bits &= ~visited[node]
+            if bits:
+                next_frontier[node] = bits
+                visited[node] |= bits
+                hits |= bits
+                pairs += _popcount(bits)
+        if not hits:
+            break
+        histogram.append(pairs)
+        level_hits.append(hits)
+        frontier = next_frontier
+
+    # A source's eccentricity is the last hop at which it reached a new node
+    eccentricity = [0] * count
+    remaining = (1 << count) - 1
+    for level in range(len(level_hits), 0, -1):
+        bits = level_hits[level - 1] & remaining
+        remaining &= ~bits
+        while bits:
+            low = bits & -bits
+            eccentricity[low.bit_length() - 1] = level
+            bits ^= low
+    reached_all = (1 << count) - 1
+    for bits in visited:
+        reached_all &= bits
+    return histogram, eccentricity, reached_all
+
+
+def distance_profile(graph):
+    """Exact per-peer eccentricity and the hop-distance histogram from one all-sources BFS."""
+    n = len(graph)
+    eccentricity = {}
+    histogram = []
+    for first in range(0, n, BFS_BATCH_SOURCES):
+        count = min(BFS_BATCH_SOURCES, n - first)
+        batch_histogram, batch_eccentricity, reached_all = _bfs_batch(graph, first, count)
+        if len(batch_histogram) > len(histogram):
+            histogram.extend([0] * (len(batch_histogram) - len(histogram)))
+        for d, pairs in enumerate(batch_histogram):
+            histogram[d] += pairs
+        for i in range(count):
+            eccentricity[graph.ids[first + i]] = batch_eccentricity[i] if reached_all >> i & 1 else float('inf')
+    return DistanceProfile(eccentricity, histogram, n * n - sum(histogram))
+
+
+def double_sweep_diameter(graph, start=0, sweeps=2):
+    """
+    Lower bound on the diameter in O(sweeps * (N + E)): BFS from start, then
+    from the farthest node found, and so on. Exact on trees and usually exact
+    or one short on the sparse topologies used here. inf if the graph is disconnected.
+    """
+    if len(graph) == 0:
+        return 0
+    best = 0
+    node = start
+    for _ in range(sweeps):
+        distances = graph.distances(node)
+        if min(distances) < 0:
+            return float('inf')
+        farthest = max(range(len(distances)), key=distances.__getitem__)
+        best = max(best, distances[farthest])
+        node = farthest
+    return best
+
+
+def profile_diameter(profile):
+    """Diameter from a DistanceProfile: inf if some pair is unreachable."""
+    if profile.unreachable_pairs:
+        return float('inf')
+    return len(profile.histogram) - 1
+
+
 def graph_diameter(peers):
-    max_distance = 0
-    for peer in peers:
-        distances = bfs_paths(peer, peers)
-        furthest_peer = max(distances.values())
-        max_distance = max(max_distance, furthest_peer)
-    return max_distance
+    return profile_diameter(distance_profile(CSRGraph.from_peers(peers))) if peers else 0
+
+
+def adjacency_diameter(adjacency):
+    """graph_diameter for a topology given as {peer_id: [neighbor ids]}."""
+    return profile_diameter(distance_profile(CSRGraph.from_adjacency(adjacency))) if adjacency else 0
+
+
+class IncrementalBFS:
+    """
+    Hop distances from one source peer, kept up to date as the topology changes.
+
+    adjacency is the live {peer_id: neighbor ids} being changed; call
+    edge_added() or edge_removed() after each change. Only peers whose distance
+    changes are visited: an added edge lowers distances outward from its far
+    end, and a removed one raises the distances of the peers whose every
+    shortest path used it (Ramalingam-Reps, for unit weights).
+    """
+
+    def __init__(self, adjacency, source):
+        self.adjacency = adjacency
+        self.source = source
+        self.distance = {}  # peer_id -> hops; unreachable peers are missing
+        self.levels = []  # levels[d]: peers d hops from source
+        self._set(source, 0)
+        self._lower_from(source)
+
+    def _set(self, peer, d):
+        old = self.distance.get(peer)
+        if old is not None:
+            self.levels[old] -= 1
+        self.distance[peer] = d
+        if d >= len(self.levels):
+            self.levels.extend([0] * (d + 1 - len(self.levels)))
+        self.levels[d] += 1
+
+    def _lower_from(self, peer):
+        """BFS outward from peer, lowering every distance it improves."""
+        queue = deque([peer])
+        while queue:
+            peer = queue.popleft()
+            d = self.distance[peer] + 1
+            for neighbor in self.adjacency[peer]:
+                old = self.distance.get(neighbor)
+                if old is None or old > d:
+                    self._set(neighbor, d)
+                    queue.append(neighbor)
+
+    def edge_added(self, u, v):
+        du, dv = self.distance.get(u), self.distance.get(v)
+        if du is None or (dv is not None and dv < du):
+            u, v, du, dv = v, u, dv, du
+        if du is None or (dv is not None and dv <= du + 1):
+            return
+        self._set(v, du + 1)
+        self._lower_from(v)
+
+    def edge_removed(self, u, v):
+        du, dv = self.distance.get(u), self.distance.get(v)
+        if du is None or dv is None or du == dv:
+            return
+        child = v if dv > du else u
+        # Peers left without a neighbor one hop closer, found in BFS order so
+        # that every peer is decided after all the peers a hop closer
+        affected = set()
+        queued = {child}
+        queue = deque([child])
+        while queue:
+            peer = queue.popleft()
+            d = self.distance[peer]
+            if any(self.distance.get(n) == d - 1 and n not in affected for n in self.adjacency[peer]):
+                continue
+            affected.add(peer)
+            for neighbor in self.adjacency[peer]:
+                if neighbor not in queued and self.distance.get(neighbor) == d + 1:
+                    queued.add(neighbor)
+                    queue.append(neighbor)
+
+        # Settle them again in order of their new distance, through the unaffected peers
+        for peer in affected:
+            self.levels[self.distance.pop(peer)] -= 1
+        buckets = {}
+        for peer in affected:
+            reached = [self.distance[n] for n in self.adjacency[peer] if n in self.distance]
+            if reached:
+                buckets.setdefault(min(reached) + 1, []).append(peer)
+        level = min(buckets, default=0)
+        while buckets:
+            for peer in buckets.pop(level, ()):
+                if peer in self.distance:
+                    continue
+                self._set(peer, level)
+                for neighbor in self.adjacency[peer]:
+                    if neighbor in affected and neighbor not in self.distance:
+                        buckets.setdefault(level + 1, []).append(neighbor)
+            level += 1
+
+    def node_removed(self, peer):
+        """peer has left, its edges removed first."""
+        d = self.distance.pop(peer, None)
+        if d is not None:
+            self.levels[d] -= 1
+
+    def eccentricity(self):
+        """Hops to the farthest peer reachable from source."""
+        while len(self.levels) > 1 and self.levels[-1] == 0:
+            self.levels.pop()
+        return len(self.levels) - 1
+
+
+class LandmarkMetrics:
+    """
+    Diameter, eccentricity and connectivity estimates for a changing topology,
+    from an IncrementalBFS rooted at each of a few landmark peers, so a change
+    costs a few partial BFS instead of an all-pairs recomputation.
+
+    Each landmark is the farthest peer from the one before, as in
+    double_sweep_diameter, so the largest landmark eccentricity is a lower bound
+    on the diameter that is usually exact or one short. Register it as a
+    listener of a topology.Overlay, or call the edge_*/node_* methods by hand.
+    """
+
+    def __init__(self, adjacency, landmarks=LANDMARKS):
+        self.adjacency = adjacency
+        self.landmarks = landmarks
+        self.trees = []
+        self._add_landmarks()
+
+    def _add_landmarks(self):
+        while len(self.trees) < min(self.landmarks, len(self.adjacency)):
+            sources = {tree.source for tree in self.trees}
+            if self.trees:
+                distance = self.trees[-1].distance
+                candidates = [peer for peer in distance if peer not in sources] or [peer for peer in self.adjacency if peer not in sources]
+                source = max(candidates, key=lambda peer: distance.get(peer, -1))
+            else:
+                source = next(iter(self.adjacency))
+            self.trees.append(IncrementalBFS(self.adjacency, source))
+
+    def edge_added(self, u, v):
+        for tree in self.trees:
+            tree.edge_added(u, v)
+
+    def edge_removed(self, u, v):
+        for tree in self.trees:
+            tree.edge_removed(u, v)
+
+    def node_added(self, peer):
+        self._add_landmarks()
+
+    def node_removed(self, peer):
+        """peer has left, its edges removed first. A departed landmark is replaced."""
+        self.trees = [tree for tree in self.trees if tree.source != peer]
+        for tree in self.trees:
+            tree.node_removed(peer)
+        self._add_landmarks()
+
+    def connected(self):
+        return not self.trees or len(self.trees[0].distance) == len(self.adjacency)
+
+    def diameter(self):
+        """Lower bound on the diameter; inf if the topology is disconnected."""
+        return self.diameter_bounds()[0]
+
+    def diameter_bounds(self):
+        """(lower, upper) bounds on the diameter; (inf, inf) if the topology is disconnected."""
+        if not self.trees:
+            return 0, 0
+        if not self.connected():
+            return float('inf'), float('inf')
+        eccentricities = [tree.eccentricity() for tree in self.trees]
+        return max(eccentricities), 2 * min(eccentricities)
+
+    def eccentricity_bounds(self, peer):
+        """(lower, upper) bounds on peer's eccentricity, by the triangle inequality through each landmark."""
+        if not self.connected():
+            return float('inf'), float('inf')
+        lower, upper = 0, float('inf')
+        for tree in self.trees:
+            d = tree.distance[peer]
+            eccentricity = tree.eccentricity()
+            lower = max(lower, d, eccentricity - d)
+            upper = min(upper, d + eccentricity)
+        return lower, upper
@@ -0,0 +1,228 @@
+# profiling.py
+"""
+Instrumentation for the peers' message handlers.
+
+- timed() wraps a handler so every call adds its time to the peer's metrics,
+  by message type (count, total and max).
+- TimedLock stands in for a threading.Lock and records, per lock name, how
+  often it was taken, how often a thread had to wait for it and for how long.
+  An uncontended acquire costs one extra non-blocking attempt.
+- HandlerProfiler runs every handler of a set of peers under cProfile, or
+  samples the stacks of the threads inside a handler, for a time window, and
+  writes one file per peer: peer_<id>.prof (pstats) or peer_<id>.folded
+  (collapsed stacks, one 'frame;frame;... count' line each, as flame graph
+  tools read them).
+
+Peers rebuild their handler table with instrument() to put a profiler in or
+take it out, so nothing is paid outside the window.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILERS = ('cprofile', 'sample')
+
+
+def timed(handler, metrics, message_type):
+    """handler(message, addr), adding its time to metrics under message_type."""
+    observe = metrics.observe_handler
+    clock = time.perf_counter_ns
+
+    def run(message, addr):
+        started = clock()
+        try:
+            handler(message, addr)
+        finally:
+            observe(message_type, clock() - started)
+    return run
+
+
+class TimedLock:
+    __slots__ = ('lock', 'metrics', 'name')
+
+    def __init__(self, metrics, name, lock=None):
+        self.lock = lock if lock is not None else threading.Lock()
+        self.metrics = metrics
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.metrics.observe_lock(self.name, 0, False)
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter_ns()
+        acquired = self.lock.acquire(True, timeout)
+        self.metrics.observe_lock(self.name, time.perf_counter_ns() - started, True)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def make_lock(metrics, name, timing):
+    """A TimedLock named name if timing, else a plain threading.Lock."""
+    return TimedLock(metrics, name) if timing else threading.Lock()
+
+
+class HandlerProfiler:
+    def __init__(self, peers, mode='cprofile', directory='profiles', sample_interval=0.001):
+        """peers are anything with peer_id and instrument(profiler); they are profiled between start() and stop()."""
+        if mode not in PROFILERS:
+            raise ValueError(f"Unknown profiler {mode!r}; expected one of {', '.join(PROFILERS)}")
+        self.peers = list(peers)
+        self.mode = mode
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.profiles = {}  # peer_id -> cProfile.Profile
+        self.stacks = {}  # peer_id -> Counter of collapsed stack -> samples
+        self.active = {}  # thread id -> peer_id of the handler running on it
+        self.wrapper_code = None  # Code of the sampling wrapper, where sampled stacks are cut
+        # From Python 3.12 a profiler hooks every thread, so only one handler may run under one at a time
+        self.serialize = threading.Lock() if mode == 'cprofile' and sys.version_info >= (3, 12) else None
+        self.running = False
+        self.sampler = None
+        self.started = None
+        self.stopped = None
+        self.timer = None  # Next scheduled start or stop
+        self.done = None
+
+    def wrap(self, peer_id, handler):
+        """handler(message, addr), run under this profiler on behalf of peer_id."""
+        if self.mode == 'cprofile':
+            profile = self.profiles.get(peer_id)
+            if profile is None:
+                profile = self.profiles[peer_id] = cProfile.Profile()
+            serialize = self.serialize
+
+            def run(message, addr):
+                if serialize is None:
+                    return profile.runcall(handler, message, addr)
+                with serialize:
+                    return profile.runcall(handler, message, addr)
+            return run
+
+        active = self.active
+
+        def run(message, addr):
+            thread_id = threading.get_ident()
+            outer = active.get(thread_id)
+            active[thread_id] = peer_id
+            try:
+                handler(message, addr)
+            finally:
+                if outer is None:
+                    del active[thread_id]
+                else:
+                    active[thread_id] = outer
+        self.wrapper_code = run.__code__
+        return run
+
+    def start(self):
+        self.running = True
+        self.started = time.time()
+        for peer in self.peers:
+            peer.instrument(self)
+        if self.mode == 'sample':
+            self.sampler = threading.Thread(target=self.sample, name='handler-sampler', daemon=True)
+            self.sampler.start()
+
+    def sample(self):
+        while self.running:
+            frames = sys._current_frames()
+            for thread_id, peer_id in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                # Down to the wrapper: the receive loop and runtime above it are the same for every sample
+                while frame is not None and frame.f_code is not self.wrapper_code:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                counts = self.stacks.get(peer_id)
+                if counts is None:
+                    counts = self.stacks[peer_id] = Counter()
+                counts[';'.join(reversed(stack))] += 1
+            time.sleep(self.sample_interval)
+
+    def stop(self):
+        """Take the profiler out of every peer's handlers. Call dump() to write the results."""
+        self.running = False
+        self.stopped = time.time()
+        for peer in self.peers:
+            peer.instrument()
+        if self.sampler is not None:
+            self.sampler.join()
+
+    def dump(self):
+        """Write one file per profiled peer into directory. Returns their paths."""
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        if self.mode == 'cprofile':
+            for peer_id, profile in sorted(self.profiles.items()):
+                path = os.path.join(self.directory, f"peer_{peer_id}.prof")
+                profile.dump_stats(path)
+                paths.append(path)
+        else:
+            for peer_id, counts in sorted(self.stacks.items()):
+                path = os.path.join(self.directory, f"peer_{peer_id}.folded")
+                with open(path, 'w') as f:
+                    for stack, samples in counts.most_common():
+                        f.write(f"{stack} {samples}\n")
+                paths.append(path)
+        return paths
+
+    def schedule(self, scheduler, delay, duration, done=None):
+        """
+        Open the window delay seconds from now and close it duration seconds later, on scheduler
+        (anything with call_later(delay, callback)). The files are then written on a thread of
+        their own and done(paths) is called, if given.
+        """
+        self.done = done
+
+        def finish():
+            self.stop()
+            threading.Thread(target=self.report, name='profile-dump', daemon=True).start()
+
+        def begin():
+            self.start()
+            self.timer = scheduler.call_later(duration, finish)
+
+        self.timer = scheduler.call_later(delay, begin)
+
+    def report(self):
+        paths = self.dump()
+        if self.done is not None:
+            self.done(paths)
+
+    def close(self):
+        """End a scheduled window early, for runs that finish before it does: stop and write it if it is open."""
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.running:
+            self.stop()
+            self.report()
+
+
+def start_profiling(peers, mode, directory, start, window, sample_interval, scheduler):
+    """Profile peers from start to start + window seconds from now, if mode is set. Returns the profiler, or None."""
+    if not mode:
+        return None
+    profiler = HandlerProfiler(peers, mode, directory, sample_interval)
+    profiler.schedule(scheduler, start, window,
+                      lambda paths: print(f"Handler profiles ({mode}) of {len(paths)} peers written to {directory}/"))
+    return profiler
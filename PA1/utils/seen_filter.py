@@ -0,0 +1,150 @@
+# seen_filter.py
+"""
+Duplicate suppression for flooded lookups.
+
+Both filters answer "has this request_id been seen?" in O(1) with memory fixed at
+construction time, and share one interface:
+    check_and_add(key) -> True if key was (probably) seen before; key is remembered either way
+    add(key)
+    stats() -> counters as a dict
+"""
+import hashlib
+import math
+import threading
+import time
+
+from utils.ttl_cache import TTLCache
+
+
+class LRUSeenFilter:
+    """Exact filter holding the last `capacity` request ids, each for `ttl` seconds."""
+
+    def __init__(self, capacity, ttl, clock=time.monotonic):
+        self.table = TTLCache(capacity, ttl, clock)
+        self.queries = 0
+        self.duplicates = 0
+
+    def check_and_add(self, key):
+        marker = object()
+        seen = self.table.setdefault(key, marker) is not marker
+        self.queries += 1
+        if seen:
+            self.duplicates += 1
+        return seen
+
+    def add(self, key):
+        self.table.setdefault(key, True)
+
+    def stats(self):
+        table = self.table.stats()
+        return {
+            'kind': 'lru',
+            'size': table['size'],
+            'capacity': table['capacity'],
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            'false_positives': 0,  # Exact: a "seen" answer is always right
+            'evictions': table['evictions'] + table['expired'],
+        }
+
+
+class RotatingBloomFilter:
+    """
+    Time-windowed Bloom filter made of `generations` slices. New ids go into the
+    newest slice; a query checks all of them. Every `window` seconds, or once the
+    newest slice holds `capacity` ids, the oldest slice is dropped, so an id is
+    remembered for between (generations - 1) and generations windows.
+    """
+
+    def __init__(self, capacity, error_rate, window, generations=2, clock=time.monotonic):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window
+        self.clock = clock
+        # Standard sizing for `capacity` ids per slice at `error_rate`
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.slices = [bytearray((self.num_bits + 7) // 8) for _ in range(generations)]
+        self.counts = [0] * generations  # ids inserted into each slice
+        self.rotated_at = clock()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.duplicates = 0
+        self.rotations = 0
+        self.evictions = 0
+        self.expected_false_positives = 0.0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _rotate_if_due(self):
+        if self.counts[0] >= self.capacity or self.clock() - self.rotated_at >= self.window:
+            self.evictions += self.counts.pop()
+            self.slices.pop()
+            self.slices.insert(0, bytearray((self.num_bits + 7) // 8))
+            self.counts.insert(0, 0)
+            self.rotated_at = self.clock()
+            self.rotations += 1
+
+    def _false_positive_rate(self):
+        # Probability that an unseen id matches at least one slice
+        miss_all = 1.0
+        for count in self.counts:
+            fill = 1.0 - math.exp(-self.num_hashes * count / self.num_bits)
+            miss_all *= 1.0 - fill ** self.num_hashes
+        return 1.0 - miss_all
+
+    def check_and_add(self, key):
+        positions = self._positions(key)
+        with self.lock:
+            self._rotate_if_due()
+            self.queries += 1
+            seen = any(all(s[p >> 3] & (1 << (p & 7)) for p in positions) for s in self.slices)
+            if seen:
+                self.duplicates += 1
+                self.expected_false_positives += self._false_positive_rate()
+            else:
+                self._set(positions)
+            return seen
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self.lock:
+            self._rotate_if_due()
+            self._set(positions)
+
+    def _set(self, positions):
+        newest = self.slices[0]
+        for p in positions:
+            newest[p >> 3] |= 1 << (p & 7)
+        self.counts[0] += 1
+
+    def stats(self):
+        return {
+            'kind': 'bloom',
+            'size': sum(self.counts),
+            'capacity': self.capacity * len(self.slices),
+            'bits': self.num_bits * len(self.slices),
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            # Estimate: each "seen" answer weighted by the filter's false-positive
+            # probability at the time it was given
+            'false_positives': self.expected_false_positives,
+            'false_positive_rate': self._false_positive_rate(),
+            'rotations': self.rotations,
+            'evictions': self.evictions,
+        }
+
+
+def make_seen_filter(kind, capacity, ttl, error_rate=0.001, clock=time.monotonic):
+    """Build the seen-request filter configured by SEEN_FILTER."""
+    if kind == 'bloom':
+        # Two slices rotated every ttl/2 keep an id for ttl/2..ttl seconds
+        return RotatingBloomFilter(capacity, error_rate, window=ttl / 2, clock=clock)
+    if kind == 'lru':
+        return LRUSeenFilter(capacity, ttl, clock)
+    raise ValueError(f"Unknown seen filter '{kind}'")
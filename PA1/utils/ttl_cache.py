@@ -0,0 +1,102 @@
+# ttl_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded key -> value table whose entries expire ttl seconds after they were stored.
+    When full, the least recently used entry is evicted. Lookups, expiry and
+    eviction are O(1) and are counted in hits, misses, expired and evictions;
+    stale_hits counts the get() calls that found only an expired entry.
+    """
+
+    def __init__(self, capacity, ttl, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the live value for key, or default if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                self.expired += 1
+                self.stale_hits += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        """Store value under key, replacing any previous entry."""
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+            self._insert(key, value, ttl)
+
+    def setdefault(self, key, value, ttl=None):
+        """Store value only if key has no live entry. Returns the value now stored."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[1] > self.clock():
+                    return entry[0]
+                del self.entries[key]
+                self.expired += 1
+            self._insert(key, value, ttl)
+            return value
+
+    def pop(self, key, default=None):
+        """Remove key and return its value (expired or not)."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def _insert(self, key, value, ttl):
+        now = self.clock()
+        # Drop expired entries from the old end before evicting live ones
+        while self.entries:
+            oldest_key, (_, expires_at) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[oldest_key]
+            self.expired += 1
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.entries[key] = (value, now + (self.ttl if ttl is None else ttl))
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[1] > self.clock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Counters as a dict."""
+        return {
+            'size': len(self.entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'stale_hits': self.stale_hits,
+            'evictions': self.evictions,
+        }
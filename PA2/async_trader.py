@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import threading
+
+from peer import Peer, ACCEPT_PICKLE
+from utils.codec import decode
+import config
+
+TRADER_RECV_BATCH = config.TRADER_RECV_BATCH
+TRADER_SEND_QUEUE_SIZE = config.TRADER_SEND_QUEUE_SIZE
+
+
+class AsyncTraderPeer(Peer):
+	'''
+	Peer whose message loop runs on asyncio, so that it trades there whenever it
+	is the leader. Every peer of an asyncio run is one: leaders fail and are
+	replaced by elections, and the winner keeps trading on the loop it already has.
+	Each time the socket becomes readable the peer drains up to recv_batch
+	datagrams and handles the whole batch, instead of one recv-handle-send cycle
+	per wakeup. Replies that cannot be sent right away are queued and flushed when
+	the socket is writable again, so a slow send never stalls the receive path.
+	Everything runs on the loop thread, so Inventory updates stay serialized.
+	'''
+
+	def __init__(self, *args, recv_batch=TRADER_RECV_BATCH, send_queue_size=TRADER_SEND_QUEUE_SIZE, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.recv_batch = recv_batch
+		self.send_queue = collections.deque()
+		self.send_queue_size = send_queue_size
+		self.dropped_messages = 0
+		self.loop = None
+		self.loop_thread_id = None
+		self.stopped = None
+
+	def start_peer(self):
+		"""Start the peer's event loop in its own thread."""
+		self.log.info('start', "Peer {peer} ({role}) running asyncio loop on port {port}...", peer=self.peer_id, role=self.role, port=self.port)
+		# The loop exists before its thread runs, so what other threads send from now on is queued on it
+		self.loop = asyncio.new_event_loop()
+		self.socket.setblocking(False)
+		t = threading.Thread(target=self.run_loop)
+		t.start()
+		self.thread = t
+		self.start_election_timer()
+
+	def run_loop(self):
+		self.loop_thread_id = threading.get_ident()
+		asyncio.set_event_loop(self.loop)
+		try:
+			self.loop.run_until_complete(self.serve())
+		finally:
+			self.loop.close()
+
+	async def serve(self):
+		self.stopped = asyncio.Event()
+		self.loop.add_reader(self.socket.fileno(), self.on_readable)
+		if not self.running:
+			# shutdown_peer was called before the loop was up
+			self.stopped.set()
+		await self.stopped.wait()
+
+		self.loop.remove_reader(self.socket.fileno())
+		if self.send_queue:
+			self.loop.remove_writer(self.socket.fileno())
+		self.socket.close()
+
+	def on_readable(self):
+		"""Drain a batch of datagrams and handle them."""
+		for _ in range(self.recv_batch):
+			try:
+				nbytes, addr = self.socket.recvfrom_into(self.recv_buffer)
+			except (BlockingIOError, InterruptedError):
+				return
+			except OSError:
+				# Socket has been closed
+				return
+			try:
+				message = decode(self.recv_view[:nbytes], ACCEPT_PICKLE)
+				self.dispatch_message(message, addr)
+			except Exception as e:
+				self.log.error('handler_failed', "Error handling datagram from {addr}: {error}", addr=addr, error=str(e))
+				self.metrics.incr('dropped', 'error')
+
+	def on_writable(self):
+		"""Flush replies queued while the socket was full."""
+		while self.send_queue:
+			data, addr = self.send_queue[0]
+			try:
+				self.socket.sendto(data, addr)
+			except (BlockingIOError, InterruptedError):
+				return
+			self.send_queue.popleft()
+		self.loop.remove_writer(self.socket.fileno())
+
+	def spawn(self, target, *args):
+		self.loop.call_soon_threadsafe(target, *args)
+
+	def transmit(self, data, addr):
+		if self.loop is None:
+			# Not started: nothing else uses the socket yet
+			super().transmit(data, addr)
+			return
+		if threading.get_ident() != self.loop_thread_id:
+			# e.g. election messages sent from the election timer thread
+			self.loop.call_soon_threadsafe(self.transmit, data, addr)
+			return
+		if not self.send_queue:
+			try:
+				self.socket.sendto(data, addr)
+				return
+			except (BlockingIOError, InterruptedError):
+				self.loop.add_writer(self.socket.fileno(), self.on_writable)
+		if len(self.send_queue) >= self.send_queue_size:
+			self.dropped_messages += 1
+			self.log.warning('send_queue_full', "Trader send queue full. Dropping message to {addr}", addr=addr)
+			return
+		self.send_queue.append((data, addr))
+
+	def shutdown_peer(self):
+		"""Shutdown the peer."""
+		self.log.info('shutdown', "Shutting down peer.")
+		self.running = False
+		self.cancel_pending_requests()
+		if self.loop is not None:
+			if not self.loop.is_closed():
+				self.loop.call_soon_threadsafe(self.stop_serving)
+		else:
+			self.socket.close()
+
+	def stop_serving(self):
+		# Before serve() is up there is nothing to stop: it sees running is False and returns
+		if self.stopped is not None:
+			self.stopped.set()
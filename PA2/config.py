@@ -9,3 +9,39 @@ COMMISSION = 0.1
 LEADER_FAILURE_PROBABILITY = 0.2  # Probability that the leader dies (20%)
 TIME_QUANTUM = 10  # Time in seconds
 
+
+TRADER_RECV_BATCH = 256  # Datagrams the asyncio trader drains from its socket per wakeup
+TRADER_SEND_QUEUE_SIZE = 4096  # Replies buffered at the asyncio trader while the socket is not writable
+
+WIRE_FORMAT = 'binary'  # 'binary' (utils/codec.py) or 'pickle'
+ACCEPT_PICKLE = False  # Also decode pickled datagrams (fallback format; anyone who can reach a peer's port could run code, so only on trusted networks)
+
+WORKER_POOL_SIZE = 8  # Threads shared by all peers of a process for follow-up buys
+WORKER_QUEUE_SIZE = 1024  # Follow-up jobs queued before new ones are rejected (and retried after TIMEOUT)
+
+# Mode 'mux': every peer shares MUX_SOCKETS UDP sockets instead of binding its own port
+MUX_PORT = 4000  # First real port; peers keep their 5000 + id addresses, which are only virtual
+MUX_SOCKETS = 1  # Sockets (and receive threads) the peers are spread over
+MUX_RCVBUF = 4 * 1024 * 1024  # Kernel receive buffer per socket, shared by all the peers on it
+
+STATS_PORT = None  # Serve live per-peer metrics over HTTP on this local port (0: any free port); None: off
+STATS_FILE = None  # Append a metrics snapshot (JSON lines) to this file every STATS_INTERVAL seconds and at exit; None: off
+STATS_INTERVAL = 5.0  # Seconds between snapshots written to STATS_FILE
+
+LOG_LEVEL = 'info'  # 'debug' (every message and election step), 'info', 'warning', 'error' or 'off'
+LOG_FORMAT = 'text'  # 'text', 'jsonl' or 'binary' (needs LOG_FILE; read back with utils.log.read_records)
+LOG_FILE = None  # Write the log to this file instead of stdout
+LOG_QUEUE_SIZE = 65536  # Records waiting for the log writer at most; past that new ones are dropped and counted (metrics gauge log_records_dropped)
+
+HANDLER_TIMING = False  # Time every message handler into the peer's metrics (count, total and max by message type)
+LOCK_TIMING = False  # Also record how long handlers wait for the peer's locks, inventory and sale locks included (metrics 'locks'); costs a little on every acquire
+PROFILER = None  # 'cprofile' or 'sample': profile every peer's handlers for a window and write one file per peer; None: off
+PROFILE_START = 1.0  # Seconds after the peers start that the window opens
+PROFILE_WINDOW = 5.0  # Seconds the window stays open
+PROFILE_DIR = 'profiles'  # Where peer_<id>.prof (cprofile) or peer_<id>.folded (sample, collapsed stacks) go
+PROFILE_SAMPLE_INTERVAL = 0.001  # Seconds between stack samples
+
+TRACE = False  # Trace buys end to end: every hop (buyer -> trader -> seller) records a span (utils/tracing.py); merge with python -m utils.trace_report
+TRACE_DIR = 'traces'  # Where each peer writes its spans, to trace_<peer id>.jsonl
+TRACE_SAMPLE = 1.0  # Fraction of buys traced
+TRACE_QUEUE_SIZE = 65536  # Spans waiting for the trace writer at most; past that new ones are dropped and counted (trace_spans_dropped)
@@ -1,9 +1,12 @@
 import random
 
+from utils.log import DEBUG, Logger
+
 
 class Inventory:
-	def __init__(self):
+	def __init__(self, log=None):
 		self.inventory = {}
+		self.log = log if log is not None else Logger('inventory')
 
 	def add_inventory(self, seller_id, address, item_name, quantity):
 		"""Add or update inventory for a seller."""
@@ -17,12 +20,14 @@ class Inventory:
 					return
 			# Add new seller entry if not found
 			self.inventory[item_name].append((seller_id, address, quantity))
-		print(self.inventory)
+		if self.log.enabled(DEBUG):
+			# Formatted now: the dict goes on changing after this call
+			self.log.debug('inventory', "Inventory is {inventory}", inventory=str(self.inventory))
 
 	def update_inventory(self, seller_id, item_name, new_quantity):
 		"""Update the quantity of an existing item for a specific seller."""
 		if item_name not in self.inventory:
-			print(f"Error: Item '{item_name}' not found in inventory.")
+			self.log.warning('unknown_item', "Item '{item}' not found in inventory.", item=item_name)
 			return
 
 		for i, (s_id, addr, qty) in enumerate(self.inventory[item_name]):
@@ -33,7 +38,7 @@ class Inventory:
 					self.inventory[item_name].pop(i)
 				return
 
-		print(f"Error: Seller '{seller_id}' not found for item '{item_name}'.")
+		self.log.warning('unknown_seller', "Seller '{seller}' not found for item '{item}'.", seller=seller_id, item=item_name)
 
 	def reduce_stock(self, item_name, quantity):
 		"""
@@ -41,14 +46,14 @@ class Inventory:
 		Returns (seller_id, address, True) if successful, or (None, None, False) if not.
 		"""
 		if item_name not in self.inventory or not self.inventory[item_name]:
-			print(f"Error: Item '{item_name}' not found or out of stock.")
+			self.log.debug('out_of_stock', "Item '{item}' not found or out of stock.", item=item_name)
 			return None, None, False
 
 		# Filter out sellers with sufficient stock
 		available_sellers = [(s_id, addr, qty) for s_id, addr, qty in self.inventory[item_name] if qty >= quantity]
 
 		if not available_sellers:
-			print(f"Error: No seller has enough stock of '{item_name}'.")
+			self.log.debug('out_of_stock', "No seller has enough stock of '{item}'.", item=item_name)
 			return None, None, False
 
 		# Randomly choose a seller from the available sellers
@@ -63,7 +68,8 @@ class Inventory:
 				else:
 					# Remove seller if the quantity becomes zero
 					self.inventory[item_name].pop(i)
-				print(f"Stock reduced: {quantity} units of '{item_name}' sold by {seller_id} ({address}).")
+				self.log.debug('stock_reduced', "Stock reduced: {quantity} units of '{item}' sold by {seller} ({address}).",
+					quantity=quantity, item=item_name, seller=seller_id, address=address)
 				return seller_id, address, True
 
 		return None, None, False
@@ -75,6 +81,10 @@ class Inventory:
 
 		return sum(qty for _, _, qty in self.inventory[item_name])
 
+	def total_stock(self):
+		"""Units in stock, by item, across all sellers."""
+		return {item_name: self.get_item_stock(item_name) for item_name in list(self.inventory)}
+
 	def get_sellers_for_item(self, item_name):
 		"""Get a list of sellers who have the item in stock."""
 		if item_name not in self.inventory:
@@ -85,7 +95,7 @@ class Inventory:
 	def remove_seller_inventory(self, seller_id, item_name):
 		"""Remove a seller's stock of a particular item."""
 		if item_name not in self.inventory:
-			print(f"Error: Item '{item_name}' not found in inventory.")
+			self.log.warning('unknown_item', "Item '{item}' not found in inventory.", item=item_name)
 			return
 
 		for i, (s_id, addr, qty) in enumerate(self.inventory[item_name]):
@@ -93,14 +103,14 @@ class Inventory:
 				self.inventory[item_name].pop(i)
 				return
 
-		print(f"Error: Seller '{seller_id}' not found for item '{item_name}'.")
+		self.log.warning('unknown_seller', "Seller '{seller}' not found for item '{item}'.", seller=seller_id, item=item_name)
 
 	def remove_item(self, item_name):
 		"""Remove an entire item from the inventory."""
 		if item_name in self.inventory:
 			del self.inventory[item_name]
 		else:
-			print(f"Error: Item '{item_name}' not found in inventory.")
+			self.log.warning('unknown_item', "Item '{item}' not found in inventory.", item=item_name)
 
 	def get_inventory(self):
 		"""Get the entire inventory data."""
@@ -116,7 +126,7 @@ class Inventory:
 			for s_id, addr, qty in item_list:
 				if s_id == seller_id:
 					return addr
-		print(f"Error: Address for seller '{seller_id}' not found.")
+		self.log.warning('unknown_seller', "Address for seller '{seller}' not found.", seller=seller_id)
 		return None
 
 
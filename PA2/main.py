@@ -3,11 +3,22 @@ import sys
 import threading
 import time
 
-from peer import Peer, Leader
+import config
+from peer import Peer, Leader, WORKER_POOL_SIZE, WORKER_QUEUE_SIZE
+from async_trader import AsyncTraderPeer
+from mux_peer import MuxPeer, open_muxes
+from utils.topology import attach, complete
+from utils.histogram import LatencyHistogram
+from utils.metrics import start_reporting, shared_registry
+from utils.log import shared_writer
+from utils.profiling import start_profiling
+from utils.tracing import finish_tracing
+from utils.timers import shared_scheduler
+from utils.worker_pool import shared_pool
 # from utils.network_utils import graph_diameter
 
 
-def main(N):
+def main(N, trader_mode='threaded'):
 	num_peers = N  # Number of peers in the network
 	peers = []
 	ports = [5000 + i for i in range(num_peers)]  # Assign unique ports for all the peers
@@ -17,6 +28,9 @@ def main(N):
 	buyers = []
 	sellers = []
 
+	# Mode 'mux': all peers share a few sockets, demultiplexed by peer id
+	muxes = open_muxes() if trader_mode == 'mux' else []
+
 	# Randomly select one peer to be the leader (trader)
 	leader_id = 0
 
@@ -40,7 +54,12 @@ def main(N):
 			role = random.choice(roles)
 			item = random.choice(items) if role == "seller" else None
 
-		peer = Peer(peer_id=i, role=role, neighbors=[], leader=leader, item=item, port=ports[i])
+		if trader_mode == 'mux':
+			peer = MuxPeer(muxes[i % len(muxes)], peer_id=i, role=role, neighbors=[], leader=leader, item=item, port=ports[i])
+		else:
+			# Every peer, not just the first leader: whoever wins an election trades on its own loop
+			peer_class = AsyncTraderPeer if trader_mode == 'asyncio' else Peer
+			peer = peer_class(peer_id=i, role=role, neighbors=[], leader=leader, item=item, port=ports[i])
 		peers.append(peer)
 		if role == 'buyer':
 			buyers.append(peer)
@@ -48,11 +67,7 @@ def main(N):
 			sellers.append(peer)
 
 	# Fully connect the network: each peer is a neighbor of every other peer
-	for i in range(num_peers):
-		for j in range(num_peers):
-			if i != j and peers[j] not in peers[i].neighbors:
-				peers[i].neighbors.append(peers[j])
-				peers[j].neighbors.append(peers[i])
+	attach(peers, complete(num_peers))
 
 	# Display the network structure
 	print("Network structure initialized (Fully Connected):")
@@ -60,6 +75,8 @@ def main(N):
 		peer.display_network()
 
 	# Start the peers to listen for messages
+	for mux in muxes:
+		mux.start()
 	for peer in peers:
 		peer.start_peer()
 
@@ -73,6 +90,10 @@ def main(N):
 	#     peer.max_distance = hopcount
 	#     peer.hop_count = hopcount
 
+	# Profile the handlers for a window, if PROFILER is set
+	profiler = start_profiling(peers, config.PROFILER, config.PROFILE_DIR, config.PROFILE_START,
+		config.PROFILE_WINDOW, config.PROFILE_SAMPLE_INTERVAL, shared_scheduler())
+
 	# Have every buyer initiate a lookup
 	if sellers:
 		for seller in sellers:
@@ -91,22 +112,52 @@ def main(N):
 	while True:
 		alive_buyers = [buyer for buyer in buyers if buyer.running]
 		if not alive_buyers:
+			# Let the peers' last log records out before the report
+			shared_writer().flush()
 			print("All buyers have shut down. Shutting down sellers and exiting program.")
 			# Shut down all seller peers
 			for seller in sellers:
-				seller.running = False
-				seller.socket.close()
+				seller.shutdown_peer()
+			latency = LatencyHistogram.merged(buyer.latency for buyer in buyers)
+			print(f"Transaction latency over {len(buyers)} buyers: {latency.summary()}")
+			# Stop the trader as well and report the throughput of every peer that traded,
+			# the first leader and those that won elections after it
+			for trader in peers:
+				if trader.buys_handled:
+					print(f"Trader {trader.peer_id} ({trader_mode}) handled {trader.buys_handled} buys at {trader.buys_per_second():.1f} buys/sec")
+			peers[leader_id].shutdown_peer()
+			# Where handler time goes, by message type, and how long handlers waited for locks
+			totals = shared_registry().snapshot(peers=False)
+			for message_type, handler in sorted(totals['handlers'].items(), key=lambda item: -item[1]['total_ms']):
+				print(f"Handler {message_type}: {handler['calls']} calls, {handler['total_ms']:.1f} ms total, "
+					  f"{handler['total_ms'] * 1e3 / handler['calls']:.1f} us mean, {handler['max_us']:.0f} us max")
+			for name, lock in sorted(totals['locks'].items()):
+				print(f"Lock {name}: {lock['acquisitions']} acquisitions, {lock['contended']} contended, "
+					  f"{lock['wait_ms']:.2f} ms waited, {lock['max_wait_us']:.0f} us longest wait")
+			pool = shared_pool(WORKER_POOL_SIZE, WORKER_QUEUE_SIZE).stats()
+			print(f"Follow-up worker pool: {pool['workers']} workers, {pool['completed']} jobs, "
+				  f"max queue depth {pool['max_queue_depth']}/{pool['queue_size']}, {pool['rejected']} rejected")
 			break
 		time.sleep(1)  # Sleep before checking again
 
 	# Wait for all peer threads to finish
 	for peer in peers:
-		peer.thread.join()
+		if peer.thread is not None:
+			peer.thread.join()
+	for mux in muxes:
+		mux.close()
+	if profiler is not None:
+		profiler.close()
+	finish_tracing()
 
 
 if __name__ == '__main__':
-	if len(sys.argv) != 2:
-		print("Usage: python main.py <number_of_peers>")
+	if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] not in ('threaded', 'asyncio', 'mux')):
+		print("Usage: python main.py <number_of_peers> [threaded|asyncio|mux]")
 		sys.exit(1)
 	N = int(sys.argv[1])
-	main(N)
+	trader_mode = sys.argv[2] if len(sys.argv) == 3 else 'threaded'
+	# Live metrics, if STATS_PORT or STATS_FILE is set
+	metrics = start_reporting(config.STATS_PORT, config.STATS_FILE, config.STATS_INTERVAL)
+	main(N, trader_mode)
+	metrics.close(config.STATS_FILE)
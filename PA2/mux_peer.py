@@ -0,0 +1,45 @@
+# mux_peer.py
+import config
+from peer import Peer
+from utils.mux import open_mux_sockets
+
+MUX_PORT = config.MUX_PORT
+MUX_SOCKETS = config.MUX_SOCKETS
+MUX_RCVBUF = config.MUX_RCVBUF
+
+
+class MuxPeer(Peer):
+	"""
+	A Peer hosted on a shared MuxSocket instead of its own UDP socket. Its
+	(ip_address, port) is a virtual address; the MuxSocket's receive thread
+	delivers its datagrams to receive_datagram. Election quanta run on the
+	shared timer heap rather than a thread per peer. The handlers are the ones from Peer.
+	"""
+
+	def __init__(self, mux, *args, **kwargs):
+		self.mux = mux
+		super().__init__(*args, **kwargs)
+
+	def open_socket(self):
+		# A socket-like endpoint: Peer's sendto() and close() calls work unchanged
+		return self.mux.open(self.peer_id, (self.ip_address, self.port), self.receive_datagram)
+
+	def start_peer(self):
+		self.log.info('start', "Peer {peer} ({role}) with item {item} hosted on mux port {mux_port} as port {port}...",
+			peer=self.peer_id, role=self.role, item=self.item, mux_port=self.mux.address[1], port=self.port)
+		self.start_election_timer()
+
+	def start_election_timer(self):
+		self.schedule_timeout(self.time_quantum, self.election_timer)
+
+	def election_timer(self):
+		"""One election quantum per timer, rescheduled while the peer runs."""
+		if not self.running:
+			return
+		self.election_tick()
+		self.schedule_timeout(self.time_quantum, self.election_timer)
+
+
+def open_muxes(ip_address='localhost'):
+	"""The MUX_SOCKETS shared sockets for one process, not yet receiving."""
+	return open_mux_sockets(ip_address, MUX_PORT, MUX_SOCKETS, MUX_RCVBUF)
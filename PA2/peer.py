@@ -1,14 +1,21 @@
 # peer.py
-import datetime
 import threading
 import socket
-import pickle
 import random
 import time
 import hashlib
+import itertools
 import math
 
 from utils.messages import *
+from utils.codec import encode, decode
+from utils.timers import shared_scheduler
+from utils.worker_pool import shared_pool
+from utils.histogram import LatencyHistogram
+from utils.metrics import PeerMetrics, shared_registry
+from utils.log import DEBUG, Logger, configure as configure_log
+from utils.profiling import timed, make_lock
+from utils.tracing import NO_SPAN, Tracer, configure as configure_tracing
 import config
 from inventory import *
 
@@ -18,6 +25,22 @@ MAX_TRANSACTIONS = config.MAX_TRANSACTIONS
 TIMEOUT = config.TIMEOUT
 PRICE = config.PRICE
 COMMISSION = config.COMMISSION
+WIRE_FORMAT = config.WIRE_FORMAT
+ACCEPT_PICKLE = config.ACCEPT_PICKLE or WIRE_FORMAT == 'pickle'  # Choosing the pickle format opts in too
+WORKER_POOL_SIZE = config.WORKER_POOL_SIZE
+WORKER_QUEUE_SIZE = config.WORKER_QUEUE_SIZE
+HANDLER_TIMING = config.HANDLER_TIMING
+LOCK_TIMING = config.LOCK_TIMING
+TRACE = config.TRACE
+TRACE_SAMPLE = config.TRACE_SAMPLE
+
+_log_writer = configure_log(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_FILE, config.LOG_QUEUE_SIZE)
+_trace_writer = configure_tracing(config.TRACE_DIR, config.TRACE_QUEUE_SIZE)
+# What the writers dropped because they fell behind, in every metrics snapshot
+shared_registry().gauge('log_records_dropped', lambda: _log_writer.dropped)
+shared_registry().gauge('trace_spans_dropped', lambda: _trace_writer.dropped)
+
+RECV_BUFFER_SIZE = 1024
 '''
 MESSAGES
 1) UPDATE INVENTORY MESSAGE seller -> Trader
@@ -60,27 +83,60 @@ class Peer:
 		self.address = (ip_address, self.port)
 		self.item = item
 		self.stock = SELLER_STOCK if role == 'seller' else 0
-		self.lock = threading.Lock()  # For thread safety
-		self.pending_requests_lock = threading.Lock()  # Lock for pending_requests
-		self.sell_confirmation_lock = threading.Lock()
-		self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		self.socket.bind((self.ip_address, port))
+		# Counters, handler times and gauges, readable live through utils/metrics.py
+		self.metrics = PeerMetrics(peer_id)
+		# With LOCK_TIMING, waits on these locks are recorded in the metrics
+		self.lock = make_lock(self.metrics, 'lock', LOCK_TIMING)  # For thread safety
+		self.pending_requests_lock = make_lock(self.metrics, 'pending_requests_lock', LOCK_TIMING)  # Lock for pending_requests
+		self.sell_confirmation_lock = make_lock(self.metrics, 'sell_confirmation_lock', LOCK_TIMING)
+		self.socket = self.open_socket()
+		# Datagrams are received into this buffer and decoded in place
+		self.recv_buffer = bytearray(RECV_BUFFER_SIZE)
+		self.recv_view = memoryview(self.recv_buffer)
 		self.running = True
+		self.thread = None
 		self.looked_up_items = set()
 		self.available_items = ["fish", "salt", "boar"]
 		self.items_bought = 0
-		self.inventory = Inventory() if self.role == 'leader' else None
+		# Leveled records, formatted and written on the log writer thread (utils/log.py)
+		self.log = Logger(peer_id, clock=self.now)
+		# With TRACE, a span for every traced message handled (utils/tracing.py)
+		self.tracer = Tracer(peer_id, clock=self.now, sample=TRACE_SAMPLE) if TRACE else None
+		self.inventory = Inventory(self.log) if self.role == 'leader' else None
 		self.leader = leader if self.role != 'leader' else None
-		self.inventory_lock = threading.Lock()
-
-		# For buyer timeout handling
+		self.inventory_lock = make_lock(self.metrics, 'inventory_lock', LOCK_TIMING)
+
+		self.messages_sent = self.metrics.counter('sent')  # Messages sent, by type
+		self.messages_received = self.metrics.counter('received')
+		self.metrics.gauge('role', lambda: self.role)
+		self.metrics.gauge('running', lambda: self.running)
+		self.metrics.gauge('leader', lambda: self.leader.leader_id)
+		self.metrics.gauge('pending_requests', lambda: len(self.pending_requests))
+		self.metrics.gauge('inventory', lambda: self.inventory.total_stock() if self.inventory is not None else None)
+		if role == 'seller':
+			self.metrics.gauge('item', lambda: self.item)
+			self.metrics.gauge('stock', lambda: self.stock)
+		shared_registry().register(self.metrics)
+
+		# Trader throughput bookkeeping (only used when role == 'leader')
+		self.buys_handled = 0
+		self.first_buy_time = None
+		self.last_buy_time = None
+
+		# For buyer timeout handling: request_id -> (product_name, sent_at, timeout timer)
 		self.pending_requests = {}
+		self.request_counter = itertools.count()  # Keeps request ids unique within one clock tick
 		self.timeout = TIMEOUT  # seconds
 		if self.role == 'buyer':
+			self.metrics.gauge('items_bought', lambda: self.items_bought)
 			self.start_time = None
 			self.end_time = None
-			self.average_rtt = time.time()
+			self.average_rtt = self.now()
 			self.max_transactions = MAX_TRANSACTIONS
+			# Nanoseconds from starting a buy to its confirmation, retries included
+			self.latency = LatencyHistogram()
+			self.transaction_started = None
+			self.trace_id = None  # Trace of the buy, kept through its retries
 
 
 		self.in_election = False  # Whether the peer is currently in an election
@@ -88,13 +144,32 @@ class Peer:
 		self.current_leader = leader  # The current leader (initially set at the start)
 
 		self.time_quantum = config.TIME_QUANTUM
-		self.election_timer_thread = None	
+		self.election_timer_thread = None
+
+		# message type -> handler(message, addr), rebuilt by instrument()
+		self.handlers = {}
+		self.instrument()
+
+
 
+	def open_socket(self):
+		"""Create the UDP socket the peer receives on."""
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sock.bind((self.ip_address, self.port))
+		return sock
 
+	def now(self):
+		"""Current time, in seconds. Every timestamp a peer takes goes through here."""
+		return time.time()
+
+	def clock_ns(self):
+		"""Monotonic nanoseconds, for measuring latencies."""
+		return time.perf_counter_ns()
 
 	def start_peer(self):
 		"""Start listening for messages from other peers."""
-		print(f"Peer {self.peer_id} ({self.role}) with item {self.item} listening on port {self.port}...")
+		self.log.info('start', "Peer {peer} ({role}) with item {item} listening on port {port}...",
+			peer=self.peer_id, role=self.role, item=self.item, port=self.port)
 		t = threading.Thread(target=self.listen_for_messages)
 		t.start()
 		self.thread = t
@@ -106,61 +181,141 @@ class Peer:
 		while self.running:
 			try:
 				self.socket.settimeout(1.0)
-				data, addr = self.socket.recvfrom(1024)
-				message = pickle.loads(data)
-
-				if message.get('type') == 'buy':
-					self.handle_buy(message)
-				elif message.get('type') == 'buy_confirmation':
-					self.handle_buy_confirmation(message)
-				elif message.get('type') == 'update_inventory':
-					self.handle_update_inventory(message)
-				elif message.get('type') == 'sell_confirmation':
-					self.handle_sell_confirmation(message)
-				elif message.get('type') == 'election':
-					self.handle_election(message)
-				elif message.get('type') == 'OK':
-					self.handle_election_OK(message)
-				elif message.get('type') == 'leader':
-					self.handle_leader(message)
+				nbytes, addr = self.socket.recvfrom_into(self.recv_buffer)
+				self.receive_datagram(self.recv_view[:nbytes], addr)
 			except socket.timeout:
 				pass  # Timeout occurred
+			except ValueError as e:
+				self.log.warning('bad_datagram', "Dropping datagram: {error}", error=str(e))
 			except OSError:
 				# Socket has been closed
 				break
-			# For buyers, check for timeouts on pending requests
-			if self.role == 'buyer':
-				self.check_pending_requests()
 
-	def check_pending_requests(self):
-		current_time = time.time()
-		to_remove = []
+	def receive_datagram(self, data, addr):
+		"""Decode one datagram and hand it to its handler."""
+		if not self.running:
+			self.metrics.incr('dropped', 'peer_stopped')
+			return
+		try:
+			message = decode(data, ACCEPT_PICKLE)
+		except ValueError as e:
+			self.log.warning('bad_datagram', "Dropping datagram: {error}", error=str(e))
+			self.metrics.incr('dropped', 'undecodable')
+			return
+		self.dispatch_message(message, addr)
+
+	def dispatch_message(self, message, addr):
+		"""Route a decoded message to its handler through the handler table, counting it."""
+		message_type = message.get('type')
+		self.messages_received[message_type] += 1
+		handler = self.handlers.get(message_type)
+		if handler is None:
+			self.metrics.incr('dropped', message_type)
+			return
+		handler(message, addr)
+
+	def message_handlers(self):
+		"""message type -> handler(message, addr), before any instrumentation."""
+		return {
+			'buy': lambda message, addr: self.handle_buy(message),
+			'buy_confirmation': lambda message, addr: self.handle_buy_confirmation(message),
+			'update_inventory': lambda message, addr: self.handle_update_inventory(message),
+			'sell_confirmation': lambda message, addr: self.handle_sell_confirmation(message),
+			'election': lambda message, addr: self.handle_election(message),
+			'OK': lambda message, addr: self.handle_election_OK(message),
+			'leader': lambda message, addr: self.handle_leader(message),
+		}
+
+	def instrument(self, profiler=None):
+		"""
+		Rebuild the handler table: each handler traced if TRACE is on, timed into the metrics if
+		HANDLER_TIMING is, and run under profiler (a utils.profiling.HandlerProfiler) if one is given.
+		"""
+		handlers = {}
+		for message_type, handler in self.message_handlers().items():
+			if self.tracer is not None:
+				handler = self.tracer.wrap(handler, message_type)
+			if HANDLER_TIMING:
+				handler = timed(handler, self.metrics, message_type)
+			if profiler is not None:
+				handler = profiler.wrap(self.peer_id, handler)
+			handlers[message_type] = handler
+		self.handlers = handlers
+
+	def trace_span(self, name):
+		"""A span of the buyer's current transaction, with no parent; a no-op unless it is traced."""
+		if self.tracer is None:
+			return NO_SPAN
+		return self.tracer.span(self.trace_id, None, name)
+
+	def spawn(self, target, *args):
+		"""Run follow-up work (a new buy or retry) outside the receive loop, on the shared worker pool."""
+		if not shared_pool(WORKER_POOL_SIZE, WORKER_QUEUE_SIZE).submit(target, *args):
+			# Pool overloaded: try again after a timeout rather than dropping the buyer's next step
+			self.log.warning('pool_full', "Worker pool queue full. Deferring {job} by {delay}s", job=target.__name__, delay=self.timeout)
+			self.schedule_timeout(self.timeout, self.spawn, target, *args)
+
+	def schedule_timeout(self, delay, callback, *args):
+		"""Run callback(*args) after delay seconds. Returns a handle with cancel()."""
+		return shared_scheduler().call_later(delay, callback, *args)
+
+	def add_pending_request(self, request_id, product_name):
+		"""Track an outstanding buy until it is confirmed or its timeout fires."""
 		with self.pending_requests_lock:
-			for request_id, (product_name, timestamp) in self.pending_requests.items():
-				if current_time - timestamp > self.timeout:
-					print(f"[{self.peer_id}] No response received for {product_name}. Timing out and selecting another item.")
-					to_remove.append(request_id)
-					remaining_items = [item for item in self.available_items if item != product_name]
-					if not remaining_items:
-						print(f"[{self.peer_id}] No other items to look up besides {product_name}. Shutting down.")
-						self.shutdown_peer()
-						return
-					new_product = random.choice(remaining_items)
-					quantity = 1
-					print(f"[{self.peer_id}] Searching for a new product: {new_product}")
-					threading.Thread(target=self.buy_item, args=(new_product, quantity)).start()
-			for request_id in to_remove:
-				del self.pending_requests[request_id]
+			timer = self.schedule_timeout(self.timeout, self.request_timed_out, request_id)
+			self.pending_requests[request_id] = (product_name, self.now(), timer)
+
+	def complete_pending_request(self, request_id):
+		"""Stop tracking a confirmed buy. Returns False if it was no longer pending."""
+		with self.pending_requests_lock:
+			entry = self.pending_requests.pop(request_id, None)
+		if entry is None:
+			return False
+		entry[2].cancel()
+		return True
+
+	def cancel_pending_requests(self):
+		with self.pending_requests_lock:
+			for entry in self.pending_requests.values():
+				entry[2].cancel()
+			self.pending_requests.clear()
+
+	def request_timed_out(self, request_id):
+		"""Timer callback: the trader did not answer request_id within the timeout."""
+		with self.pending_requests_lock:
+			entry = self.pending_requests.pop(request_id, None)
+		if entry is None or not self.running:
+			return
+		self.metrics.incr('events', 'timeout')
+		product_name = entry[0]
+		self.log.info('timeout', "No response received for {product}. Timing out and selecting another item.", product=product_name)
+		remaining_items = [item for item in self.available_items if item != product_name]
+		if not remaining_items:
+			self.log.info('no_items', "No other items to look up besides {product}. Shutting down.", product=product_name)
+			self.shutdown_peer()
+			return
+		new_product = random.choice(remaining_items)
+		quantity = 1
+		self.log.info('new_product', "Searching for a new product: {product}", product=new_product)
+		# Not on the timer thread, which every peer's timeouts share
+		self.spawn(self.buy_item, new_product, quantity)
 
 	def send_message(self, addr, message):
 		"""Send a message to a specific address."""
 		try:
 			if isinstance(addr, str):
 				addr = addr
-			serialized_message = pickle.dumps(message)
-			self.socket.sendto(serialized_message, addr)
+			if self.tracer is not None:
+				self.tracer.stamp(message)
+			serialized_message = encode(message, WIRE_FORMAT)
+			self.transmit(serialized_message, addr)
+			self.messages_sent[message.get('type')] += 1
 		except Exception as e:
-			print(f"[{self.peer_id}] Error sending message to {addr}: {e}")
+			self.log.error('send_failed', "Error sending message to {addr}: {error}", addr=addr, error=str(e))
+
+	def transmit(self, data, addr):
+		"""Put an already serialized message on the wire."""
+		self.socket.sendto(data, addr)
 
 	def send_update_inventory(self):
 		''' Seller creates this message and send to the leader'''
@@ -170,17 +325,17 @@ class Peer:
 
 		leader_addr = (self.leader.ip_address, self.leader.port)
 		self.send_message(leader_addr, update_inventory_message.to_dict())
-		print(f"[{self.peer_id}] Sent inventory update to leader [{self.leader.leader_id}]")
+		self.log.info('inventory_update', "Sent inventory update to leader [{leader}]", leader=self.leader.leader_id)
 
 	def handle_update_inventory(self, message:UpdateInventoryMessage):
 		'''When seller sends a update inventory message'''
 		if self.role != 'leader':
 			return
-		print("Update Inventory Message", message)
 		message = UpdateInventoryMessage.from_dict(message)
+		self.log.debug('inventory_update', "Inventory update from seller {seller}: {stock} {item}",
+			seller=message.seller_id, stock=message.stock, item=message.product_name)
 		with self.inventory_lock:
 			self.inventory.add_inventory(message.seller_id, message.address, message.product_name, message.stock)
-		print("Inventory is ", self.inventory)
 
 	def buy_item(self, product_name= None, quantity = None):
 
@@ -191,7 +346,7 @@ class Peer:
 		if product_name is None:
 			remaining_items = [item for item in self.available_items if item not in self.looked_up_items]
 			if not remaining_items: # Incase the buyer can not find any sellers for any products [In this case would not happen]
-				print(f"[{self.peer_id}] No more items to look up. Shutting down.")
+				self.log.info('no_items', "No more items to look up. Shutting down.")
 				self.shutdown_peer()
 				return
 			product_name = random.choice(remaining_items)
@@ -202,37 +357,51 @@ class Peer:
 		if quantity is None:
 			quantity = random.randint(1, 5)
 
-		id_string = str(self.peer_id) + product_name + str(time.time())
+		id_string = str(self.peer_id) + product_name + str(self.now()) + str(next(self.request_counter))
 		if self.role == 'buyer':
 			request_id = hashlib.sha256(id_string.encode('utf-8')).hexdigest()
 			buy_message = BuyMessage(request_id, self.peer_id, self.address, product_name, quantity)
 
-			timestamp = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S.%f")[:-3]
-			print(f"{timestamp} [{self.peer_id}] Initiating buy with trader for {product_name}")
-			# print(f"[{self.peer_id} Lookup Message: {look}]")
+			self.log.debug('buy', "Initiating buy with trader {leader} for {quantity} {product}",
+				leader=self.leader.leader_id, quantity=quantity, product=product_name)
 			if self.start_time is None:
-				self.start_time = time.time()
-			# for neighbor in self.neighbors:
-			# 	print(f"[{self.peer_id}] Looking for {product_name} with neighbor {neighbor.peer_id}")
-			# 	self.send_message((neighbor.ip_address, neighbor.port), lookup_message)
-			print(self.leader.address)
-			self.send_message(self.leader.address, buy_message.to_dict())
-			# # Add to pending requests with a timestamp
-			with self.pending_requests_lock:
-				self.pending_requests[request_id] = (product_name, time.time())
+				self.start_time = self.now()
+			if self.transaction_started is None:
+				self.transaction_started = self.clock_ns()
+				if self.tracer is not None:
+					self.trace_id = self.tracer.new_trace()
+			# Add to pending requests before sending, so a fast confirmation finds it;
+			# the timeout fires if the trader does not answer in time
+			self.add_pending_request(request_id, product_name)
+			with self.trace_span('start'):
+				self.send_message(self.leader.address, buy_message.to_dict())
 
 	def handle_buy(self, message:BuyMessage):
 		"""Handle a buy request from a buyer."""
 		#[(message.seller_id, message.address, message.product_name, message.stock), ... ]product_list structure tuple
 		if self.role != 'leader':
+			self.metrics.incr('dropped', 'buy')
 			return 
 		
 		message = BuyMessage.from_dict(message)
+		buy_confirmation_reply, sell_confirmation_reply, seller_address = self.sell_from_inventory(message)
+		self.send_message(message.buyer_address, buy_confirmation_reply)
+		if sell_confirmation_reply is not None:
+			self.send_message(seller_address, sell_confirmation_reply)
+		self.record_buy_handled()
+
+	def sell_from_inventory(self, message:BuyMessage):
+		"""
+		Reserve the requested stock and build the replies for a buy.
+		Returns (buy_confirmation, sell_confirmation or None, seller_address).
+		"""
 		with self.sell_confirmation_lock:
-			print(self.inventory.inventory)
+			if self.log.enabled(DEBUG):
+				# Formatted now, under the lock: the inventory goes on changing
+				self.log.debug('inventory', "Inventory is {inventory}", inventory=str(self.inventory))
 			seller_id, seller_address, status = self.inventory.reduce_stock(message.product_name, message.quantity)
-			if status:
-				print(f"[{self.peer_id}] Sold item to buyer {message.buyer_id}.")
+		if status:
+			self.log.debug('sold', "Sold {quantity} {product} to buyer {buyer}.", quantity=message.quantity, product=message.product_name, buyer=message.buyer_id)
 
 		buy_confirmation_reply = BuyConfirmationMessage(
 			message.request_id,
@@ -242,6 +411,10 @@ class Peer:
 			message.quantity
 		).to_dict()
 
+		if status == False:
+			self.metrics.incr('events', 'sale_refused')
+			return buy_confirmation_reply, None, None
+
 		sell_confirmation_reply = SellConfirmationMessage(
 			message.request_id,
 			message.buyer_id, 
@@ -249,9 +422,21 @@ class Peer:
 			status, 
 			message.quantity
 		).to_dict()
-		self.send_message(message.buyer_address, buy_confirmation_reply)
-		if status != False:
-			self.send_message(seller_address, sell_confirmation_reply)
+		return buy_confirmation_reply, sell_confirmation_reply, seller_address
+
+	def record_buy_handled(self):
+		"""Count a buy handled by the trader for the buys/sec report."""
+		now = self.now()
+		if self.first_buy_time is None:
+			self.first_buy_time = now
+		self.last_buy_time = now
+		self.buys_handled += 1
+
+	def buys_per_second(self):
+		"""Trader throughput between the first and the last handled buy."""
+		if self.buys_handled < 2 or self.last_buy_time == self.first_buy_time:
+			return 0.0
+		return (self.buys_handled - 1) / (self.last_buy_time - self.first_buy_time)
 			
 
 	def handle_buy_confirmation(self, message):
@@ -260,43 +445,53 @@ class Peer:
 
 		# Check if the confirmation is for the current buyer
 		if confirmation_message.buyer_id == self.peer_id:
+			# Only a buy still pending counts: once its timeout fired, the buyer has
+			# already moved on, and acting on it would start a second chain of buys
+			if not self.complete_pending_request(confirmation_message.request_id):
+				self.log.debug('late_confirmation', "Ignoring confirmation for {product} from the trader for a finished buy", product=confirmation_message.product_name)
+				self.metrics.incr('dropped', 'buy_confirmation')
+				self.metrics.incr('events', 'late_confirmation')
+				return
 			if confirmation_message.status:
 				# Purchase was successful
 				self.items_bought += confirmation_message.quantity
-				timestamp = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S.%f")[:-3]
-				print(f"{timestamp} [{self.peer_id}] bought product {confirmation_message.product_name} from trader.")
-
-				if self.items_bought == self.max_transactions:
-					self.end_time = time.time()
+				if self.transaction_started is not None:
+					self.latency.record(self.clock_ns() - self.transaction_started)
+					self.transaction_started = None
+					self.trace_id = None
+				if self.tracer is not None:
+					self.tracer.annotate(done=True)  # The end of the transaction's critical path
+				self.log.info('bought', "bought product {product} from trader.", product=confirmation_message.product_name)
+
+				if self.items_bought >= self.max_transactions:
+					self.end_time = self.now()
 					# average_rtt =  (self.end_time - self.start_time)/self.max_transactions
 					average_rtt = (self.end_time - self.start_time)/self.max_transactions
-					print(f"[{self.peer_id}] Max transactions reached with average rtt {average_rtt:.4f}.\nShutting down peer.")
+					self.log.info('done', "Max transactions reached with average rtt {rtt:.4f}. Shutting down peer.", rtt=average_rtt)
 					self.average_rtt = average_rtt
 					self.shutdown_peer()
 				elif random.random() < BUY_PROBABILITY:
-					print(f"[{self.peer_id}] Buyer decided to continue looking for another item.")
+					self.log.debug('continue', "Buyer decided to continue looking for another item.")
 					remaining_items = [item for item in self.available_items if item != confirmation_message.product_name]
 					new_product = random.choice(remaining_items)
 					quantity = random.randint(1, 5)
-					threading.Thread(target=self.buy_item, args=(new_product, quantity)).start()
+					self.spawn(self.buy_item, new_product, quantity)
 				else:
-					print(f"[{self.peer_id}] Buyer is satisfied and stops buying.")
+					self.log.info('satisfied', "Buyer is satisfied and stops buying.")
 					self.shutdown_peer()
 			else:
 				# Purchase failed
-				print(f"[{self.peer_id}] Purchase of {confirmation_message.product_name} from trader failed.")
+				self.metrics.incr('events', 'buy_failed')
 				remaining_items = [item for item in self.available_items if item != confirmation_message.product_name]
 				new_product = random.choice(remaining_items)
 				quantity = random.randint(1, 5)
-				print(f"[{self.peer_id}] Buyer will search for another item({new_product}).")
+				self.log.info('buy_failed', "Purchase of {product} from trader failed. Buyer will search for another item ({new_product}).",
+					product=confirmation_message.product_name, new_product=new_product)
 
-				threading.Thread(target=self.buy_item, args=(new_product, quantity)).start()
-			# Remove from pending requests
-			with self.pending_requests_lock:
-				if confirmation_message.request_id in self.pending_requests:
-					del self.pending_requests[confirmation_message.request_id]
+				self.spawn(self.buy_item, new_product, quantity)
 		else:
-			print(f"[{self.peer_id}] Received buy confirmation not intended for this peer.")
+			self.log.warning('stray_confirmation', "Received buy confirmation not intended for this peer.")
+			self.metrics.incr('dropped', 'buy_confirmation')
 
 	def handle_sell_confirmation(self, message):
 		''''''
@@ -311,7 +506,7 @@ class Peer:
 			remaining_items = [item for item in self.available_items if item != confirmation_message.product_name]
 			self.item = random.choice(remaining_items)
 			quantity = SELLER_STOCK
-			print(f"[{self.peer_id}] Stock reached 0. Restocking and sending new product {self.item} to trader..")
+			self.log.info('restock', "Stock reached 0. Restocking and sending new product {item} to trader.", item=self.item)
 			update_inventory_msg = UpdateInventoryMessage(self.peer_id, self.address, self.item, quantity).to_dict()
 			self.send_message(self.leader.address, update_inventory_msg)
 
@@ -319,7 +514,8 @@ class Peer:
 		"""Initiate the election process."""
 		if self.in_election:
 			return
-		print(f"[{self.peer_id}] Initiating election...")
+		self.log.info('election', "Initiating election...")
+		self.metrics.incr('events', 'election_round')
 		self.in_election = True
 		self.send_election_messages()
 
@@ -336,7 +532,7 @@ class Peer:
 	def handle_election(self, message):
 		"""Handle an election message."""
 		sender_id = message['peer_id']
-		print(f"[{self.peer_id}] Received election message from {sender_id}.")
+		self.log.debug('election_message', "Received election message from {sender}.", sender=sender_id)
 		if self.peer_id > sender_id:
 			self.send_ok_message(sender_id)
 			self.start_election()
@@ -353,17 +549,18 @@ class Peer:
 				sender_addr = (neighbor.ip_address, neighbor.port)
 				break
 		if sender_addr:
-			print(f"[{self.peer_id}] Sending OK message to {sender_id}.")
+			self.log.debug('election_ok', "Sending OK message to {sender}.", sender=sender_id)
 			self.send_message(sender_addr, ok_message)
 
 	def handle_election_OK(self, message):
 		"""Handle an OK message."""
-		print(f"[{self.peer_id}] Received OK message from {message['peer_id']}.")
+		self.log.debug('election_ok', "Received OK message from {sender}.", sender=message['peer_id'])
 		self.in_election = False  # Another peer will take over the election
 
 	def declare_leader(self):
 		"""Declare this peer as the new leader."""
-		print(f"[{self.peer_id}] Declaring itself as the new leader.")
+		self.log.info('leader_declared', "Declaring itself as the new leader.")
+		self.metrics.incr('events', 'leader_declared')
 		self.is_leader = True
 		self.current_leader = Leader(self.peer_id, self.ip_address, self.port)
 		leader_message = {
@@ -378,7 +575,8 @@ class Peer:
 	def handle_leader(self, message):
 		"""Handle a leader message."""
 		leader_id = message['leader_id']
-		print(f"[{self.peer_id}] New leader announced: {leader_id}.")
+		self.log.info('leader_announced', "New leader announced: {leader}.", leader=leader_id)
+		self.metrics.incr('events', 'leader_announced')
 		self.current_leader = Leader(leader_id, message['ip_address'], message['port'])
 		self.leader = self.current_leader
 		self.is_leader = (self.peer_id == leader_id)
@@ -394,30 +592,36 @@ class Peer:
 		"""Trigger an election if the leader fails after the time quantum."""
 		while self.running:
 			time.sleep(self.time_quantum)
-			if self.role == 'leader':
-				# Leader decides whether to fail based on probability p
-				if random.random() < config.LEADER_FAILURE_PROBABILITY:
-					print(f"[{self.peer_id}] Leader has failed with probability {config.LEADER_FAILURE_PROBABILITY}. Initiating new election.")
-					self.role = 'peer'  # Demote to regular peer
-					self.start_election()
-			elif not self.in_election:
-				print(f"[{self.peer_id}] Time quantum expired. Checking leader status.")
+			self.election_tick()
+
+	def election_tick(self):
+		"""One time quantum has passed: the leader may fail, other peers check on it."""
+		if self.role == 'leader':
+			# Leader decides whether to fail based on probability p
+			if random.random() < config.LEADER_FAILURE_PROBABILITY:
+				self.log.info('leader_failed', "Leader has failed with probability {probability}. Initiating new election.",
+					probability=config.LEADER_FAILURE_PROBABILITY)
+				self.role = 'peer'  # Demote to regular peer
 				self.start_election()
+		elif not self.in_election:
+			self.log.debug('time_quantum', "Time quantum expired. Checking leader status.")
+			self.start_election()
 
 
 
 	def display_network(self):
-		"""Print network structure for this peer."""
+		"""Log network structure for this peer."""
 		neighbor_ids = [neighbor.peer_id for neighbor in self.neighbors]
-		print(f"Peer {self.peer_id} ({self.role}) connected to peers {neighbor_ids}")
+		self.log.info('network', "Peer {peer} ({role}) connected to peers {neighbors}", peer=self.peer_id, role=self.role, neighbors=neighbor_ids)
 
 	def shutdown_peer(self):
 		"""Shutdown the peer."""
-		print(f"[{self.peer_id}] Shutting down peer.")
+		self.log.info('shutdown', "Shutting down peer.")
 		self.running = False
+		self.cancel_pending_requests()
 		self.socket.close()
 		# The thread will exit when the method returns
 
 	def handle_no_seller(self, message):
 		"""Handle the 'no_seller' message, which should not occur since we discard messages at hopcount zero."""
-		print(f"[{self.peer_id}] Received unexpected 'no_seller' message.")
+		self.log.warning('no_seller', "Received unexpected 'no_seller' message.")
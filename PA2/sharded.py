@@ -0,0 +1,212 @@
+# sharded.py
+'''
+Run the bazaar across several worker processes.
+
+The coordinator picks the roles and hands each worker a shard of the peers;
+the first trader (peer 0) lives in shard 0. Peers address each other through a peer
+directory (peer_id -> ip, port) instead of Peer objects, so buyers, sellers and
+the trader may sit in different processes. Once every shard's buyers are done,
+the coordinator stops all workers and merges their RTT and trader stats.
+
+Usage: python sharded.py <number_of_peers> <number_of_workers> [threaded|asyncio]
+'''
+import multiprocessing
+import queue
+import random
+import sys
+import threading
+import time
+
+from utils.histogram import LatencyHistogram
+from utils.peer_directory import build_directory, neighbor_refs, partition
+
+ITEMS = ["fish", "salt", "boar"]
+LEADER_ID = 0
+STARTUP_TIMEOUT = 60  # Seconds every worker has to reach each startup barrier before the run is abandoned
+POLL_INTERVAL = 1.0  # Seconds between the coordinator's checks that no worker has died
+
+
+def assign_roles(num_peers):
+	"""peer_id -> (role, item), with peer 0 as the trader, as in main.py."""
+	specs = {LEADER_ID: ('leader', None)}
+	buyers = sellers = 0
+	for i in range(1, num_peers):
+		if i == num_peers - 2 and buyers == 0:
+			role = 'buyer'
+		elif i == num_peers - 1 and sellers == 0:
+			role = 'seller'
+		else:
+			role = random.choice(["buyer", "seller"])
+		buyers += role == 'buyer'
+		sellers += role == 'seller'
+		specs[i] = (role, random.choice(ITEMS) if role == 'seller' else None)
+	return specs
+
+
+def run_shard(shard, peer_specs, directory, trader_mode, barrier, stop_event, results):
+	'''
+	Worker process body. peer_specs is a list of (peer_id, role, item).
+	Puts ('buyers_done', shard) and then ('result', shard, stats) on results.
+	'''
+	from peer import Peer, Leader, WORKER_POOL_SIZE, WORKER_QUEUE_SIZE
+	from async_trader import AsyncTraderPeer
+	from utils.worker_pool import shared_pool
+
+	leader = Leader(LEADER_ID, *directory[LEADER_ID])
+	peers = []
+	try:
+		for peer_id, role, item in peer_specs:
+			ip_address, port = directory[peer_id]
+			# Fully connected, as in main.py
+			neighbors = neighbor_refs(directory, [i for i in directory if i != peer_id])
+			# Every peer, not just the first leader: whoever wins an election trades on its own loop
+			peer_class = AsyncTraderPeer if trader_mode == 'asyncio' else Peer
+			peers.append(peer_class(peer_id=peer_id, role=role, neighbors=neighbors, port=port, leader=leader, ip_address=ip_address, item=item))
+		# Every socket of every shard is bound before anyone sends
+		barrier.wait(STARTUP_TIMEOUT)
+	except BaseException:
+		# e.g. a port already in use: release the other shards from the barrier, then exit with the error
+		barrier.abort()
+		raise
+	buyers = [peer for peer in peers if peer.role == 'buyer']
+	sellers = [peer for peer in peers if peer.role == 'seller']
+	trader = next((peer for peer in peers if peer.peer_id == LEADER_ID), None)
+
+	for peer in peers:
+		peer.start_peer()
+	for seller in sellers:
+		seller.send_update_inventory()
+	try:
+		# Every shard's sellers have reached the trader before anyone buys
+		barrier.wait(STARTUP_TIMEOUT)
+	except BaseException:
+		barrier.abort()
+		# The peers' threads would keep this process alive
+		for peer in peers:
+			peer.shutdown_peer()
+		raise
+	time.sleep(1)
+	for buyer in buyers:
+		threading.Thread(target=buyer.buy_item, args=(random.choice(ITEMS), 1)).start()
+
+	while any(buyer.running for buyer in buyers):
+		time.sleep(0.2)
+	results.put(('buyers_done', shard))
+	stop_event.wait()
+
+	for seller in sellers:
+		seller.shutdown_peer()
+	if trader is not None:
+		trader.shutdown_peer()
+	for peer in peers:
+		peer.thread.join()
+
+	results.put(('result', shard, {
+		'buyers': [{
+			'buyer_id': buyer.peer_id,
+			# average_rtt is only measured once a buyer reaches max_transactions
+			'average_rtt': buyer.average_rtt if buyer.end_time is not None else None,
+			'items_bought': buyer.items_bought,
+			'latency': buyer.latency.to_dict(),
+		} for buyer in buyers],
+		# The first leader and every peer that won an election after it
+		'traders': [{
+			'peer_id': peer.peer_id,
+			'buys_handled': peer.buys_handled,
+			'buys_per_second': peer.buys_per_second(),
+		} for peer in peers if peer.buys_handled],
+		'pool': shared_pool(WORKER_POOL_SIZE, WORKER_QUEUE_SIZE).stats(),
+	}))
+
+
+def check_workers(processes):
+	"""Raise RuntimeError if a worker process has died."""
+	for shard, process in enumerate(processes):
+		if process.exitcode not in (None, 0):
+			raise RuntimeError(f"Worker for shard {shard} exited with code {process.exitcode}")
+
+
+def stop_workers(processes, barrier, stop_event):
+	"""Stop every worker still running, whatever state it is in, and wait for them all."""
+	stop_event.set()
+	barrier.abort()
+	for process in processes:
+		if process.is_alive():
+			process.terminate()
+	for process in processes:
+		process.join()
+
+
+def main(N, workers, trader_mode='threaded'):
+	specs = assign_roles(N)
+	for peer_id in range(N):
+		print(f"Peer {peer_id} is a {specs[peer_id][0]}" + (f" selling {specs[peer_id][1]}" if specs[peer_id][1] else ""))
+
+	directory = build_directory(range(N))
+	shards = partition(list(range(N)), workers)
+
+	context = multiprocessing.get_context('spawn')
+	results = context.Queue()
+	stop_event = context.Event()
+	barrier = context.Barrier(len(shards))
+	processes = []
+	for shard, peer_ids in enumerate(shards):
+		peer_specs = [(peer_id, *specs[peer_id]) for peer_id in peer_ids]
+		process = context.Process(target=run_shard, args=(shard, peer_specs, directory, trader_mode, barrier, stop_event, results))
+		process.start()
+		processes.append(process)
+	print(f"Started {len(shards)} worker processes for {N} peers")
+
+	# Wait for every shard's buyers, then stop all shards and merge their results
+	shard_results = {}
+	done = 0
+	try:
+		while len(shard_results) < len(shards):
+			try:
+				message = results.get(timeout=POLL_INTERVAL)
+			except queue.Empty:
+				message = None
+			if message is None:
+				check_workers(processes)
+				continue
+			if message[0] == 'buyers_done':
+				done += 1
+				if done == len(shards):
+					print("All buyers have shut down. Shutting down the workers.")
+					stop_event.set()
+			else:
+				shard_results[message[1]] = message[2]
+	except BaseException:
+		# Do not leave the other workers running, and holding their ports, for the next run
+		stop_workers(processes, barrier, stop_event)
+		raise
+	for process in processes:
+		process.join()
+
+	buyers = sorted((b for stats in shard_results.values() for b in stats['buyers']), key=lambda b: b['buyer_id'])
+	print("\nRTT for each buyer:")
+	for data in buyers:
+		if data['average_rtt'] is None:
+			print(f"Buyer {data['buyer_id']} stopped after {data['items_bought']} items, before max transactions")
+		else:
+			print(f"Buyer {data['buyer_id']} average RTT: {data['average_rtt']:.4f} seconds")
+	measured = [b['average_rtt'] for b in buyers if b['average_rtt'] is not None]
+	if measured:
+		print(f"Mean RTT over {len(measured)} buyers in {len(shards)} workers: {sum(measured) / len(measured):.4f} seconds")
+	latency = LatencyHistogram.merged(LatencyHistogram.from_dict(b['latency']) for b in buyers)
+	print(f"Transaction latency: {latency.summary()}")
+
+	traders = sorted((t for stats in shard_results.values() for t in stats['traders']), key=lambda t: t['peer_id'])
+	for trader in traders:
+		print(f"Trader {trader['peer_id']} ({trader_mode}) handled {trader['buys_handled']} buys at {trader['buys_per_second']:.1f} buys/sec")
+	rejected = sum(stats['pool']['rejected'] for stats in shard_results.values())
+	completed = sum(stats['pool']['completed'] for stats in shard_results.values())
+	print(f"Follow-up worker pools: {completed} jobs, {rejected} rejected")
+	return buyers
+
+
+if __name__ == '__main__':
+	if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] not in ('threaded', 'asyncio')):
+		print("Usage: python sharded.py <number_of_peers> <number_of_workers> [threaded|asyncio]")
+		sys.exit(1)
+	main(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3] if len(sys.argv) == 4 else 'threaded')
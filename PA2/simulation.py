@@ -0,0 +1,151 @@
+# simulation.py
+'''
+Run the bazaar on the discrete-event engine in utils/des.py.
+
+SimPeer keeps every Peer handler and replaces only the runtime underneath:
+datagrams go through the simulator's in-memory network, timeouts, follow-up
+buys and election quanta are simulator events, and every timestamp reads the
+virtual clock. A run is single-threaded and seeded, so the same seed gives the
+same run, elections included.
+
+Usage: python simulation.py <number_of_peers> [--seed S] [--latency SPEC] [--loss P] [--until T] [--quiet]
+'''
+import argparse
+import random
+import time
+
+from peer import Peer, Leader
+from sharded import assign_roles, ITEMS, LEADER_ID
+from utils.des import Simulator, parse_latency
+from utils.histogram import LatencyHistogram
+from utils.log import WARNING, configure as configure_log, shared_writer
+from utils.peer_directory import build_directory, neighbor_refs
+from utils.tracing import finish_tracing
+
+
+class SimPeer(Peer):
+	"""A Peer whose socket, clock and timers belong to a Simulator."""
+
+	def __init__(self, simulator, *args, **kwargs):
+		self.simulator = simulator
+		self.on_shutdown = None  # Called with the peer once it shuts down
+		super().__init__(*args, **kwargs)
+
+	def open_socket(self):
+		self.simulator.network.register((self.ip_address, self.port), self)
+		return None
+
+	def now(self):
+		return self.simulator.now
+
+	def clock_ns(self):
+		return int(self.simulator.now * 1e9)
+
+	def start_peer(self):
+		self.start_election_timer()
+
+	def start_election_timer(self):
+		self.simulator.call_later(self.time_quantum, self.election_timer)
+
+	def election_timer(self):
+		"""One election quantum per simulator event, rescheduled while the peer runs."""
+		if not self.running:
+			return
+		self.election_tick()
+		self.simulator.call_later(self.time_quantum, self.election_timer)
+
+	def spawn(self, target, *args):
+		self.simulator.call_soon(target, *args)
+
+	def schedule_timeout(self, delay, callback, *args):
+		return self.simulator.call_later(delay, callback, *args)
+
+	def transmit(self, data, addr):
+		self.simulator.network.send((self.ip_address, self.port), addr, data)
+
+	def shutdown_peer(self):
+		"""Shutdown the peer."""
+		self.log.info('shutdown', "Shutting down peer.")
+		self.running = False
+		self.cancel_pending_requests()
+		self.simulator.network.unregister((self.ip_address, self.port))
+		if self.on_shutdown is not None:
+			self.on_shutdown(self)
+
+
+def run_simulation(simulator, peers, start_delay=1.0, until=None):
+	'''
+	Sellers send their inventory at virtual time 0 and every buyer starts buying
+	at start_delay. Runs until every buyer has shut down or the clock reaches until.
+	Returns the number of events run.
+	'''
+	buyers = [peer for peer in peers if peer.role == 'buyer']
+	buyers_alive = {buyer.peer_id for buyer in buyers}
+	for buyer in buyers:
+		buyer.on_shutdown = lambda peer: buyers_alive.discard(peer.peer_id)
+	for peer in peers:
+		peer.start_peer()
+	for peer in peers:
+		if peer.role == 'seller':
+			peer.send_update_inventory()
+	for buyer in buyers:
+		simulator.call_later(start_delay, buyer.buy_item, random.choice(ITEMS), 1)
+	return simulator.run(until=until, stop=lambda: not buyers_alive)
+
+
+def main(N, seed=0, latency='constant:0.001', loss_rate=0.0, until=None, quiet=False):
+	# Peer decisions (roles, items, leader failures) use the random module; seeding it makes them reproducible
+	random.seed(seed)
+	simulator = Simulator(seed=seed, latency=parse_latency(latency), loss_rate=loss_rate)
+
+	specs = assign_roles(N)
+	directory = build_directory(range(N))
+	leader = Leader(LEADER_ID, *directory[LEADER_ID])
+	peers = []
+	for peer_id in range(N):
+		role, item = specs[peer_id]
+		ip_address, port = directory[peer_id]
+		# Fully connected, as in main.py
+		neighbors = neighbor_refs(directory, [i for i in directory if i != peer_id])
+		peers.append(SimPeer(simulator, peer_id=peer_id, role=role, neighbors=neighbors, port=port, leader=leader, ip_address=ip_address, item=item))
+	buyers = [peer for peer in peers if peer.role == 'buyer']
+
+	print(f"Simulating {N} peers ({len(buyers)} buyers), seed {seed}, latency {latency}")
+	wall_start = time.perf_counter()
+	if quiet:
+		# Warnings and errors still show
+		configure_log(WARNING)
+	events = run_simulation(simulator, peers, until=until)
+	wall_time = time.perf_counter() - wall_start
+	shared_writer().flush()
+
+	print(f"\nSimulated {simulator.now:.3f}s of virtual time in {wall_time:.3f}s "
+		f"({events} events, {events / wall_time if wall_time else 0:.0f} events/sec)")
+	network = simulator.network.stats()
+	print(f"Network: {network['sent']} datagrams sent, {network['delivered']} delivered, {network['dropped']} dropped")
+
+	print("\nRTT for each buyer:")
+	for buyer in buyers:
+		if buyer.end_time is None:
+			print(f"Buyer {buyer.peer_id} stopped after {buyer.items_bought} items, before max transactions")
+		else:
+			print(f"Buyer {buyer.peer_id} average RTT: {buyer.average_rtt:.4f} virtual seconds")
+	latency = LatencyHistogram.merged(buyer.latency for buyer in buyers)
+	print(f"Transaction latency (virtual time): {latency.summary()}")
+	trader = peers[LEADER_ID]
+	print(f"Trader {LEADER_ID} handled {trader.buys_handled} buys at {trader.buys_per_second():.1f} buys per virtual second")
+	finish_tracing()
+	return simulator, peers
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Discrete-event simulation of the bazaar")
+	parser.add_argument('peers', type=int)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--latency', default='constant:0.001',
+		help="constant:D, uniform:LOW,HIGH, lognormal:MEDIAN[,SIGMA] or link:LOW,HIGH[,JITTER] (seconds)")
+	parser.add_argument('--loss', type=float, default=0.0, help="Probability that a datagram is dropped")
+	parser.add_argument('--until', type=float, default=None, help="Stop after this many virtual seconds")
+	parser.add_argument('--quiet', action='store_true', help="Hide the peers' per-message output")
+	args = parser.parse_args()
+	main(args.peers, args.seed, args.latency, args.loss, args.until, args.quiet)
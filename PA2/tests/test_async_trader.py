@@ -0,0 +1,96 @@
+import unittest
+import socket
+import sys
+import os
+import threading
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+
+from async_trader import AsyncTraderPeer  # Absolute import
+from peer import Leader
+from utils.codec import encode
+
+
+class RecordingTrader(AsyncTraderPeer):
+	"""An AsyncTraderPeer on an ephemeral port that records what it handles instead of handling it."""
+
+	def __init__(self, **kwargs):
+		self.handled = []
+		super().__init__(peer_id=0, role='leader', neighbors=[], port=0, leader=Leader(0, 'localhost', 0), **kwargs)
+
+	def dispatch_message(self, message, addr):
+		self.handled.append(message['peer_id'])
+
+
+class FullSocket:
+	"""Stands in for a socket whose send buffer is full until writable is set."""
+
+	def __init__(self):
+		self.writable = False
+		self.sent = []
+
+	def sendto(self, data, addr):
+		if not self.writable:
+			raise BlockingIOError
+		self.sent.append((data, addr))
+
+	def fileno(self):
+		return -1
+
+
+class FakeLoop:
+	def __init__(self):
+		self.writers = 0
+
+	def add_writer(self, fd, callback):
+		self.writers += 1
+
+	def remove_writer(self, fd):
+		self.writers -= 1
+
+
+class TestAsyncTrader(unittest.TestCase):
+	def test_on_readable_drains_a_batch(self):
+		trader = RecordingTrader(recv_batch=3)
+		sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		try:
+			trader.socket.setblocking(False)
+			address = trader.socket.getsockname()
+			for i in range(5):
+				sender.sendto(encode({'type': 'OK', 'peer_id': i}), address)
+			# Loopback datagrams are queued by the time sendto returns, but give the kernel a moment
+			threading.Event().wait(0.05)
+			trader.on_readable()
+			self.assertEqual(trader.handled, [0, 1, 2])  # One batch per wakeup
+			trader.on_readable()
+			self.assertEqual(trader.handled, [0, 1, 2, 3, 4])
+			trader.on_readable()  # Nothing left: returns on BlockingIOError
+			self.assertEqual(len(trader.handled), 5)
+		finally:
+			sender.close()
+			trader.socket.close()
+
+	def test_send_queue_overflow_drops(self):
+		trader = RecordingTrader(send_queue_size=2)
+		trader.socket.close()
+		trader.socket = FullSocket()
+		trader.loop = FakeLoop()
+		trader.loop_thread_id = threading.get_ident()
+		for i in range(4):
+			trader.transmit(b'reply %d' % i, ('localhost', 6000))
+		self.assertEqual(len(trader.send_queue), 2)
+		self.assertEqual(trader.dropped_messages, 2)
+		self.assertEqual(trader.loop.writers, 1)  # Waiting for the socket once, not per message
+
+		trader.socket.writable = True
+		trader.on_writable()
+		self.assertEqual([data for data, _ in trader.socket.sent], [b'reply 0', b'reply 1'])
+		self.assertEqual(len(trader.send_queue), 0)
+		self.assertEqual(trader.loop.writers, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
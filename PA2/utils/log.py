@@ -0,0 +1,268 @@
+# log.py
+"""
+Leveled, structured logging with the writing done off the message path.
+
+A Logger call is a level check and, if the level is enabled, a tuple put on a
+queue: the time, the level, the source (usually a peer id), an event name, a
+str.format template and its fields. The LogWriter thread formats and writes
+records in batches, so handlers never format a string or touch stdout, and a
+disabled level costs one comparison. The queue holds queue_size records at
+most: when the writer falls behind (debug logging under a flood), new records
+are dropped and counted in LogWriter.dropped rather than piling up in memory.
+
+    log = Logger(peer_id)
+    log.debug('forward', "Forwarding lookup for {product} to Peer {neighbor}", product=name, neighbor=n)
+
+Fields are formatted later, on another thread: pass values, not structures the
+peer goes on changing. Something expensive to compute belongs behind
+log.enabled(DEBUG).
+
+Outputs:
+- 'text': one line per record, to stdout or a file;
+- 'jsonl': one JSON object per record (time, level, source, event, message, fields);
+- 'binary': length-prefixed pickled records, never formatted at all; needs a
+  path, and read_records() reads them back.
+"""
+import atexit
+import datetime
+import json
+import os
+import pickle
+import queue
+import struct
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR, 'off': OFF}
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+OUTPUTS = ('text', 'jsonl', 'binary')
+
+WRITE_BATCH = 512  # Records formatted and written per write() call at most
+QUEUE_SIZE = 65536  # Records waiting for the writer at most; more are dropped
+_FRAME = struct.Struct('!I')
+
+
+def level_number(level):
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[level.lower()]
+    except (KeyError, AttributeError):
+        raise ValueError(f"Unknown log level {level!r}; expected one of {', '.join(LEVELS)}") from None
+
+
+def format_message(message, fields):
+    try:
+        return message.format(**fields)
+    except Exception:
+        # A bad template should not cost the record
+        return f"{message} {fields!r}"
+
+
+class LogWriter:
+    def __init__(self, level=INFO, output='text', path=None, queue_size=QUEUE_SIZE):
+        self.level = OFF
+        self.output = 'text'
+        self.path = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0  # Records dropped because the queue was full
+        self.reported = 0  # Drops already reported on stderr
+        self.configure(level, output, path)
+
+    def configure(self, level=None, output=None, path=None, queue_size=None):
+        """Change the level now; a change of output or path applies from the next batch written."""
+        if queue_size is not None:
+            self.queue.maxsize = queue_size  # Read by every put, so this applies at once
+        if output is not None and output not in OUTPUTS:
+            raise ValueError(f"Unknown log output {output!r}; expected one of {', '.join(OUTPUTS)}")
+        new_output = output or self.output
+        new_path = path if path is not None else self.path
+        if new_output == 'binary' and not new_path:
+            raise ValueError("Binary logs need a path")
+        new_level = level_number(level) if level is not None else self.level
+        self.output = new_output
+        self.path = new_path
+        self.level = new_level
+
+    def put(self, record):
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        stream = None
+        opened = None  # (output, path) stream was opened for
+        while True:
+            records = [self.queue.get()]
+            while len(records) < WRITE_BATCH:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if (self.output, self.path) != opened:
+                if stream is not None:
+                    stream.close()
+                opened = (self.output, self.path)
+                try:
+                    stream = self.open(*opened)
+                except OSError as e:
+                    sys.stderr.write(f"[log] Could not open {opened[1]}: {e}. Logging to stdout.\n")
+                    stream = None
+                    opened = ('text', opened[1])
+            self.write(stream, opened[0], records)
+            if self.dropped != self.reported:
+                dropped, self.reported = self.dropped - self.reported, self.dropped
+                sys.stderr.write(f"[log] Dropped {dropped} records: the writer fell behind\n")
+
+    def open(self, output, path):
+        if not path:
+            return None  # sys.stdout, looked up at every write so redirection works
+        return open(path, 'ab' if output == 'binary' else 'a', encoding=None if output == 'binary' else 'utf-8')
+
+    def write(self, stream, output, records):
+        done = []
+        chunks = []
+        for record in records:
+            if isinstance(record, threading.Event):
+                done.append(record)
+            elif output == 'binary':
+                data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+                chunks.append(_FRAME.pack(len(data)) + data)
+            elif output == 'jsonl':
+                chunks.append(self.format_json(record) + '\n')
+            else:
+                chunks.append(self.format_text(record) + '\n')
+        if chunks:
+            out = stream if stream is not None else sys.stdout
+            try:
+                out.write((b'' if output == 'binary' else '').join(chunks))
+                out.flush()
+            except Exception as e:
+                sys.stderr.write(f"[log] Could not write {len(chunks)} records: {e}\n")
+            self.written += len(chunks)
+        for event in done:
+            event.set()
+
+    @staticmethod
+    def format_text(record):
+        timestamp, level, source, event, message, fields = record
+        clock = datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f")[:-3]
+        return f"{clock} {LEVEL_NAMES.get(level, level):<7} [{source}] {format_message(message, fields)}"
+
+    @staticmethod
+    def format_json(record):
+        timestamp, level, source, event, message, fields = record
+        return json.dumps({
+            'time': timestamp,
+            'level': LEVEL_NAMES.get(level, level),
+            'source': source,
+            'event': event,
+            'message': format_message(message, fields),
+            'fields': fields,
+        }, default=repr)
+
+    def flush(self, timeout=5.0):
+        """Wait until every record put so far is written. Returns False on timeout."""
+        if self.thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)  # Waits for room rather than being dropped
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _after_fork(self):
+        # The writer thread does not survive a fork; the child starts its own
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+
+class Logger:
+    __slots__ = ('source', 'writer', 'clock')
+
+    def __init__(self, source, writer=None, clock=time.time):
+        """clock stamps the records: a peer passes its now(), so simulated peers log virtual time."""
+        self.source = source
+        self.writer = writer if writer is not None else _shared_writer
+        self.clock = clock
+
+    def enabled(self, level):
+        return level >= self.writer.level
+
+    def log(self, level, event, message, fields):
+        if level >= self.writer.level:
+            self.writer.put((self.clock(), level, self.source, event, message, fields))
+
+    def debug(self, event, message, **fields):
+        if DEBUG >= self.writer.level:
+            self.writer.put((self.clock(), DEBUG, self.source, event, message, fields))
+
+    def info(self, event, message, **fields):
+        if INFO >= self.writer.level:
+            self.writer.put((self.clock(), INFO, self.source, event, message, fields))
+
+    def warning(self, event, message, **fields):
+        if WARNING >= self.writer.level:
+            self.writer.put((self.clock(), WARNING, self.source, event, message, fields))
+
+    def error(self, event, message, **fields):
+        if ERROR >= self.writer.level:
+            self.writer.put((self.clock(), ERROR, self.source, event, message, fields))
+
+
+def read_records(path):
+    """The records of a binary log, as the dicts the 'jsonl' output writes."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                return
+            data = f.read(_FRAME.unpack(header)[0])
+            timestamp, level, source, event, message, fields = pickle.loads(data)
+            yield {
+                'time': timestamp,
+                'level': LEVEL_NAMES.get(level, level),
+                'source': source,
+                'event': event,
+                'message': format_message(message, fields),
+                'fields': fields,
+            }
+
+
+# Created at import, but its thread only starts with the first record
+_shared_writer = LogWriter()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_shared_writer._after_fork)
+
+
+def shared_writer():
+    """The process-wide writer every Logger uses unless given another."""
+    return _shared_writer
+
+
+def configure(level=None, output=None, path=None, queue_size=None):
+    """Set the level, output, path and queue size of the shared writer. Returns it."""
+    _shared_writer.configure(level, output, path, queue_size)
+    return _shared_writer
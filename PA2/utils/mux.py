@@ -0,0 +1,157 @@
+# mux.py
+"""
+Many virtual peers behind one UDP socket.
+
+Each peer normally binds its own socket, which caps a host at a few thousand
+peers (file descriptors, port range). A MuxSocket binds one real socket and
+hosts any number of peers behind it. Every datagram starts with a header
+holding the destination and source peer ids; the receiving MuxSocket strips it
+and hands the payload to the destination peer.
+
+Peers keep their (ip_address, port) addresses, but those are virtual: they are
+never bound, only looked up in a MuxRouter, which maps each virtual address to
+a peer id and the real socket hosting it. Messages can carry addresses as
+before, so the handlers do not change. A MuxEndpoint gives each peer a
+socket-like object with sendto() and close().
+
+Several MuxSockets may share one router, to spread receive work over a few
+threads; routes to peers hosted in other processes can be added by hand.
+"""
+import socket
+import struct
+import threading
+
+from utils.log import Logger
+
+HEADER = struct.Struct('!II')  # destination peer id, source peer id
+RECV_BUFFER_SIZE = 65536
+
+
+class MuxRouter:
+    """Virtual address <-> peer id <-> real socket address, shared by MuxSockets."""
+
+    def __init__(self):
+        self.routes = {}  # virtual addr -> (peer_id, socket addr)
+        self.addresses = {}  # peer_id -> virtual addr
+
+    def add_route(self, peer_id, virtual_addr, socket_addr):
+        virtual_addr = tuple(virtual_addr)
+        self.routes[virtual_addr] = (peer_id, tuple(socket_addr))
+        self.addresses[peer_id] = virtual_addr
+
+    def remove_route(self, peer_id):
+        virtual_addr = self.addresses.pop(peer_id, None)
+        if virtual_addr is not None:
+            self.routes.pop(virtual_addr, None)
+
+
+class MuxEndpoint:
+    """What a peer hosted on a MuxSocket uses as its socket."""
+
+    def __init__(self, mux, peer_id):
+        self.mux = mux
+        self.peer_id = peer_id
+
+    def sendto(self, data, addr):
+        self.mux.send(self.peer_id, data, addr)
+
+    def close(self):
+        self.mux.unregister(self.peer_id)
+
+
+class MuxSocket:
+    def __init__(self, ip_address='localhost', port=4000, router=None, rcvbuf=None):
+        self.router = router if router is not None else MuxRouter()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            # Every hosted peer's traffic queues here
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.socket.bind((ip_address, port))
+        self.address = self.socket.getsockname()
+        self.log = Logger(f"mux {self.address[1]}")
+        self.receivers = {}  # peer_id -> receive_datagram(data, src_addr)
+        self.recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0  # Datagrams for peers not hosted here, from unknown senders, or too short for a header
+        self.unroutable = 0  # Sends to peers with no route: departed, or never registered
+
+    def open(self, peer_id, virtual_addr, receiver):
+        """Host peer_id at virtual_addr; receiver(data, src_addr) gets its datagrams."""
+        self.receivers[peer_id] = receiver
+        self.router.add_route(peer_id, virtual_addr, self.address)
+        return MuxEndpoint(self, peer_id)
+
+    def unregister(self, peer_id):
+        self.receivers.pop(peer_id, None)
+        self.router.remove_route(peer_id)
+
+    def send(self, src_id, data, addr):
+        route = self.router.routes.get(tuple(addr))
+        if route is None:
+            # Replies to a peer that has finished and closed are expected; not worth an exception
+            self.unroutable += 1
+            return
+        dst_id, socket_addr = route
+        self.socket.sendto(HEADER.pack(dst_id, src_id) + data, socket_addr)
+        self.sent += 1
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True)
+        self.thread.start()
+
+    def receive_loop(self):
+        """Demultiplex datagrams to the hosted peers until close()."""
+        self.socket.settimeout(1.0)
+        while self.running:
+            try:
+                nbytes, _ = self.socket.recvfrom_into(self.recv_buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                # Socket has been closed
+                break
+            if not self.running:
+                break
+            self.received += 1
+            if nbytes < HEADER.size:
+                self.dropped += 1
+                continue
+            dst_id, src_id = HEADER.unpack_from(self.recv_buffer)
+            receiver = self.receivers.get(dst_id)
+            src_addr = self.router.addresses.get(src_id)
+            if receiver is None or src_addr is None:
+                self.dropped += 1
+                continue
+            try:
+                receiver(self.recv_view[HEADER.size:nbytes], src_addr)
+            except Exception as e:
+                # One failing handler must not stop delivery to every other peer on this socket
+                self.log.error('handler_failed', "Peer {peer} failed handling a datagram: {error}", peer=dst_id, error=repr(e))
+
+    def close(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            # Wake the receive thread rather than waiting out its timeout
+            self.socket.sendto(b'', self.address)
+            self.thread.join()
+        self.socket.close()
+
+    def stats(self):
+        return {
+            'peers': len(self.receivers),
+            'sent': self.sent,
+            'received': self.received,
+            'dropped': self.dropped,
+            'unroutable': self.unroutable,
+        }
+
+
+def open_mux_sockets(ip_address='localhost', base_port=4000, count=1, rcvbuf=None):
+    """count MuxSockets on consecutive ports, sharing one router."""
+    router = MuxRouter()
+    return [MuxSocket(ip_address, base_port + i, router, rcvbuf) for i in range(count)]
@@ -0,0 +1,30 @@
+# peer_directory.py
+"""
+Serializable peer addressing for runs split across processes.
+
+A peer only needs the id, ip address and port of its neighbors, so instead of
+live Peer objects it can be given PeerRefs built from a directory
+{peer_id: (ip_address, port)}. Directories and adjacency lists are plain
+dicts and lists, so they can be pickled to worker processes or saved to a file.
+"""
+from collections import namedtuple
+
+PeerRef = namedtuple('PeerRef', ['peer_id', 'ip_address', 'port'])
+
+
+def build_directory(peer_ids, ip_address='localhost', base_port=5000):
+    """Directory giving each peer id the port base_port + id on ip_address."""
+    return {peer_id: (ip_address, base_port + peer_id) for peer_id in peer_ids}
+
+
+def neighbor_refs(directory, neighbor_ids):
+    """PeerRefs for neighbor_ids, to use as a Peer's neighbors."""
+    return [PeerRef(peer_id, *directory[peer_id]) for peer_id in neighbor_ids]
+
+
+def partition(peer_ids, shards):
+    """Split peer ids round-robin into `shards` lists, so every shard gets a mix of roles."""
+    parts = [[] for _ in range(shards)]
+    for i, peer_id in enumerate(peer_ids):
+        parts[i % shards].append(peer_id)
+    return parts
@@ -0,0 +1,180 @@
+# timers.py
+"""
+Shared timer subsystem.
+
+A TimerScheduler keeps its timers in a min-heap ordered by deadline and runs
+each callback on one background thread when the deadline passes. Scheduling is
+O(log n) and cancelling is O(1): a cancelled timer stays in the heap and is
+skipped when it reaches the top. The heap is rebuilt once more than half of it
+is cancelled timers, so cancelled timeouts do not pile up.
+
+Callbacks run on the timer thread and must be short; anything slow belongs on
+its own thread.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from utils.log import Logger
+
+
+class TimerHandle:
+    """A scheduled callback. cancel() stops it from running if it has not run yet."""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled', 'fired', 'scheduler')
+
+    def __init__(self, when, callback, args, scheduler):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.fired = False  # Out of the heap: run, or dropped by stop()
+        self.scheduler = scheduler
+
+    def cancel(self):
+        if not self.cancelled and not self.fired:
+            self.scheduler._cancelled(self)
+
+
+class TimerScheduler:
+    def __init__(self, clock=time.monotonic, name='timers'):
+        self.clock = clock
+        self.name = name
+        self.log = Logger(name)
+        self.heap = []  # (when, seq, handle)
+        self.sequence = itertools.count()  # Tie-breaker, keeps equal deadlines in FIFO order
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.cancelled_in_heap = 0
+        self.max_lateness = 0.0  # Worst delay between a deadline and its callback starting
+
+    def start(self):
+        """Start the timer thread (idempotent)."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop the timer thread. Timers that have not fired are dropped."""
+        with self.condition:
+            self.running = False
+            for _, _, handle in self.heap:
+                handle.fired = True
+            self.heap.clear()
+            self.cancelled_in_heap = 0
+            self.condition.notify()
+
+    def call_at(self, when, callback, *args):
+        """Run callback(*args) at clock() time `when`. Returns a TimerHandle."""
+        handle = TimerHandle(when, callback, args, self)
+        with self.condition:
+            heapq.heappush(self.heap, (when, next(self.sequence), handle))
+            self.scheduled += 1
+            # Wake the timer thread only if this deadline is now the earliest
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) after delay seconds. Returns a TimerHandle."""
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the timer thread as soon as possible."""
+        return self.call_at(self.clock(), callback, *args)
+
+    def _cancelled(self, handle):
+        with self.condition:
+            # Checked again under the lock: the timer thread may have popped it meanwhile
+            if handle.cancelled or handle.fired:
+                return
+            handle.cancelled = True
+            self.cancelled += 1
+            self.cancelled_in_heap += 1
+            if self.cancelled_in_heap > len(self.heap) // 2:
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled_in_heap = 0
+
+    def _pop_due(self):
+        """Pop the next live timer that is due, or return (None, seconds to wait or None)."""
+        while self.heap:
+            when, _, handle = self.heap[0]
+            if handle.cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled_in_heap -= 1
+                continue
+            now = self.clock()
+            if when > now:
+                return None, when - now
+            heapq.heappop(self.heap)
+            handle.fired = True
+            self.max_lateness = max(self.max_lateness, now - when)
+            return handle, None
+        return None, None
+
+    def run_due(self):
+        """Run every timer that is due now, on the calling thread. Returns how many ran."""
+        ran = 0
+        while True:
+            with self.condition:
+                handle, _ = self._pop_due()
+            if handle is None:
+                return ran
+            self._fire(handle)
+            ran += 1
+
+    def _fire(self, handle):
+        self.fired += 1
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            self.log.error('callback_failed', "Timer callback {callback} failed: {error}",
+                           callback=getattr(handle.callback, '__name__', repr(handle.callback)), error=str(e))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    handle, wait = self._pop_due()
+                    if handle is not None:
+                        break
+                    self.condition.wait(wait)
+                if not self.running:
+                    return
+            self._fire(handle)
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled_in_heap
+
+    def stats(self):
+        """Counters as a dict."""
+        return {
+            'pending': len(self),
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'max_lateness': self.max_lateness,
+        }
+
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    """The process-wide scheduler used by every peer, started on first use."""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = TimerScheduler(name='peer-timers')
+            _shared_scheduler.start()
+        return _shared_scheduler
@@ -0,0 +1,510 @@
+# topology.py
+"""
+Overlay topologies as adjacency dicts {peer_id: [neighbor ids]}, peer ids 0..n-1.
+
+Every builder runs in O(n + edges): neighbor membership is checked against a
+set per peer, and random partners come from a pool of peers that still have
+room, instead of scanning neighbor lists and retrying. Edges are undirected.
+max_degree (None for no bound) caps every peer's degree, and the result is
+always connected: ensure_connected() joins components, freeing a slot by
+splitting a cycle edge where a component is already full.
+
+rng is a seed, a random.Random, or None for the module-level random functions,
+so a run that seeds the random module reproduces its topology.
+"""
+import json
+import os
+import random
+from collections import deque
+
+KINDS = ('ring_random', 'random_regular', 'small_world', 'scale_free', 'complete')
+
+
+class _Graph:
+    """Adjacency lists with a set per peer for O(1) membership checks."""
+
+    def __init__(self, n, max_degree):
+        self.adjacency = {i: [] for i in range(n)}
+        self.sets = {i: set() for i in range(n)}
+        self.max_degree = max_degree
+
+    def add_peer(self, i):
+        self.adjacency[i] = []
+        self.sets[i] = set()
+
+    def remove_peer(self, i):
+        """Drop peer i, whose edges must be gone."""
+        del self.adjacency[i]
+        del self.sets[i]
+
+    def has_room(self, i):
+        return self.max_degree is None or len(self.sets[i]) < self.max_degree
+
+    def can_link(self, i, j):
+        return i != j and j not in self.sets[i] and self.has_room(i) and self.has_room(j)
+
+    def link(self, i, j):
+        self.adjacency[i].append(j)
+        self.adjacency[j].append(i)
+        self.sets[i].add(j)
+        self.sets[j].add(i)
+
+    def unlink(self, i, j):
+        self.adjacency[i].remove(j)
+        self.adjacency[j].remove(i)
+        self.sets[i].discard(j)
+        self.sets[j].discard(i)
+
+
+def _rng(rng):
+    if rng is None or rng is random:
+        return random
+    if isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
+
+def _fill_randomly(graph, rng, targets, retries=10):
+    """
+    Add random edges until each peer i reaches targets[i] neighbors (or the
+    retries run out). Partners are drawn from the pool of peers below their
+    target; a peer leaves the pool, by swap-remove, once it is full.
+    """
+    pool = [i for i in graph.adjacency if len(graph.sets[i]) < targets[i]]
+    position = {i: k for k, i in enumerate(pool)}
+
+    def drop(i):
+        k = position.pop(i)
+        last = pool.pop()
+        if last != i:
+            pool[k] = last
+            position[last] = k
+
+    order = pool[:]
+    rng.shuffle(order)
+    for i in order:
+        failures = 0
+        while i in position and failures < retries and len(pool) > 1:
+            j = pool[rng.randrange(len(pool))]
+            if graph.can_link(i, j):
+                graph.link(i, j)
+                for peer in (i, j):
+                    if len(graph.sets[peer]) >= targets[peer] and peer in position:
+                        drop(peer)
+            else:
+                failures += 1
+        if i in position:
+            drop(i)
+
+
+def ring_random(n, max_degree=3, rng=None, min_degree=None):
+    """
+    A ring plus random links, as main.py used to build: every peer gets up to
+    max_degree neighbors (a degree drawn from [min_degree, max_degree] if min_degree is given).
+    """
+    rng = _rng(rng)
+    graph = _Graph(n, max_degree)
+    for i in range(n):
+        j = (i + 1) % n
+        if graph.can_link(i, j):
+            graph.link(i, j)
+    bound = n - 1 if max_degree is None else min(max_degree, n - 1)
+    if min_degree is None:
+        targets = [bound] * n
+    else:
+        targets = [rng.randint(min(min_degree, bound), bound) for _ in range(n)]
+    _fill_randomly(graph, rng, targets)
+    return ensure_connected(graph, rng)
+
+
+def random_regular(n, degree=3, rng=None):
+    """
+    Every peer gets `degree` neighbors where possible: stubs are paired at
+    random and the few that would form self-loops or duplicate edges are re-paired.
+    """
+    rng = _rng(rng)
+    degree = min(degree, n - 1)
+    graph = _Graph(n, degree)
+    stubs = [i for i in range(n) for _ in range(degree)]
+    rng.shuffle(stubs)
+    for k in range(0, len(stubs) - 1, 2):
+        if graph.can_link(stubs[k], stubs[k + 1]):
+            graph.link(stubs[k], stubs[k + 1])
+    _fill_randomly(graph, rng, [degree] * n)
+    return ensure_connected(graph, rng)
+
+
+def small_world(n, k=4, shortcuts=0.1, rng=None, max_degree=None):
+    """
+    Newman-Watts small world: a ring lattice linking each peer to its k nearest
+    peers (k // 2 on each side), plus shortcuts * n links between random peers.
+    Unlike Watts-Strogatz rewiring, the lattice stays whole, which matters when
+    max_degree leaves room for only a ring and a shortcut.
+    """
+    rng = _rng(rng)
+    graph = _Graph(n, max_degree)
+    for i in range(n):
+        for step in range(1, k // 2 + 1):
+            j = (i + step) % n
+            if graph.can_link(i, j):
+                graph.link(i, j)
+    for _ in range(int(shortcuts * n)):
+        for _ in range(10):
+            i, j = rng.randrange(n), rng.randrange(n)
+            if graph.can_link(i, j):
+                graph.link(i, j)
+                break
+    return ensure_connected(graph, rng)
+
+
+def scale_free(n, m=2, rng=None, max_degree=None):
+    """
+    Barabasi-Albert preferential attachment: each new peer links to m existing
+    peers chosen proportionally to their degree, skipping peers at max_degree.
+    """
+    rng = _rng(rng)
+    graph = _Graph(n, max_degree)
+    # Every edge end, so a uniform pick is a degree-proportional pick; ends of
+    # peers that have reached max_degree are dropped when picked
+    ends = []
+    seed_size = min(n, m + 1)
+    for i in range(seed_size):
+        for j in range(i + 1, seed_size):
+            if graph.can_link(i, j):
+                graph.link(i, j)
+                ends.extend((i, j))
+    for i in range(seed_size, n):
+        linked = 0
+        for _ in range(4 * m):
+            if linked == m or not ends:
+                break
+            k = rng.randrange(len(ends))
+            j = ends[k]
+            if not graph.has_room(j):
+                ends[k] = ends[-1]
+                ends.pop()
+            elif graph.can_link(i, j):
+                graph.link(i, j)
+                ends.extend((i, j))
+                linked += 1
+    return ensure_connected(graph, rng)
+
+
+def complete(n, max_degree=None):
+    """Every peer linked to every other, as PA2 uses. Raises ValueError if that exceeds max_degree."""
+    if max_degree is not None and n - 1 > max_degree:
+        raise ValueError(f"A complete graph of {n} peers needs a max degree of {n - 1}, not {max_degree}")
+    return {i: [j for j in range(n) if j != i] for i in range(n)}
+
+
+def _components(adjacency):
+    seen = set()
+    components = []
+    for start in adjacency:
+        if start in seen:
+            continue
+        seen.add(start)
+        component = [start]
+        queue = deque([start])
+        while queue:
+            peer = queue.popleft()
+            for neighbor in adjacency[peer]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    component.append(neighbor)
+                    queue.append(neighbor)
+        components.append(component)
+    return components
+
+
+def _cycle_edge(graph, start):
+    """
+    An edge lying on a cycle of start's component: removing it keeps the
+    component connected and gives both ends room for a link. A component where
+    every peer is full has at least as many edges as peers, so it has a cycle;
+    a BFS non-tree edge lies on one.
+    """
+    parent = {start: None}
+    queue = deque([start])
+    while queue:
+        peer = queue.popleft()
+        for neighbor in graph.adjacency[peer]:
+            if neighbor not in parent:
+                parent[neighbor] = peer
+                queue.append(neighbor)
+            elif parent[peer] != neighbor:
+                return peer, neighbor
+    raise ValueError("Cannot connect the topology within the degree bound")
+
+
+def _split_cycle_edge(graph, component):
+    """Remove a cycle edge of component (see _cycle_edge) and return its two ends."""
+    peer, neighbor = _cycle_edge(graph, component[0])
+    graph.unlink(peer, neighbor)
+    return [peer, neighbor]
+
+
+def ensure_connected(graph, rng=None):
+    """
+    Join the components of graph into one, keeping the degree bound: each is
+    linked to a random peer with room in the ones joined so far, so many small
+    components end up as a shallow tree rather than a chain. Returns the adjacency dict.
+    """
+    rng = _rng(rng)
+    components = _components(graph.adjacency)
+    if len(components) <= 1:
+        return graph.adjacency
+    if graph.max_degree is not None and graph.max_degree < 2:
+        raise ValueError(f"{len(graph.adjacency)} peers cannot be connected with max_degree {graph.max_degree}")
+    main = components[0]
+    open_peers = [peer for peer in main if graph.has_room(peer)]  # May hold peers that have filled up since
+    for component in components[1:]:
+        peer = None
+        while open_peers:
+            k = rng.randrange(len(open_peers))
+            peer = open_peers[k]
+            if graph.has_room(peer):
+                break
+            open_peers[k] = open_peers[-1]
+            open_peers.pop()
+            peer = None
+        if peer is None:
+            open_peers = _split_cycle_edge(graph, main)
+            peer = open_peers[0]
+        component_open = [p for p in component if graph.has_room(p)] or _split_cycle_edge(graph, component)
+        graph.link(peer, component_open[0])
+        main.extend(component)
+        open_peers.extend(component_open)
+    return graph.adjacency
+
+
+def build(kind, n, max_degree=3, rng=None):
+    """A connected topology of the given kind; max_degree is also the target degree where one is needed."""
+    if kind == 'ring_random':
+        return ring_random(n, max_degree, rng)
+    if kind == 'random_regular':
+        return random_regular(n, max_degree, rng)
+    if kind == 'small_world':
+        # The widest lattice that leaves room for shortcuts
+        k = 4 if max_degree is None or max_degree > 4 else 2
+        return small_world(n, k, rng=rng, max_degree=max_degree)
+    if kind == 'scale_free':
+        # Each new peer adds m links; above max_degree / 2 they use up the room faster than
+        # peers bring it and late peers end up in a chain
+        m = 2 if max_degree is None else max(1, (max_degree - 1) // 2)
+        return scale_free(n, m, rng, max_degree)
+    if kind == 'complete':
+        return complete(n, max_degree)
+    raise ValueError(f"Unknown topology '{kind}', expected one of {', '.join(KINDS)}")
+
+
+def save(adjacency, path, **info):
+    """Write adjacency (and any info, e.g. kind and seed) as JSON."""
+    with open(path, 'w') as f:
+        json.dump({'info': info, 'adjacency': {str(i): neighbors for i, neighbors in adjacency.items()}}, f)
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {int(i): neighbors for i, neighbors in data['adjacency'].items()}
+
+
+def load_or_build(kind, n, max_degree=3, seed=None, path=None):
+    """
+    The topology saved at path if there is one (it must have n peers), else a
+    new one, saved to path when given so later runs reuse the same graph.
+    """
+    if path and os.path.exists(path):
+        adjacency = load(path)
+        if len(adjacency) != n:
+            raise ValueError(f"Topology file {path} has {len(adjacency)} peers, not {n}")
+        return adjacency
+    adjacency = build(kind, n, max_degree, seed)
+    if path:
+        save(adjacency, path, kind=kind, max_degree=max_degree, seed=seed)
+    return adjacency
+
+
+def attach(peers, adjacency):
+    """Set each peer's neighbors from adjacency; peers[i] has peer id i."""
+    for peer in peers:
+        peer.neighbors = [peers[j] for j in adjacency[peer.peer_id]]
+
+
+class Overlay:
+    """
+    A topology that peers join and leave at runtime, kept connected within
+    max_degree. A joining peer links to random peers with room, or takes the
+    place of an edge when every peer is full. When a peer leaves, its former
+    neighbors link to each other where they have room, and any piece the leave
+    cut off is linked back to the rest.
+
+    listeners hear of each change as it is made, through edge_added(u, v),
+    edge_removed(u, v), node_added(peer) and node_removed(peer), e.g. a
+    network_utils.LandmarkMetrics tracking the diameter.
+    """
+
+    def __init__(self, adjacency, max_degree=3, rng=None, listeners=()):
+        self.rng = _rng(rng)
+        self.graph = _Graph(0, max_degree)
+        for peer, neighbors in adjacency.items():
+            self.graph.adjacency[peer] = list(neighbors)
+            self.graph.sets[peer] = set(neighbors)
+        self.adjacency = self.graph.adjacency
+        self.listeners = list(listeners)
+        self.ids = list(self.adjacency)  # For picking a random peer
+        self.position = {peer: k for k, peer in enumerate(self.ids)}
+        # Peers that may have room; entries that have filled up or left are dropped when picked
+        self.open = []
+        self.open_set = set()
+        for peer in self.ids:
+            self._mark_open(peer)
+        self.changed = set()  # Peers whose neighbors changed in the current join or leave
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _mark_open(self, peer):
+        if peer not in self.open_set and self.graph.has_room(peer):
+            self.open_set.add(peer)
+            self.open.append(peer)
+
+    def _pick_open(self, exclude=(), tries=16):
+        """A random peer with room that is not in exclude, or None if none turns up."""
+        for _ in range(tries):
+            if not self.open:
+                return None
+            k = self.rng.randrange(len(self.open))
+            peer = self.open[k]
+            if peer not in self.adjacency or not self.graph.has_room(peer):
+                self.open[k] = self.open[-1]
+                self.open.pop()
+                self.open_set.discard(peer)
+            elif peer not in exclude:
+                return peer
+        return None
+
+    def random_peer(self):
+        return self.ids[self.rng.randrange(len(self.ids))]
+
+    def _link(self, u, v):
+        self.graph.link(u, v)
+        self.changed.update((u, v))
+        for listener in self.listeners:
+            listener.edge_added(u, v)
+
+    def _unlink(self, u, v):
+        self.graph.unlink(u, v)
+        self.changed.update((u, v))
+        self._mark_open(u)
+        self._mark_open(v)
+        for listener in self.listeners:
+            listener.edge_removed(u, v)
+
+    def _drain(self):
+        changed, self.changed = self.changed, set()
+        return {peer for peer in changed if peer in self.adjacency}
+
+    def join(self, peer, degree=None):
+        """
+        Add peer with up to degree neighbors (default: max_degree, or 3 if there
+        is no bound). Returns the peers whose neighbors changed, peer included.
+        """
+        graph = self.graph
+        if peer in self.adjacency:
+            raise ValueError(f"Peer {peer} is already in the overlay")
+        others = len(self.ids)
+        graph.add_peer(peer)
+        self.position[peer] = len(self.ids)
+        self.ids.append(peer)
+        for listener in self.listeners:
+            listener.node_added(peer)
+        if degree is None:
+            degree = graph.max_degree if graph.max_degree is not None else 3
+        if graph.max_degree is not None:
+            degree = min(degree, graph.max_degree)
+        while len(graph.sets[peer]) < min(degree, others):
+            partner = self._pick_open(graph.sets[peer])
+            if partner is None:
+                break
+            self._link(peer, partner)
+        if others and not graph.sets[peer]:
+            # Every peer is full: take the place of an edge, which keeps both ends' degrees
+            if graph.max_degree is not None and graph.max_degree < 2:
+                raise ValueError(f"Peer {peer} cannot join with max_degree {graph.max_degree}")
+            u = self.random_peer()
+            while u == peer or not self.adjacency[u]:
+                u = self.random_peer()
+            v = self.rng.choice(self.adjacency[u])
+            self._unlink(u, v)
+            self._link(u, peer)
+            self._link(peer, v)
+        self._mark_open(peer)
+        self.changed.add(peer)
+        return self._drain()
+
+    def leave(self, peer):
+        """Remove peer and repair the overlay around it. Returns the remaining peers whose neighbors changed."""
+        former = list(self.adjacency[peer])
+        for neighbor in former:
+            self._unlink(peer, neighbor)
+        self.graph.remove_peer(peer)
+        k = self.position.pop(peer)
+        last = self.ids.pop()
+        if last != peer:
+            self.ids[k] = last
+            self.position[last] = k
+        for listener in self.listeners:
+            listener.node_removed(peer)
+
+        # Link each former neighbor to an earlier one with room: cheap, and often all it takes
+        self.rng.shuffle(former)
+        for i in range(1, len(former)):
+            partners = [other for other in former[:i] if self.graph.can_link(former[i], other)]
+            if partners:
+                self._link(former[i], self.rng.choice(partners))
+        for other in former[1:]:
+            self._reconnect(former[0], other)
+        return self._drain()
+
+    def _separate(self, a, b):
+        """
+        Search outward from a and b in turns. Returns None if the searches meet,
+        else the component the first search to run out covered and a peer outside it.
+        Either way the cost is about twice the smaller search.
+        """
+        if a == b:
+            return None
+        side_of = {a: 0, b: 1}
+        queues = (deque([a]), deque([b]))
+        side = 0
+        while True:
+            queue = queues[side]
+            if not queue:
+                return [peer for peer, s in side_of.items() if s == side], (b if side == 0 else a)
+            peer = queue.popleft()
+            for neighbor in self.adjacency[peer]:
+                s = side_of.get(neighbor)
+                if s is None:
+                    side_of[neighbor] = side
+                    queue.append(neighbor)
+                elif s != side:
+                    return None
+            side ^= 1
+
+    def _reconnect(self, a, b):
+        """Link the component of a or b to the rest of the overlay if they are apart."""
+        separated = self._separate(a, b)
+        if separated is None:
+            return
+        piece, outside = separated
+        inside = next((peer for peer in piece if self.graph.has_room(peer)), None)
+        if inside is None:
+            inside, neighbor = _cycle_edge(self.graph, piece[0])
+            self._unlink(inside, neighbor)
+        partner = self._pick_open(set(piece))
+        if partner is None:
+            partner, neighbor = _cycle_edge(self.graph, outside)
+            self._unlink(partner, neighbor)
+        self._link(inside, partner)
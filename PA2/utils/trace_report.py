@@ -0,0 +1,191 @@
+# trace_report.py
+"""
+Merge the peers' trace files (utils/tracing.py) and break transactions down by leg.
+
+    python -m utils.trace_report [directory] [--slowest N] [--min-ms MS]
+
+A transaction is complete when the buyer marked the span that confirmed it
+(fields 'done'). Its critical path runs from that span back through the
+parents to the span that started the last attempt. A hop hands off to the
+next when it sends the message on (or when the next hop starts, if that comes
+first: a flooding peer may still be sending to other neighbors), and each span
+on the path adds its leg, from its parent's handoff to its own: the message in
+flight (network and queueing) plus its handler up to the send. Time before
+the last attempt started, spent on lookups that timed out and buys that
+failed, is the 'retries' leg. The legs of a path add up to the transaction's
+time.
+
+The report gives the legs' distributions over the complete transactions,
+every hop by message type (off the critical path too: flooded lookups that
+lost the race, PA2's sell confirmations), and the critical paths of the
+slowest transactions.
+"""
+import argparse
+import sys
+
+from utils.histogram import LatencyHistogram
+from utils.tracing import read_spans
+
+PERCENTILES = (50, 99)
+
+
+def _ns(seconds):
+    return int(round(seconds * 1e9))
+
+
+def handoff(parent, child):
+    """When parent passed the transaction on to child."""
+    sent = parent.get('sent')
+    return min(sent if sent is not None else parent['end'], child['start'])
+
+
+def critical_path(spans):
+    """Spans from the start of the last attempt to the one marked done, or None if the transaction is not complete."""
+    ends = [span for span in spans if (span.get('fields') or {}).get('done')]
+    if not ends:
+        return None
+    by_id = {span['span']: span for span in spans}
+    path = [max(ends, key=lambda span: span['end'])]
+    seen = {path[0]['span']}
+    while True:
+        parent = by_id.get(path[-1]['parent'])
+        if parent is None or parent['span'] in seen:
+            break
+        seen.add(parent['span'])
+        path.append(parent)
+    path.reverse()
+    return path
+
+
+def transactions(spans):
+    """
+    One dict per trace: 'trace', 'spans', 'path' (None if incomplete), 'total' and 'retries'
+    (seconds), and 'legs', a list of (name, leg, handler) seconds along the path.
+    """
+    traces = {}
+    for span in spans:
+        traces.setdefault(span['trace'], []).append(span)
+    result = []
+    for trace_id, trace_spans in traces.items():
+        path = critical_path(trace_spans)
+        transaction = {'trace': trace_id, 'spans': trace_spans, 'path': path, 'total': None, 'retries': None, 'legs': []}
+        if path is not None:
+            first = min(span['start'] for span in trace_spans)
+            root = path[0]
+            transaction['total'] = path[-1]['end'] - first
+            transaction['retries'] = root['start'] - first
+            previous = root['start']
+            for span, following in zip(path, path[1:] + [None]):
+                passed_on = handoff(span, following) if following is not None else span['end']
+                transaction['legs'].append((span['name'], passed_on - previous, span['end'] - span['start']))
+                previous = passed_on
+        result.append(transaction)
+    return result
+
+
+def leg_breakdown(complete):
+    """leg name -> (histogram of its time per transaction, hops per transaction), over complete transactions."""
+    legs = {}
+    for transaction in complete:
+        per_leg = {'retries': [transaction['retries'], 0]}
+        for name, leg, _ in transaction['legs']:
+            entry = per_leg.setdefault(name, [0.0, 0])
+            entry[0] += leg
+            entry[1] += 1
+        for name, (elapsed, hops) in per_leg.items():
+            histogram, hop_counts = legs.setdefault(name, (LatencyHistogram(), []))
+            histogram.record(_ns(elapsed))
+            hop_counts.append(hops)
+    return legs
+
+
+def hop_breakdown(spans):
+    """message type -> (histogram of in-flight time, histogram of handler time), over every span with a known parent."""
+    by_id = {span['span']: span for span in spans}
+    hops = {}
+    for span in spans:
+        parent = by_id.get(span['parent'])
+        if parent is None:
+            continue
+        in_flight, handler = hops.setdefault(span['name'], (LatencyHistogram(), LatencyHistogram()))
+        in_flight.record(_ns(span['start'] - handoff(parent, span)))
+        handler.record(_ns(span['end'] - span['start']))
+    return hops
+
+
+def _ms(ns):
+    return f"{ns / 1e6:9.3f}" if ns is not None else f"{'-':>9}"
+
+
+def report(spans, slowest=5, min_ms=None):
+    """The report, as lines of text."""
+    lines = []
+    all_transactions = transactions(spans)
+    complete = [transaction for transaction in all_transactions if transaction['path'] is not None]
+    peers = {span['peer'] for span in spans}
+    lines.append(f"{len(all_transactions)} traces ({len(complete)} complete), {len(spans)} spans from {len(peers)} peers")
+    if not complete:
+        return lines
+
+    # Legs are reported in the order they first appear on a critical path
+    order = ['retries']
+    for transaction in complete:
+        for name, _, _ in transaction['legs']:
+            if name not in order:
+                order.append(name)
+    legs = leg_breakdown(complete)
+    totals = LatencyHistogram()
+    for transaction in complete:
+        totals.record(_ns(transaction['total']))
+    lines.append("")
+    lines.append("Critical path by leg (ms per transaction)        hops      p50      p99     mean   share")
+    for name in order:
+        histogram, hop_counts = legs[name]
+        percentiles = histogram.percentiles(PERCENTILES)
+        hops = f"{sum(hop_counts) / len(hop_counts):6.1f}" if name != 'retries' else f"{'':6}"
+        share = histogram.total / totals.total if totals.total else 0.0
+        lines.append(f"  {name:<45} {hops} {_ms(percentiles[50])}{_ms(percentiles[99])}{_ms(histogram.mean())} {share:6.1%}")
+    percentiles = totals.percentiles(PERCENTILES)
+    lines.append(f"  {'total':<45} {'':6} {_ms(percentiles[50])}{_ms(percentiles[99])}{_ms(totals.mean())}")
+
+    lines.append("")
+    lines.append("Every hop by message type (ms)       hops   in flight p50      p99   handler p50      p99")
+    for name, (in_flight, handler) in sorted(hop_breakdown(spans).items()):
+        flight = in_flight.percentiles(PERCENTILES)
+        work = handler.percentiles(PERCENTILES)
+        lines.append(f"  {name:<32} {in_flight.count:7}    {_ms(flight[50])}{_ms(flight[99])}    {_ms(work[50])}{_ms(work[99])}")
+
+    slow = sorted(complete, key=lambda transaction: transaction['total'], reverse=True)
+    if min_ms is not None:
+        slow = [transaction for transaction in slow if transaction['total'] * 1e3 >= min_ms]
+    else:
+        slow = slow[:slowest]
+    for transaction in slow:
+        lines.append("")
+        lines.append(f"Trace {transaction['trace']:016x}: {transaction['total'] * 1e3:.3f} ms, "
+                     f"{transaction['retries'] * 1e3:.3f} ms of it before the last attempt")
+        root_start = transaction['path'][0]['start']
+        for span, (name, leg, handler) in zip(transaction['path'], transaction['legs']):
+            lines.append(f"  {(span['start'] - root_start) * 1e3:+10.3f} ms  peer {span['peer']:<5} {name:<18} "
+                         f"leg {leg * 1e3:8.3f} ms (handler {handler * 1e3:.3f} ms)")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge trace files and break transactions down by leg")
+    parser.add_argument('directory', nargs='?', default='traces')
+    parser.add_argument('--slowest', type=int, default=5, help="critical paths of this many of the slowest transactions")
+    parser.add_argument('--min-ms', type=float, default=None, help="instead, those of every transaction at least this slow")
+    args = parser.parse_args(argv)
+    try:
+        spans = read_spans(args.directory)
+    except OSError as e:
+        print(f"Could not read traces from {args.directory}: {e}")
+        return 1
+    for line in report(spans, args.slowest, args.min_ms):
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# tracing.py
+"""
+End-to-end traces of transactions, one span per hop.
+
+A buyer opens a trace when it starts a transaction and keeps it through its
+retries. Every message of the transaction carries the trace id and the id of
+the span that sent it ('trace_id' and 'span_id', optional fields of the wire
+schemas); the peer handling it records a span of its own, named after the
+message type, with the sender's span as parent, and whatever the handler sends
+carries the new span on. A PA1 purchase is then a chain
+
+    start -> lookup -> ... -> lookup -> reply -> ... -> reply -> buy -> buy_confirmation
+
+across the peers, and a PA2 one start -> buy -> buy_confirmation, with the
+trader's sell_confirmation to the seller branching off.
+
+A span is (trace, span, parent, peer, name, start, sent, end, fields), timed
+with the peer's clock (virtual time in simulation.py); sent is when the span
+last stamped a message, the handoff to the next hop. Tracer.wrap() records spans
+around the handlers; send paths call stamp(), which is all an untraced message
+costs. The TraceWriter thread appends the spans of each peer to
+<directory>/trace_<peer id>.jsonl; utils/trace_report.py merges the files.
+Spans it has not caught up with are bounded as the log's records are: past
+queue_size, new ones are dropped and counted in TraceWriter.dropped.
+"""
+import atexit
+import contextlib
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Message types that carry a trace context; their schemas list the trace fields
+TRACED_TYPES = frozenset(('lookup', 'reply', 'buy', 'buy_confirmation', 'sell_confirmation'))
+
+WRITE_BATCH = 512  # Spans written per batch at most
+QUEUE_SIZE = 65536  # Spans waiting for the writer at most; more are dropped
+NO_SPAN = contextlib.nullcontext()
+
+# Ids and sampling draw from their own generator, so tracing leaves seeded runs unchanged
+_random = random.Random()
+
+
+class Span:
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'start', 'sent', 'fields', 'outer')
+
+    def __init__(self, tracer, trace_id, span_id, parent_id, name):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = None
+        self.sent = None
+        self.fields = None
+        self.outer = None
+
+    def __enter__(self):
+        local = self.tracer.local
+        self.outer = getattr(local, 'span', None)
+        local.span = self
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        tracer = self.tracer
+        tracer.local.span = self.outer
+        tracer.writer.put((self.trace_id, self.span_id, self.parent_id, tracer.peer_id,
+                           self.name, self.start, self.sent, tracer.clock(), self.fields))
+
+
+class Tracer:
+    def __init__(self, peer_id, writer=None, clock=time.time, sample=1.0):
+        """clock times the spans: a peer passes its now(). sample is the fraction of new traces recorded."""
+        self.peer_id = peer_id
+        self.writer = writer if writer is not None else _shared_writer
+        self.clock = clock
+        self.sample = sample
+        self.local = threading.local()  # .span: the span open on this thread
+        # Span ids are unique per peer without coordination: the peer id above a counter
+        self.span_base = peer_id << 32
+        self.span_counter = itertools.count(1)
+
+    def new_trace(self):
+        """Id of a new trace, or None if this one is sampled out."""
+        if self.sample < 1.0 and _random.random() >= self.sample:
+            return None
+        return _random.getrandbits(63)
+
+    def span(self, trace_id, parent_id, name):
+        """Context manager recording a span of trace_id; a no-op if trace_id is None."""
+        if trace_id is None:
+            return NO_SPAN
+        return Span(self, trace_id, self.span_base | (next(self.span_counter) & 0xFFFFFFFF), parent_id, name)
+
+    def current(self):
+        return getattr(self.local, 'span', None)
+
+    def stamp(self, message):
+        """Put the open span's context on an outgoing message of a traced type."""
+        span = getattr(self.local, 'span', None)
+        if span is not None and message.get('type') in TRACED_TYPES:
+            message['trace_id'] = span.trace_id
+            message['span_id'] = span.span_id
+            span.sent = self.clock()
+
+    def annotate(self, **fields):
+        """Add fields to the open span, if there is one."""
+        span = getattr(self.local, 'span', None)
+        if span is not None:
+            if span.fields is None:
+                span.fields = {}
+            span.fields.update(fields)
+
+    def wrap(self, handler, message_type):
+        """handler(message, addr), recording a span named message_type for messages that carry a trace."""
+        def run(message, addr):
+            trace_id = message.get('trace_id')
+            if trace_id is None:
+                return handler(message, addr)
+            with self.span(trace_id, message.get('span_id'), message_type):
+                return handler(message, addr)
+        return run
+
+
+class TraceWriter:
+    def __init__(self, directory='traces', queue_size=QUEUE_SIZE):
+        self.directory = directory
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.files = {}  # path -> open file; each is truncated when this process first writes it
+        self.written = 0
+        self.dropped = 0  # Spans dropped because the queue was full
+
+    def configure(self, directory, queue_size=None):
+        """Write the spans of the next batch on into directory."""
+        self.directory = directory
+        if queue_size is not None:
+            self.queue.maxsize = queue_size  # Read by every put, so this applies at once
+
+    def path(self, peer_id):
+        return os.path.join(self.directory, f"trace_{peer_id}.jsonl")
+
+    def put(self, record):
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='trace-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < WRITE_BATCH:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(records)
+
+    def write(self, records):
+        done = []
+        touched = set()
+        for record in records:
+            if isinstance(record, threading.Event):
+                done.append(record)
+                continue
+            trace_id, span_id, parent_id, peer_id, name, start, sent, end, fields = record
+            span = {'trace': trace_id, 'span': span_id, 'parent': parent_id, 'peer': peer_id,
+                    'name': name, 'start': start, 'end': end}
+            if sent is not None:
+                span['sent'] = sent
+            if fields:
+                span['fields'] = fields
+            try:
+                f = self.open(self.path(peer_id))
+                f.write(json.dumps(span, default=repr) + '\n')
+            except OSError as e:
+                # Spans are not worth failing a run for; the report works with what was written
+                sys.stderr.write(f"[trace] Could not write {self.path(peer_id)}: {e}\n")
+                continue
+            touched.add(f)
+            self.written += 1
+        for f in touched:
+            f.flush()
+        for event in done:
+            event.set()
+
+    def open(self, path):
+        f = self.files.get(path)
+        if f is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            f = self.files[path] = open(path, 'w', encoding='utf-8')
+        return f
+
+    def flush(self, timeout=5.0):
+        """Wait until every span put so far is written. Returns False on timeout."""
+        if self.thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)  # Waits for room rather than being dropped
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _after_fork(self):
+        # The writer thread does not survive a fork; the child starts its own and
+        # opens its own files (its peers are not the parent's)
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.files = {}
+        self.written = 0
+        self.dropped = 0
+
+
+def read_spans(directory):
+    """Every span written into directory, from all the peers' files."""
+    spans = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('trace_') and name.endswith('.jsonl'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        spans.append(json.loads(line))
+    return spans
+
+
+# Created at import, but its thread only starts with the first span
+_shared_writer = TraceWriter()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_shared_writer._after_fork)
+
+
+def shared_writer():
+    """The process-wide writer every Tracer uses unless given another."""
+    return _shared_writer
+
+
+def configure(directory, queue_size=None):
+    """Set the directory and queue size of the shared writer. Returns it."""
+    _shared_writer.configure(directory, queue_size)
+    return _shared_writer
+
+
+def finish_tracing():
+    """Write out the spans recorded so far and say where they went, if there were any."""
+    if _shared_writer.flush() and _shared_writer.written:
+        directory = _shared_writer.directory
+        print(f"{_shared_writer.written} trace spans written to {directory}/ "
+              f"(merge them with: python -m utils.trace_report {directory})")
+    if _shared_writer.dropped:
+        print(f"{_shared_writer.dropped} trace spans dropped: the writer fell behind (raise TRACE_QUEUE_SIZE or lower TRACE_SAMPLE)")
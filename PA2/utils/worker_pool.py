@@ -0,0 +1,108 @@
+# worker_pool.py
+"""
+Bounded worker pool for follow-up work (the next lookup or buy after an answer).
+
+A fixed number of worker threads take jobs from a queue of bounded size.
+submit() never blocks: when the queue is full the job is rejected and counted,
+so an overloaded process shows up in stats() instead of growing threads or
+queues without limit.
+"""
+import queue
+import threading
+
+from utils.log import Logger
+
+_STOP = object()
+
+
+class WorkerPool:
+    def __init__(self, workers, queue_size, name='workers'):
+        self.num_workers = workers
+        self.name = name
+        self.log = Logger(name)
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args). Returns False, and counts a rejection, if the queue is full."""
+        try:
+            self.jobs.put_nowait((fn, args))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        depth = self.jobs.qsize()
+        with self.lock:
+            self.submitted += 1
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        return True
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is _STOP:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                self.log.error('job_failed', "Job {job} failed: {error}", job=getattr(fn, '__name__', repr(fn)), error=str(e))
+            with self.lock:
+                self.completed += 1
+
+    def shutdown(self, wait=True):
+        """Stop the workers once the jobs queued so far are done."""
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.jobs.put(_STOP)
+        if wait:
+            for t in threads:
+                t.join()
+
+    def stats(self):
+        """Counters as a dict."""
+        with self.lock:
+            return {
+                'workers': self.num_workers,
+                'queue_depth': self.jobs.qsize(),
+                'queue_size': self.jobs.maxsize,
+                'max_queue_depth': self.max_queue_depth,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool(workers, queue_size):
+    """The process-wide pool every peer submits follow-up work to. The first call sizes it."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = WorkerPool(workers, queue_size, name='follow-up')
+            _shared_pool.start()
+        return _shared_pool